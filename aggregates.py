@@ -0,0 +1,471 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import graph
+
+# Các chiều và chỉ tiêu của khối tổng hợp (cube) theo tháng
+CUBE_KEYS = ["Product", "Month/Year", "Import/Export", "Destination"]
+CUBE_MEASURES = ["count", "Amount", "Quantity", "Weight"]
+SUM_MEASURES = ["Amount", "Quantity", "Weight"]
+
+
+def build_cube(data):
+    # Tổng hợp một lần: số giao dịch và tổng Amount/Quantity/Weight theo từng
+    # (Product, Month/Year, Import/Export, Destination).
+    # sort=False giữ thứ tự xuất hiện đầu tiên để các selectbox hiển thị như trước.
+    # Cột float32 trong store được cộng bằng float64 để tổng không mất độ chính xác.
+    frame = data[CUBE_KEYS].assign(**{m: data[m].astype("float64") for m in SUM_MEASURES})
+    cube = frame.groupby(CUBE_KEYS, observed=True, dropna=False, sort=False).agg(
+        count=("Amount", "size"),
+        Amount=("Amount", "sum"),
+        Quantity=("Quantity", "sum"),
+        Weight=("Weight", "sum"),
+    )
+    return cube.reset_index()
+
+
+def merge_cubes(cubes):
+    # Gộp các cube từng phần (vd. của từng lô dữ liệu) bằng cách cộng các chỉ tiêu theo khoá.
+    # Thứ tự xuất hiện đầu tiên được giữ nguyên; khoá được đưa lại về categorical.
+    cubes = [cube for cube in cubes if cube is not None]
+    cube = pd.concat(cubes, ignore_index=True)
+    for column in CUBE_KEYS:
+        cube[column] = cube[column].astype("object")
+    cube = cube.groupby(CUBE_KEYS, dropna=False, sort=False)[CUBE_MEASURES].sum().reset_index()
+    for column in CUBE_KEYS:
+        cube[column] = cube[column].astype("category")
+    return cube
+
+
+def slice_cube(cube, product=None, direction=None, destination=None):
+    # Lọc cube theo sản phẩm, chiều giao dịch và quốc gia (None = không lọc)
+    mask = pd.Series(True, index=cube.index)
+    for column, value in (("Product", product), ("Import/Export", direction), ("Destination", destination)):
+        if value is not None:
+            mask &= cube[column] == value
+    return cube[mask]
+
+
+def totals_by(cube, column, measure):
+    # Tổng một chỉ tiêu theo một chiều của cube
+    return cube.groupby(column, observed=True)[measure].sum().reset_index()
+
+
+def direction_total(cube, direction, measure):
+    return cube.loc[cube["Import/Export"] == direction, measure].sum()
+
+
+# Khoá của chỉ mục đếm doanh nghiệp khác nhau
+DISTINCT_KEYS = ["Product", "Import/Export", "Month/Year"]
+
+# Bảng tra số bit 1 cho mỗi byte, dùng để đếm phần tử trong bitset
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def company_codes(series):
+    # Mã hoá tên doanh nghiệp thành số nguyên theo dictionary của cột categorical
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    return series.cat.codes.to_numpy(), series.cat.categories
+
+
+def hash_codes(codes):
+    # Băm 64 bit (splitmix64) cho mã doanh nghiệp, dùng cho HyperLogLog
+    x = codes.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class HyperLogLog:
+    # Bộ đếm xấp xỉ số phần tử khác nhau, sai số chuẩn khoảng 1.04 / sqrt(2 ** precision)
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(2 ** precision, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, codes):
+        hashes = hash_codes(np.asarray(codes))
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Dùng 32 bit tiếp theo để tính vị trí bit 1 đầu tiên
+        rest = ((hashes >> np.uint64(32 - self.precision)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def union(self, other):
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class DistinctIndex:
+    # Chỉ mục đếm số Purchaser/Supplier khác nhau theo (Product, Import/Export, Month/Year).
+    # mode="exact": bitset trên mã doanh nghiệp; mode="hll": HyperLogLog.
+    # Có thể cộng thêm dữ liệu theo từng lô bằng add(); mã doanh nghiệp giữ ổn định qua các lô.
+    def __init__(self, data, column, mode="exact", precision=12):
+        self.column = column
+        self.mode = mode
+        self.precision = precision
+        self.companies = []
+        self.lookup = {}
+        # sets[(product, direction)][month] = tập doanh nghiệp của tháng đó
+        self.sets = {}
+        if data is not None:
+            self.add(data)
+
+    def encode(self, series):
+        # Mã doanh nghiệp theo từ điển riêng của chỉ mục, tên mới được thêm vào cuối
+        codes, categories = company_codes(series)
+        ids = np.empty(len(categories) + 1, dtype=np.int64)
+        for i, name in enumerate(categories):
+            if name not in self.lookup:
+                self.lookup[name] = len(self.companies)
+                self.companies.append(name)
+            ids[i] = self.lookup[name]
+        ids[-1] = -1
+        return ids[codes]
+
+    def add(self, data):
+        frame = data[DISTINCT_KEYS].copy()
+        frame["code"] = self.encode(data[self.column])
+        frame = frame.dropna(subset=DISTINCT_KEYS).drop_duplicates()
+        for (product, direction, month), group in frame.groupby(DISTINCT_KEYS, observed=True):
+            group_codes = group["code"].to_numpy()
+            new = self.make_set(group_codes[group_codes >= 0])
+            months = self.sets.setdefault((product, direction), {})
+            months[month] = self.union([months[month], new]) if month in months else new
+        return self
+
+    def make_set(self, codes):
+        if self.mode == "hll":
+            return HyperLogLog(self.precision).add(codes)
+        bits = np.zeros(len(self.companies), dtype=bool)
+        bits[codes] = True
+        return np.packbits(bits)
+
+    def union(self, sets):
+        if self.mode == "hll":
+            result = HyperLogLog(self.precision)
+            for item in sets:
+                result = result.union(item)
+            return result
+        # Bitset tạo ở các lô trước có thể ngắn hơn vì khi đó có ít doanh nghiệp hơn
+        result = np.zeros((len(self.companies) + 7) // 8, dtype=np.uint8)
+        for item in sets:
+            result[:len(item)] |= item
+        return result
+
+    def size(self, item):
+        if self.mode == "hll":
+            return item.count()
+        return int(POPCOUNT[item].sum(dtype=np.int64))
+
+    def monthly(self, product, direction):
+        # Số doanh nghiệp khác nhau theo từng tháng (giống groupby('Month/Year')[column].nunique())
+        months = self.sets.get((product, direction), {})
+        return pd.DataFrame({
+            "Month/Year": sorted(months),
+            self.column: [self.size(months[month]) for month in sorted(months)],
+        })
+
+    def total(self, product, direction):
+        # Tổng số doanh nghiệp khác nhau trên toàn bộ các tháng
+        return self.size(self.union(self.sets.get((product, direction), {}).values()))
+
+
+# Khoá phân vùng của chỉ mục top-K
+TOPK_KEYS = ["Product", "Import/Export"]
+
+
+def top_positions(values, k):
+    # Vị trí của k giá trị lớn nhất, chọn bằng np.partition (O(n)) thay vì sắp xếp cả mảng.
+    # Khi bằng nhau ưu tiên phần tử đứng trước, giống DataFrame.nlargest(keep='first').
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n > k:
+        threshold = np.partition(values, n - k)[n - k]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[:k - len(above)]
+        positions = np.concatenate([above, ties])
+    else:
+        positions = np.arange(n)
+    return positions[np.lexsort((positions, -values[positions]))]
+
+
+def top_k(frame, column, k):
+    # Tương đương frame.nlargest(k, column) nhưng không sắp xếp toàn bộ bảng
+    return frame.iloc[top_positions(frame[column].to_numpy(), k)]
+
+
+class TopKIndex:
+    # Tổng Amount cộng dồn theo thực thể (vd. Purchaser × Destination) cho từng (Product, Import/Export).
+    # add() chỉ giữ tổng của từng lô; finish() gộp mọi lô đang chờ bằng một lần groupby rồi cộng vào tổng cũ
+    # (cộng dồn vào tổng lớn dần sau mỗi lô tốn thời gian tăng nhanh hơn tuyến tính theo số dòng).
+    def __init__(self, by, value="Amount"):
+        self.by = list(by)
+        self.value = value
+        self.totals = {}
+        self.pending = []
+
+    def add(self, data):
+        partial = data.groupby(TOPK_KEYS + self.by, observed=True)[self.value].sum()
+        # Khoá dạng object để cộng dồn được các lô có categories khác nhau
+        partial.index = partial.index.set_levels([level.astype("object") for level in partial.index.levels])
+        self.pending.append(partial)
+        return self
+
+    def finish(self):
+        if not self.pending:
+            return self
+        levels = list(range(len(TOPK_KEYS) + len(self.by)))
+        combined = pd.concat(self.pending).groupby(level=levels, sort=False).sum()
+        self.pending = []
+        for key, group in combined.groupby(level=list(range(len(TOPK_KEYS))), sort=False):
+            group = group.droplevel(list(range(len(TOPK_KEYS))))
+            if key in self.totals:
+                group = self.totals[key].add(group, fill_value=0)
+            self.totals[key] = group
+        return self
+
+    def top(self, product, direction, k=20):
+        totals = self.totals.get((product, direction))
+        if totals is None:
+            return pd.DataFrame(columns=self.by + [self.value])
+        return totals.iloc[top_positions(totals.to_numpy(), k)].reset_index()
+
+
+# Khoá của phân bố đơn giá: theo quốc gia và gộp mọi quốc gia
+PRICE_KEYS = ["Product", "Import/Export", "Destination", "Month/Year"]
+PRICE_OVERALL_KEYS = ["Product", "Import/Export", "Month/Year"]
+# Ngoại lai theo điểm z vững (Iglewicz-Hoaglin): |0.6745 * (giá - trung vị) / MAD| > 3.5.
+# Nhóm có MAD = 0 (quá nửa số giao dịch cùng một giá) dùng độ lệch tuyệt đối trung bình * 1.2533 thay cho MAD / 0.6745.
+# Nhóm ít hơn PRICE_MIN_COUNT giao dịch không đủ để đánh dấu ngoại lai.
+PRICE_Z_THRESHOLD = 3.5
+MAD_SCALE = 0.6745
+MEAN_DEVIATION_SCALE = 1.2533
+PRICE_MIN_COUNT = 5
+PRICE_STATS = ["count", "median", "q1", "q3", "iqr", "mad", "lower", "upper", "outliers"]
+
+
+def group_quantile(values, starts, counts, q):
+    # Phân vị q của từng nhóm trên mảng đã sắp xếp theo (nhóm, giá trị), nội suy tuyến tính như np.quantile
+    position = starts + q * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, starts + counts - 1)
+    return values[low] + (position - low) * (values[high] - values[low])
+
+
+def price_distributions(groups, prices):
+    # Trung vị, IQR, MAD, ngưỡng và số ngoại lai của mọi nhóm trong một lượt numpy: sắp xếp một lần theo
+    # (nhóm, giá), phân vị lấy theo vị trí trong từng đoạn, không lặp Python theo nhóm
+    if len(groups) == 0:
+        return pd.DataFrame(columns=PRICE_STATS, dtype="float64")
+    order = np.lexsort((prices, groups))
+    groups, prices = groups[order], prices[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(groups)])
+    median = group_quantile(prices, starts, counts, 0.5)
+    q1 = group_quantile(prices, starts, counts, 0.25)
+    q3 = group_quantile(prices, starts, counts, 0.75)
+    # Độ lệch khỏi trung vị của nhóm, sắp xếp lại trong từng nhóm để lấy trung vị của nó (MAD)
+    row_group = np.repeat(np.arange(len(starts)), counts)
+    deviation = np.abs(prices - median[row_group])
+    mad = group_quantile(deviation[np.lexsort((deviation, row_group))], starts, counts, 0.5)
+    mean_deviation = np.bincount(row_group, weights=deviation) / counts
+    scale = np.where(mad > 0, mad / MAD_SCALE, MEAN_DEVIATION_SCALE * mean_deviation)
+    enough = counts >= PRICE_MIN_COUNT
+    outlier = enough[row_group] & (deviation > PRICE_Z_THRESHOLD * scale[row_group])
+    return pd.DataFrame({
+        "count": counts,
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "mad": mad,
+        "lower": np.where(enough, median - PRICE_Z_THRESHOLD * scale, np.nan),
+        "upper": np.where(enough, median + PRICE_Z_THRESHOLD * scale, np.nan),
+        "outliers": np.bincount(row_group, weights=outlier, minlength=len(starts)).astype(np.int64),
+    }, index=groups[starts])
+
+
+class PriceIndex:
+    # Đơn giá từng giao dịch (Amount / Quantity hoặc Amount / Weight) và phân bố của nó theo
+    # (Product, Import/Export, Destination, Month/Year) và theo (Product, Import/Export, Month/Year).
+    # add() chỉ giữ mã nhóm và đơn giá của các dòng có giá (16 byte/dòng); finish() tính lại thống kê
+    # của các nhóm mà các lô mới chạm tới, nên append một tháng không tính lại các tháng cũ.
+    # Hai mảng theo từng dòng không nằm trong pickle (dashboard chỉ cần thống kê theo nhóm): store ghi chúng
+    # thành tệp .npy riêng bằng save_rows() và chỉ append mở lại bằng load_rows().
+    def __init__(self, basis):
+        self.basis = basis
+        self.keys = []
+        self.lookup = {}
+        # Nhóm gộp mọi quốc gia: khoá, mã, và mã gộp của từng nhóm theo quốc gia
+        self.overall_keys = []
+        self.overall_lookup = {}
+        self.overall_of = []
+        self.groups = np.empty(0, dtype=np.int64)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.pending = []
+        self.dirty = set()
+        self.stats = None
+        self.overall = None
+
+    def encode(self, keys):
+        # Mã nhóm cho từng dòng; nhóm mới được thêm vào cuối (chỉ lặp Python trên các nhóm khác nhau của lô)
+        codes, unique = pd.MultiIndex.from_frame(keys).factorize()
+        ids = np.empty(len(unique), dtype=np.int64)
+        for code, key in enumerate(unique):
+            if key not in self.lookup:
+                self.lookup[key] = len(self.keys)
+                self.keys.append(key)
+                overall = (key[0], key[1], key[3])
+                if overall not in self.overall_lookup:
+                    self.overall_lookup[overall] = len(self.overall_keys)
+                    self.overall_keys.append(overall)
+                self.overall_of.append(self.overall_lookup[overall])
+            ids[code] = self.lookup[key]
+        return ids[codes]
+
+    def add(self, data):
+        amount = data["Amount"].to_numpy(dtype=np.float64, na_value=np.nan)
+        basis = data[self.basis].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price = amount / basis
+        valid = (amount > 0) & (basis > 0) & np.isfinite(price)
+        valid &= data[PRICE_KEYS].notna().all(axis=1).to_numpy()
+        if not valid.any():
+            return self
+        groups = self.encode(data.loc[valid, PRICE_KEYS].astype("object"))
+        self.pending.append((groups, price[valid]))
+        self.dirty.update(np.unique(groups).tolist())
+        return self
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["groups"] = state["prices"] = None
+        return state
+
+    def rows_path(self, path):
+        return os.path.join(path, f"prices-{self.basis}.npz")
+
+    def save_rows(self, path):
+        np.savez(self.rows_path(path), groups=self.groups, prices=self.prices)
+
+    def load_rows(self, path):
+        with np.load(self.rows_path(path)) as rows:
+            self.groups, self.prices = rows["groups"], rows["prices"]
+        return self
+
+    def finish(self):
+        # Gộp các lô đang chờ và tính lại thống kê của các nhóm bị chạm tới
+        if not self.pending:
+            return self
+        if self.groups is None:
+            raise ValueError(f"Chưa mở đơn giá từng dòng theo {self.basis} (store.read_aggregates(rows=True))")
+        self.groups = np.concatenate([self.groups] + [groups for groups, _ in self.pending])
+        self.prices = np.concatenate([self.prices] + [prices for _, prices in self.pending])
+        self.pending = []
+        overall_of = np.asarray(self.overall_of, dtype=np.int64)
+        dirty = np.zeros(len(self.keys), dtype=bool)
+        dirty[list(self.dirty)] = True
+        overall_dirty = np.zeros(len(self.overall_keys), dtype=bool)
+        overall_dirty[overall_of[dirty]] = True
+        self.dirty = set()
+
+        rows = dirty[self.groups]
+        self.stats = self.merge(self.stats, price_distributions(self.groups[rows], self.prices[rows]), self.keys, PRICE_KEYS)
+        overall_groups = overall_of[self.groups]
+        rows = overall_dirty[overall_groups]
+        self.overall = self.merge(
+            self.overall, price_distributions(overall_groups[rows], self.prices[rows]), self.overall_keys, PRICE_OVERALL_KEYS,
+        )
+        return self
+
+    def merge(self, old, new, keys, columns):
+        # Thay các nhóm vừa tính trong bảng thống kê cũ; bảng có các cột khoá để lọc theo sản phẩm/quốc gia
+        new = pd.concat([pd.DataFrame([keys[i] for i in new.index], columns=columns, index=new.index), new], axis=1)
+        if old is not None:
+            new = pd.concat([old.drop(index=new.index, errors="ignore"), new]).sort_index()
+        return new
+
+    def table(self, product, direction, destination=None):
+        # Thống kê theo tháng của một sản phẩm/chiều giao dịch cho một quốc gia (None = gộp mọi quốc gia)
+        stats = self.overall if destination is None else self.stats
+        if stats is None:
+            return pd.DataFrame(columns=["Month/Year"] + PRICE_STATS)
+        mask = (stats["Product"] == product) & (stats["Import/Export"] == direction)
+        if destination is not None:
+            mask &= stats["Destination"] == destination
+        return stats.loc[mask, ["Month/Year"] + PRICE_STATS].sort_values("Month/Year").reset_index(drop=True)
+
+
+# Các tổng hợp mà dashboard dùng, được tính khi ingest và lưu cùng store
+TOPK_VIEWS = [
+    ("Purchaser", "Destination"),
+    ("Supplier", "Destination"),
+    ("Supplier", "Supplier_code"),
+    ("Purchaser", "Purchaser_code"),
+]
+DISTINCT_COLUMNS = ["Purchaser", "Supplier"]
+# Đơn giá tính theo số lượng và theo khối lượng
+PRICE_BASES = ["Quantity", "Weight"]
+
+
+class TradeAggregates:
+    # Cube, các chỉ mục top-K, chỉ mục đếm doanh nghiệp khác nhau, đơn giá và đồ thị giao dịch, cộng dồn theo từng lô;
+    # tổng top-K, thống kê đơn giá và ma trận kề của đồ thị được gộp trong finish() sau lô cuối
+    # (store.write_aggregates gọi trước khi ghi). Đơn giá từng dòng được ghi riêng (save_rows/load_rows).
+    # companies (entity_resolution.CompanyResolution, tuỳ chọn): mỗi lô được đổi sang tên doanh nghiệp chuẩn
+    # và mã số thuế đã điền trước khi cộng, để các biến thể tên của một doanh nghiệp chỉ được tính một lần.
+    def __init__(self, companies=None):
+        self.cube = None
+        self.topk = {by: TopKIndex(by) for by in TOPK_VIEWS}
+        self.distinct = {column: DistinctIndex(None, column) for column in DISTINCT_COLUMNS}
+        self.prices = {basis: PriceIndex(basis) for basis in PRICE_BASES}
+        self.graph = graph.TradeGraph()
+        self.rows = 0
+        self.companies = companies
+
+    def add(self, data):
+        if self.companies is not None:
+            data = self.companies.apply(data)
+        self.cube = merge_cubes([self.cube, build_cube(data)])
+        for index in self.topk.values():
+            index.add(data)
+        for index in self.distinct.values():
+            index.add(data)
+        for index in self.prices.values():
+            index.add(data)
+        self.graph.add(data)
+        self.rows += len(data)
+        return self
+
+    def finish(self):
+        for index in self.topk.values():
+            index.finish()
+        for index in self.prices.values():
+            index.finish()
+        self.graph.finish()
+        return self
+
+    def save_rows(self, path):
+        for index in self.prices.values():
+            index.save_rows(path)
+        return self
+
+    def load_rows(self, path):
+        for index in self.prices.values():
+            index.load_rows(path)
+        return self
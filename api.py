@@ -0,0 +1,282 @@
+import argparse
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import graph
+import query
+import store
+import telemetry
+
+# API HTTP/JSON cục bộ cho bộ máy truy vấn (query.py), không cần Streamlit hay trình duyệt.
+#   GET  /health
+#   GET  /products
+#   GET  /query?name=monthly&product=Xoài sấy&measure=Amount
+#   GET  /compare?products=Xoài sấy&products=Mít sấy&measure=Amount&direction=Export&role=Purchaser&k=10
+#   POST /batch  {"products": [...] hoặc null (mọi sản phẩm),
+#                 "queries": {"khoá kết quả": {"name": "top_companies", "direction": "Export", ...}}}
+#   GET  /metrics[?format=prometheus]   số liệu telemetry của tiến trình API (xem telemetry.py)
+#   GET  /metrics/flamegraph?seconds=10 lấy mẫu ngăn xếp trong khoảng thời gian, trả về dạng folded
+# Danh sách truy vấn và tham số mặc định: query.QUERIES.
+
+
+class DatasetHolder:
+    # Một Dataset dùng chung cho mọi luồng; tự mở lại khi phiên bản dữ liệu trong store thay đổi (vd. sau append)
+    def __init__(self, store_dir=store.STORE_DIR):
+        self.store_dir = store_dir
+        self.dataset = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = store.data_version(self.store_dir)
+        with self.lock:
+            if self.dataset is None or self.dataset.version != version:
+                self.dataset = query.open_dataset(self.store_dir)
+            return self.dataset
+
+
+def to_json_value(value):
+    # Đổi kết quả truy vấn (DataFrame, Series, số numpy) sang kiểu JSON; NaN/inf thành null.
+    # DataFrame có cột nhiều tầng (vd. bảng tài chính (chỉ tiêu, Năm)) được lồng thành dict theo từng tầng.
+    if isinstance(value, pd.DataFrame):
+        # Chỉ giữ chỉ mục có tên (vd. Tên DN); chỉ mục vị trí dòng bị bỏ
+        value = value.reset_index(drop=value.index.names == [None])
+        if isinstance(value.columns, pd.MultiIndex):
+            records = []
+            for _, row in value.iterrows():
+                record = {}
+                for key, cell in row.items():
+                    levels = [str(level) for level in key if level != ""]
+                    target = record
+                    for level in levels[:-1]:
+                        target = target.setdefault(level, {})
+                    target[levels[-1]] = cell
+                records.append(record)
+            return to_json_value(records)
+        return to_json_value(value.to_dict(orient="records"))
+    if isinstance(value, pd.Series):
+        return to_json_value(value.to_dict())
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+# Tham số số nguyên của các truy vấn, kể cả khi mặc định là None (vd. k của network_companies: không giới hạn)
+# nên không suy ra được kiểu từ giá trị mặc định; các tham số còn lại là chuỗi
+INT_PARAMS = ("k", "window")
+PARAM_TYPES = {
+    name: {key: int for key in defaults if key in INT_PARAMS}
+    for name, (_, defaults) in query.QUERIES.items()
+}
+# /compare không phải truy vấn có tên nhưng nhận cùng kiểu tham số
+PARAM_TYPES["compare"] = {"k": int}
+# Các giá trị cho phép của tham số dạng lựa chọn; giá trị khác là lỗi của yêu cầu (400),
+# không để KeyError bên trong truy vấn trả về 404 như khi thiếu sản phẩm
+PARAM_CHOICES = {
+    "direction": query.DIRECTIONS,
+    "role": query.ROLES,
+    "measure": aggregates.CUBE_MEASURES,
+    "basis": aggregates.PRICE_BASES,
+}
+# Các cặp (role, by/target) có chỉ mục tính sẵn
+PAIR_CHOICES = {
+    "top_companies": ("by", aggregates.TOPK_VIEWS),
+    "concentration": ("by", graph.RELATIONS),
+    "counterparts": ("target", graph.RELATIONS),
+}
+
+
+def coerce_params(name, params):
+    # Tham số trên URL là chuỗi; ép về kiểu khai báo trong PARAM_TYPES (vd. k là số nguyên)
+    # và kiểm tra các tham số dạng lựa chọn theo PARAM_CHOICES/PAIR_CHOICES
+    types = PARAM_TYPES.get(name, {})
+    result = {}
+    for key, value in params.items():
+        if key in types and isinstance(value, str):
+            try:
+                value = types[key](value)
+            except ValueError:
+                raise ValueError(f"Tham số {key} của {name} phải là số nguyên: {value!r}") from None
+        if key in PARAM_CHOICES and value is not None and value not in PARAM_CHOICES[key]:
+            raise ValueError(f"Tham số {key} của {name} phải là một trong {', '.join(PARAM_CHOICES[key])}: {value!r}")
+        result[key] = value
+    if name in PAIR_CHOICES:
+        key, pairs = PAIR_CHOICES[name]
+        _, defaults = query.QUERIES[name]
+        role, value = result.get("role", defaults["role"]), result.get(key, defaults[key])
+        if value is not None and (role, value) not in pairs:
+            choices = ", ".join(target for source, target in pairs if source == role)
+            raise ValueError(f"Tham số {key} của {name} với role={role} phải là một trong {choices}: {value!r}")
+    return result
+
+
+def check_products(dataset, product_list):
+    # Sản phẩm không có trong dữ liệu là tài nguyên không tồn tại (404)
+    known = set(query.products(dataset))
+    for product in product_list:
+        if product not in known:
+            raise KeyError(f"Không có sản phẩm {product}")
+    return product_list
+
+
+def batch_error(body):
+    # Kiểm tra cấu trúc nội dung của /batch; trả về thông báo lỗi hoặc None nếu hợp lệ
+    if not isinstance(body, dict):
+        return "Nội dung phải là một đối tượng JSON"
+    products = body.get("products")
+    if products is not None and not (isinstance(products, list) and all(isinstance(item, str) for item in products)):
+        return "products phải là danh sách tên sản phẩm hoặc null"
+    queries = body.get("queries", {})
+    if not isinstance(queries, dict):
+        return "queries phải là một đối tượng {khoá kết quả: truy vấn}"
+    for key, spec in queries.items():
+        if not isinstance(spec, dict):
+            return f"Truy vấn {key} phải là một đối tượng JSON"
+    return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query_values = parse_qs(url.query)
+        params = {key: values[-1] for key, values in query_values.items()}
+        if url.path == "/metrics":
+            if params.get("format") == "prometheus":
+                return self.send_text(telemetry.registry.prometheus())
+            return self.send_json(to_json_value(telemetry.registry.snapshot()))
+        if url.path == "/metrics/flamegraph":
+            try:
+                seconds = float(params.get("seconds", 10))
+            except ValueError:
+                seconds = math.nan
+            if math.isnan(seconds) or seconds < 0:
+                return self.send_json({"error": "Tham số seconds phải là số không âm"}, 400)
+            return self.send_flamegraph(seconds)
+        dataset = self.server.holder.get()
+        if url.path == "/health":
+            return self.send_json({"status": "ok", "version": dataset.version})
+        if url.path == "/products":
+            return self.send_json({"version": dataset.version, "products": query.products(dataset)})
+        if url.path == "/query":
+            name = params.pop("name", None)
+            product = params.pop("product", None)
+            if name is None or product is None:
+                return self.send_json({"error": "Cần tham số name và product"}, 400)
+            if name not in query.QUERIES:
+                return self.send_json({"error": f"Không có truy vấn {name}"}, 404)
+
+            def compute():
+                check_products(dataset, [product])
+                return query.view(dataset, name, product, **coerce_params(name, params))
+
+            return self.run_query(compute, dataset)
+        if url.path == "/compare":
+            product_list = query_values.get("products") or query.products(dataset)
+            params.pop("products", None)
+
+            def compute():
+                check_products(dataset, product_list)
+                return query.compare(dataset, product_list, **coerce_params("compare", params))
+
+            return self.run_query(compute, dataset)
+        return self.send_json({"error": f"Không có đường dẫn {url.path}"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/batch":
+            return self.send_json({"error": f"Không có đường dẫn {url.path}"}, 404)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.send_json({"error": "Nội dung không phải JSON hợp lệ"}, 400)
+        error = batch_error(body)
+        if error:
+            return self.send_json({"error": error}, 400)
+        dataset = self.server.holder.get()
+
+        def compute():
+            queries = {
+                key: {"name": spec.get("name", key), **coerce_params(spec.get("name", key), spec)}
+                for key, spec in body.get("queries", {}).items()
+            }
+            if body.get("products") is not None:
+                check_products(dataset, body["products"])
+            return query.batch(dataset, body.get("products"), queries)
+
+        return self.run_query(compute, dataset)
+
+    def run_query(self, compute, dataset):
+        try:
+            with telemetry.section(f"api {urlparse(self.path).path}"):
+                result = compute()
+        except KeyError as error:
+            return self.send_json({"error": str(error.args[0] if error.args else error)}, 404)
+        except (TypeError, ValueError) as error:
+            return self.send_json({"error": str(error)}, 400)
+        return self.send_json({"version": dataset.version, "result": to_json_value(result)})
+
+    def send_flamegraph(self, seconds):
+        # Lấy mẫu trong seconds giây (nếu chưa bật sẵn bằng TELEMETRY_SAMPLE=1) rồi trả về ngăn xếp dạng folded
+        sampler = telemetry.sampler
+        if sampler.active:
+            return self.send_text(sampler.folded())
+        sampler.reset()
+        sampler.start()
+        try:
+            time.sleep(min(seconds, 60))
+        finally:
+            sampler.stop()
+        return self.send_text(sampler.folded())
+
+    def send_text(self, text, status=200):
+        self.send_body(text.encode("utf-8"), "text/plain; charset=utf-8", status)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8", status)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host="127.0.0.1", port=8502, store_dir=store.STORE_DIR):
+    # Mỗi yêu cầu chạy trên một luồng riêng; các luồng đọc chung một Dataset chỉ đọc
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.holder = DatasetHolder(store_dir)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API JSON cho các số liệu của dashboard")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--store", default=store.STORE_DIR, help="Thư mục store")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.store)
+    print(f"Đang phục vụ tại http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,508 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import figures
+import query
+import search
+import store
+import tctk
+import transactions
+
+# Bộ đo hiệu năng trên dữ liệu tổng hợp (synthetic) cùng schema và phân phối với TradeData_DriedMango_processed.csv:
+# doanh nghiệp theo phân phối Zipf, tỷ lệ quốc gia/nguồn dữ liệu/chiều giao dịch và mùa vụ theo tháng lấy từ tệp thật,
+# kèm bảng TCTK khớp mã số thuế. Mỗi kích thước (10^3..10^8 dòng) được sinh ra thành tệp CSV theo từng lô,
+# ingest vào một store tạm, rồi đo từng bước mà dashboard chạy. Kết quả là báo cáo JSON, so với ngưỡng trong
+# bench_thresholds.json để bắt hồi quy hiệu năng.
+#   python bench.py --rows 1e3 1e4 1e5 [--repeat 3] [--output report.json]
+#   python bench.py --rows 1e3 1e4 --write-thresholds 3   (đặt ngưỡng = 3 lần thời gian đo được trên máy này)
+# Báo cáo kèm dung lượng tổng hợp (pickle và mảng memory-map); ngưỡng dung lượng cũng được kiểm tra.
+
+PROFILE_SOURCE = os.path.join(store.BASE_DIR, "TradeData_DriedMango_processed.csv")
+THRESHOLDS_PATH = os.path.join(store.BASE_DIR, "bench_thresholds.json")
+
+# Số mũ của phân phối Zipf cho số giao dịch của doanh nghiệp (doanh nghiệp hạng r có tỷ lệ ~ 1 / r^s)
+ZIPF_EXPONENT = 1.1
+# Số doanh nghiệp tăng chậm hơn số dòng: scale * rows^0.8 (1055 dòng thật có 426 nhà nhập khẩu, 150 nhà xuất khẩu)
+PURCHASER_SCALE = 1.6
+SUPPLIER_SCALE = 0.6
+# Số mô tả hàng khác nhau: rows^0.9 (dữ liệu thật gần như mỗi dòng một mô tả)
+DESCRIPTION_EXPONENT = 0.9
+# Tệp CSV chỉ có Xoài sấy; các sản phẩm khác của dashboard được thêm vào, mỗi sản phẩm chiếm PRODUCT_SHARE số dòng
+OTHER_PRODUCTS = ["Mít sấy", "Dừa sấy", "Điều vàng", "Điều lụa", "Macadamia", "Ngô cay", "Bánh dừa nướng"]
+PRODUCT_SHARE = 0.03
+# Khoảng thời gian sinh dữ liệu và mức tăng trưởng tuyến tính trên cả khoảng
+FIRST_MONTH = "2023-01"
+MONTHS = 24
+TREND = 0.5
+# Số nhà xuất khẩu có trong bảng TCTK (các doanh nghiệp lớn nhất) và các năm báo cáo
+TCTK_SHARE = 0.05
+TCTK_YEARS = [2021, 2022]
+# Dung lượng tổng hợp không phụ thuộc máy đo (cùng rows và seed cho cùng dữ liệu) nên ngưỡng chỉ nới 25%,
+# đủ để bắt lại trường hợp pickle mà mọi tiến trình nạp vào bộ nhớ lớn dần theo số dòng
+SIZE_TOLERANCE = 1.25
+
+SYLLABLES = [
+    "An", "Bình", "Cường", "Dũng", "Đức", "Gia", "Hà", "Hải", "Hoàng", "Hùng", "Khánh", "Long", "Minh", "Nam",
+    "Ngọc", "Nhật", "Phát", "Phú", "Phúc", "Quang", "Sơn", "Tâm", "Tân", "Thành", "Thịnh", "Thuận", "Tiến",
+    "Toàn", "Trung", "Trường", "Tuấn", "Việt", "Vinh", "Xuân", "Hưng", "Lộc", "Kim", "Đông", "Hòa", "Mỹ",
+]
+LEGAL_FORMS = ["Công Ty Tnhh", "Công Ty Cổ Phần", "Công Ty Tnhh Mtv", "Doanh Nghiệp Tư Nhân"]
+FOREIGN_WORDS = [
+    "Global", "Foods", "Trading", "Fresh", "Asia", "Pacific", "Golden", "Star", "Green", "Harvest", "Market",
+    "United", "Royal", "Sun", "Ocean", "Tropical", "Natural", "Best", "Nova", "Prime", "Alpha", "Euro", "Orient",
+    "Silk", "Lotus", "Delta", "Baltic", "Nordic", "Grand", "Union", "Happy", "Zen", "Ruby", "Bamboo", "Coral",
+    "Summit", "Atlas", "Vega", "Apex", "Liberty",
+]
+FOREIGN_FORMS = ["Inc", "Ltd", "LLC", "Co., Ltd", "GmbH", "JSC", "Pte Ltd", "OOO"]
+
+
+def shares(series):
+    # Các giá trị và tỷ lệ xuất hiện của chúng (bỏ giá trị thiếu)
+    counts = series.value_counts()
+    return counts.index.to_numpy(), (counts / counts.sum()).to_numpy()
+
+
+def log_moments(series):
+    # Trung bình và độ lệch chuẩn của log các giá trị dương (tham số phân phối log-normal), kèm giá trị lớn nhất
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    values = values[values > 0]
+    return float(np.log(values).mean()), float(np.log(values).std()), float(values.max())
+
+
+def load_profile(path=PROFILE_SOURCE):
+    # Các phân phối của dữ liệu thật mà bộ sinh dữ liệu tái tạo
+    data = pd.read_csv(path, index_col=0)
+    months = pd.PeriodIndex(data["Month/Year"], freq="M").month
+    season = np.bincount(months, minlength=13)[1:].astype(float)
+    # Tháng không có trong dữ liệu thật lấy mức trung bình
+    season[season == 0] = season[season > 0].mean()
+    products, product_shares = shares(data["Product"])
+    others = [product for product in OTHER_PRODUCTS if product not in set(products)]
+    products = np.append(products, others)
+    product_shares = np.append(product_shares * (1 - PRODUCT_SHARE * len(others)), [PRODUCT_SHARE] * len(others))
+    words = pd.Series([word for text in data["Product Description"].dropna() for word in str(text).split()])
+    return {
+        "directions": shares(data["Import/Export"]),
+        "sources": {direction: shares(group["Data Source"]) for direction, group in data.groupby("Import/Export")},
+        "destinations": {direction: shares(group["Destination"]) for direction, group in data.groupby("Import/Export")},
+        "products": (products, product_shares),
+        "hs_codes": shares(data["HS Code"]),
+        "season": season / season.mean(),
+        "missing": data[["HS Code", "Weight", "Quantity", "Amount"]].isna().mean().to_dict(),
+        "measures": {column: log_moments(data[column]) for column in ["Weight", "Quantity", "Amount"]},
+        "words": words.value_counts().index[:500].to_numpy(),
+    }
+
+
+def zipf_cdf(size, exponent=ZIPF_EXPONENT):
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return np.cumsum(weights) / weights.sum()
+
+
+def mixed_names(count, words, forms, prefix_form):
+    # count tên khác nhau ghép 3 từ trong words và một loại hình theo các chữ số của chỉ số;
+    # khi vượt số tổ hợp, tên có thêm số chi nhánh. Chỉ số được xáo trộn để tên ở hạng đầu không có dạng đặc biệt.
+    base = len(words)
+    capacity = base ** 3 * len(forms)
+    index = np.arange(count)
+    index = (index // capacity) * capacity + (index % capacity * 7919 + 13) % capacity
+    parts = [np.asarray(words)[(index // base ** level) % base] for level in range(3)]
+    levels = np.asarray(forms)[(index // base ** 3) % len(forms)]
+    branches = [f" {branch + 1}" if branch else "" for branch in index // capacity]
+    if prefix_form:
+        return [f"{form} {a} {b} {c}{branch}" for form, a, b, c, branch in zip(levels, *parts, branches)]
+    return [f"{a} {b} {c} {form}{branch}" for form, a, b, c, branch in zip(levels, *parts, branches)]
+
+
+class TradeGenerator:
+    # Sinh bảng giao dịch theo từng lô (bộ nhớ tỉ lệ với lô, không với tổng số dòng) và bảng TCTK tương ứng.
+    # Cùng rows và seed cho cùng dữ liệu.
+    def __init__(self, rows, seed=0, profile=None):
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self.profile = profile or load_profile()
+        purchasers = max(10, int(PURCHASER_SCALE * rows ** 0.8))
+        suppliers = max(10, int(SUPPLIER_SCALE * rows ** 0.8))
+        self.purchasers = np.array(mixed_names(purchasers, FOREIGN_WORDS, FOREIGN_FORMS, prefix_form=False), dtype=object)
+        self.suppliers = np.array(mixed_names(suppliers, SYLLABLES, LEGAL_FORMS, prefix_form=True), dtype=object)
+        self.supplier_codes = np.array([f"{300000000 + 7919 * i:010d}" for i in range(suppliers)], dtype=object)
+        self.purchaser_cdf = zipf_cdf(purchasers)
+        self.supplier_cdf = zipf_cdf(suppliers)
+
+        # Mỗi sản phẩm có một nhóm mô tả riêng; mô tả ở đầu nhóm xuất hiện nhiều hơn
+        products, product_shares = self.profile["products"]
+        total = max(len(products), int(rows ** DESCRIPTION_EXPONENT))
+        sizes = np.maximum(1, (product_shares * total).astype(int))
+        self.description_offsets = np.append(0, np.cumsum(sizes))[:-1]
+        self.description_sizes = sizes
+        words = self.profile["words"]
+        descriptions = []
+        for product, size in zip(products, sizes):
+            label = search.normalize(product).upper()
+            picks = self.rng.integers(0, len(words), size=(size, 4))
+            packs = self.rng.integers(1, 100, size=size) * 50
+            descriptions += [f"{label} {' '.join(words[pick])} {pack}G" for pick, pack in zip(picks, packs)]
+        self.descriptions = np.array(descriptions, dtype=object)
+
+        months = pd.period_range(FIRST_MONTH, periods=MONTHS, freq="M")
+        weights = self.profile["season"][months.month - 1] * (1 + TREND * np.arange(MONTHS) / MONTHS)
+        self.months = months
+        self.month_cdf = np.cumsum(weights) / weights.sum()
+
+    def choose(self, values, probabilities, size):
+        return values[np.searchsorted(np.cumsum(probabilities), self.rng.random(size) * probabilities.sum())]
+
+    def measure(self, column, size):
+        mean, std, largest = self.profile["measures"][column]
+        values = np.round(self.rng.lognormal(mean, std, size).clip(max=largest), 2)
+        values[self.rng.random(size) < self.profile["missing"][column]] = np.nan
+        return values
+
+    def chunk(self, size):
+        rng = self.rng
+        directions = self.choose(*self.profile["directions"], size)
+        sources = np.empty(size, dtype=object)
+        destinations = np.empty(size, dtype=object)
+        for direction in np.unique(directions):
+            mask = directions == direction
+            sources[mask] = self.choose(*self.profile["sources"][direction], mask.sum())
+            destinations[mask] = self.choose(*self.profile["destinations"][direction], mask.sum())
+
+        products, product_shares = self.profile["products"]
+        product_codes = np.searchsorted(np.cumsum(product_shares), rng.random(size) * product_shares.sum())
+        skew = rng.random(size) ** 2
+        description_codes = self.description_offsets[product_codes] + (skew * self.description_sizes[product_codes]).astype(int)
+        purchasers = np.searchsorted(self.purchaser_cdf, rng.random(size))
+        suppliers = np.searchsorted(self.supplier_cdf, rng.random(size))
+
+        months = self.months[np.searchsorted(self.month_cdf, rng.random(size))]
+        dates = months.start_time + pd.to_timedelta((rng.random(size) * months.days_in_month).astype(int), unit="D")
+        hs_codes = self.choose(*self.profile["hs_codes"], size).astype(float)
+        hs_codes[rng.random(size) < self.profile["missing"]["HS Code"]] = np.nan
+
+        purchaser_names = self.purchasers[purchasers]
+        supplier_names = self.suppliers[suppliers]
+        return pd.DataFrame({
+            "Data Source": sources,
+            "Import/Export": directions,
+            "Date": dates,
+            "HS Code_raw": hs_codes,
+            "HS Code": hs_codes,
+            "Product Description": self.descriptions[description_codes],
+            "Purchaser_raw": pd.Series(purchaser_names).str.upper().to_numpy(),
+            "Supplier_raw": [search.normalize(name).title() for name in supplier_names],
+            "Purchaser": purchaser_names,
+            "Supplier": supplier_names,
+            "Purchaser_code": store.MISSING_TAX_CODE,
+            "Supplier_code": self.supplier_codes[suppliers],
+            "Weight": self.measure("Weight", size),
+            "Quantity": self.measure("Quantity", size),
+            "Amount": self.measure("Amount", size),
+            "Destination": destinations,
+            "Origin": "Vietnam",
+            "Product": products[product_codes],
+            "Month/Year": months.strftime("%Y-%m"),
+        })
+
+    def iter_chunks(self, chunk_rows=store.CHUNK_ROWS):
+        for start in range(0, self.rows, chunk_rows):
+            frame = self.chunk(min(chunk_rows, self.rows - start))
+            frame.index = pd.RangeIndex(start, start + len(frame))
+            yield frame
+
+    def tctk(self):
+        # Bảng doanh nghiệp TCTK cho các nhà xuất khẩu lớn nhất (theo hạng Zipf), mỗi năm một dòng
+        count = max(1, int(len(self.suppliers) * TCTK_SHARE))
+        rng = self.rng
+        frames = []
+        for year in TCTK_YEARS:
+            revenue = rng.lognormal(11, 1.2, count)
+            frames.append(pd.DataFrame({
+                "Công ty": self.suppliers[:count],
+                "Mã số thuế": self.supplier_codes[:count],
+                "Tên DN": [name.upper() for name in self.suppliers[:count]],
+                "Mã số DN": self.supplier_codes[:count],
+                "Doanh thu (triệu đồng)": revenue,
+                "Lợi nhuận (triệu đồng)": revenue * rng.normal(0.02, 0.03, count),
+                "Số lao động (người)": rng.integers(5, 2000, count),
+                "Thị phần (%)": 100 * revenue / revenue.sum(),
+                "Cấp 5": rng.choice([10309, 10730, 46326], count),
+                "Năm": year,
+                "Top": np.arange(1, count + 1),
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+    def write_sources(self, directory, chunk_rows=store.CHUNK_ROWS):
+        # Ghi tệp nguồn CSV (cột chỉ số đầu tiên như tệp thật) theo từng lô; trả về {tên bảng: đường dẫn}
+        paths = {"trade": os.path.join(directory, "trade.csv"), "tctk": os.path.join(directory, "tctk.csv")}
+        for i, frame in enumerate(self.iter_chunks(chunk_rows)):
+            frame.to_csv(paths["trade"], mode="w" if i == 0 else "a", header=i == 0)
+        self.tctk().to_csv(paths["tctk"])
+        return paths
+
+
+def timed(stages, stage, function, repeat=1):
+    # Đo function() repeat lần; báo cáo lần nhanh nhất (ít nhiễu nhất) và trung vị
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    stages[stage] = {"seconds": min(times), "median": statistics.median(times), "repeat": repeat}
+    return result
+
+
+def aggregate_sizes(store_dir):
+    # Dung lượng (MB) tổng hợp của phiên bản hiện tại: phần pickle mỗi tiến trình nạp vào bộ nhớ riêng
+    # và các mảng .npy được mở bằng memory-map (dùng chung giữa các tiến trình)
+    version = store.data_version(store_dir)
+    arrays = os.path.join(store.aggregates_dir(version, store_dir), "arrays")
+    return {
+        "aggregates_pickle_mb": os.path.getsize(store.aggregates_path(version, store_dir)) / 2 ** 20,
+        "aggregates_arrays_mb": sum(os.path.getsize(os.path.join(arrays, name)) for name in os.listdir(arrays)) / 2 ** 20,
+    }
+
+
+def ingest_breakdown(stages, source, chunk_rows):
+    # Tách thời gian của ingest thành đọc tệp nguồn, chuẩn hoá (ép kiểu, categorical, mã số thuế) và cộng dồn tổng hợp
+    _, category_columns = store.TABLES["trade"]
+    totals = {"load": 0.0, "normalize": 0.0, "aggregate": 0.0}
+    trade_aggregates = aggregates.TradeAggregates()
+    chunks = store.iter_source(source, chunk_rows)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        totals["load"] += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        chunk = store.to_columnar(store.coerce_types(chunk, store.COLUMN_TYPES["trade"]), category_columns)
+        chunk, _ = store.normalize_table_codes(chunk, store.TAX_CODE_COLUMNS["trade"])
+        totals["normalize"] += time.perf_counter() - start
+        start = time.perf_counter()
+        trade_aggregates.add(chunk)
+        totals["aggregate"] += time.perf_counter() - start
+    # Thống kê đơn giá được tính một lần sau lô cuối
+    start = time.perf_counter()
+    trade_aggregates.finish()
+    totals["aggregate"] += time.perf_counter() - start
+    for stage, seconds in totals.items():
+        stages[stage] = {"seconds": seconds, "median": seconds, "repeat": 1}
+
+
+def section_market(dataset, product):
+    return [query.run(dataset, "monthly", product, measure=measure) for measure in ("count", "Amount")] + [
+        query.run(dataset, "direction_total", product, direction=direction, measure=measure)
+        for direction in query.DIRECTIONS for measure in ("count", "Amount")
+    ]
+
+
+def section_countries(dataset, product):
+    results = [query.run(dataset, "country_totals", product, direction="Export")]
+    results.append(query.run(dataset, "destination_growth", product, direction="Export"))
+    country = results[0]["Destination"].iloc[0] if len(results[0]) else None
+    results.append(query.run(dataset, "monthly", product, measure="Amount", destination=country))
+    return results
+
+
+def section_companies(dataset, product):
+    return [
+        query.run(dataset, name, product, direction=direction, role=role)
+        for name in ("counterpart_total", "counterpart_monthly", "company_growth")
+        for direction in query.DIRECTIONS for role in query.ROLES
+    ]
+
+
+def top_k(dataset, product):
+    return [query.run(dataset, "top_countries", product, direction=direction) for direction in query.DIRECTIONS] + [
+        query.run(dataset, "top_companies", product, direction=direction, role=role)
+        for direction in query.DIRECTIONS for role in query.ROLES
+    ]
+
+
+def tctk_merge(dataset, product):
+    return [query.run(dataset, "company_financials", product, direction=direction, role="Supplier") for direction in query.DIRECTIONS]
+
+
+def search_queries(dataset, product):
+    return [
+        query.run(dataset, "search_descriptions", product, text="mango -sugar"),
+        query.run(dataset, "search_companies", product, text="global foods", role="Purchaser"),
+        query.run(dataset, "search_companies", product, text="cong ty minh", role="Supplier"),
+    ]
+
+
+def network(dataset, product):
+    # Đồ thị giao dịch cho doanh nghiệp lớn nhất của mỗi (chiều giao dịch, vai trò): đối tác, đối thủ có chung đối tác, HHI
+    results = []
+    for direction in query.DIRECTIONS:
+        for role in query.ROLES:
+            companies = query.run(dataset, "network_companies", product, direction=direction, role=role, k=1)
+            for company in companies:
+                results.append(query.run(dataset, "counterparts", product, direction=direction, role=role, company=company))
+                results.append(query.run(dataset, "shared_counterparts", product, direction=direction, role=role, company=company))
+            results.append(query.run(dataset, "concentration", product, direction=direction, role=role))
+    return results
+
+
+def build_figures(dataset, product):
+    # Các loại hình dashboard dựng qua figures.py: cột theo tháng kèm đường Ring Ratio trên trục phụ, cột ngang
+    # top-K có màu theo giá trị; tính cả chuyển sang JSON như FigureCache
+    monthly = query.run(dataset, "monthly", product, measure="Amount")
+    directions = [direction for direction in query.DIRECTIONS if direction in monthly]
+    fig = figures.bar_ratio_figure(
+        monthly,
+        [(direction, direction) for direction in directions],
+        {direction: (f"{direction} Ring Ratio", f"{direction} Ring Ratio") for direction in directions},
+        "Amount",
+    )
+    payloads = [figures.to_json(fig)]
+    countries = query.run(dataset, "top_countries", product, direction="Export")
+    payloads.append(figures.to_json(figures.top_bar_figure(countries, "Amount", "Destination")))
+    top = query.run(dataset, "top_companies", product, direction="Export", role="Purchaser")
+    payloads.append(figures.to_json(figures.top_bar_figure(top, "Amount", "Purchaser", hover="Destination")))
+    return payloads
+
+
+# Các bước đo trên dataset đã ingest: tên bước -> hàm (dataset, sản phẩm)
+QUERY_STAGES = {
+    "section_market": section_market,
+    "section_countries": section_countries,
+    "section_companies": section_companies,
+    "top_k": top_k,
+    "tctk_merge": tctk_merge,
+    "search": search_queries,
+    "network": network,
+    "figures": build_figures,
+}
+
+
+def run_size(rows, work_dir, seed=0, repeat=3, chunk_rows=store.CHUNK_ROWS, profile=None):
+    # Đo một kích thước dữ liệu; trả về {rows, seed, stages, sizes, peak_rss_mb}
+    os.makedirs(work_dir, exist_ok=True)
+    store_dir = os.path.join(work_dir, "store")
+    stages = {}
+    generator = timed(stages, "generator_setup", lambda: TradeGenerator(rows, seed, profile))
+    sources = timed(stages, "generate", lambda: generator.write_sources(work_dir, chunk_rows))
+    ingest_breakdown(stages, sources["trade"], chunk_rows)
+    timed(stages, "ingest", lambda: store.ingest(sources, store_dir, chunk_rows))
+    sizes = aggregate_sizes(store_dir)
+    timed(stages, "tctk_pivot", lambda: tctk.CompanyFinancials(store.read_table("tctk", store_dir)), repeat)
+    dataset = timed(stages, "open_dataset", lambda: query.open_dataset(store_dir))
+    timed(stages, "build_columns", lambda: transactions.build_columns(store_dir))
+    # Sản phẩm nhiều giao dịch nhất (trường hợp nặng nhất của mỗi phần dashboard)
+    product = dataset.cube.groupby("Product", observed=True)["count"].sum().idxmax()
+    for stage, function in QUERY_STAGES.items():
+        timed(stages, stage, lambda: function(dataset, product), repeat)
+    timed(stages, "compare", lambda: query.compare(dataset, query.products(dataset)), repeat)
+    return {
+        "rows": rows,
+        "seed": seed,
+        "product": product,
+        "stages": stages,
+        "sizes": sizes,
+        # Đỉnh bộ nhớ của cả tiến trình tới thời điểm này (ru_maxrss tính bằng KB trên Linux)
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run(sizes, work_dir=None, seed=0, repeat=3, chunk_rows=store.CHUNK_ROWS, keep=False):
+    # Đo lần lượt các kích thước từ nhỏ đến lớn; thư mục tạm của mỗi kích thước bị xoá sau khi đo trừ khi keep
+    root = work_dir or tempfile.mkdtemp(prefix="bench-")
+    profile = load_profile()
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": [],
+    }
+    try:
+        for rows in sorted(sizes):
+            path = os.path.join(root, str(rows))
+            report["runs"].append(run_size(rows, path, seed, repeat, chunk_rows, profile))
+            if not keep:
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        if not keep and work_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def check(report, thresholds):
+    # Các bước chậm hơn ngưỡng và dung lượng vượt ngưỡng: [(số dòng, tên, giá trị, ngưỡng)].
+    # thresholds: {"số dòng": {bước: giây, tên dung lượng (vd. aggregates_pickle_mb): MB}}
+    failures = []
+    for result in report["runs"]:
+        limits = thresholds.get(str(result["rows"]), {})
+        sizes = result.get("sizes", {})
+        for name, limit in limits.items():
+            value = sizes[name] if name in sizes else result["stages"].get(name, {}).get("seconds")
+            if value is not None and value > limit:
+                failures.append((result["rows"], name, value, limit))
+    return failures
+
+
+def make_thresholds(report, factor):
+    # Ngưỡng thời gian = factor lần thời gian đo được (tối thiểu 0.1 giây để các bước rất nhanh không bị nhiễu);
+    # ngưỡng dung lượng = SIZE_TOLERANCE lần dung lượng đo được (tối thiểu 0.1 MB)
+    return {
+        str(result["rows"]): {
+            **{stage: round(max(0.1, timing["seconds"] * factor), 3) for stage, timing in result["stages"].items()},
+            **{name: round(max(0.1, size * SIZE_TOLERANCE), 3) for name, size in result.get("sizes", {}).items()},
+        }
+        for result in report["runs"]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo hiệu năng trên dữ liệu giao dịch tổng hợp")
+    parser.add_argument("--rows", nargs="+", default=["1e3", "1e4", "1e5"], help="Các kích thước, vd. 1e3 1e6 1e8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi bước truy vấn")
+    parser.add_argument("--chunk-rows", type=int, default=store.CHUNK_ROWS, help="Số dòng mỗi lô khi sinh và ingest")
+    parser.add_argument("--work-dir", help="Thư mục chứa dữ liệu sinh ra (mặc định: thư mục tạm)")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại dữ liệu và store sau khi đo")
+    parser.add_argument("--output", help="Ghi báo cáo JSON vào tệp này (mặc định: in ra màn hình)")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH, help="Tệp ngưỡng để kiểm tra hồi quy")
+    parser.add_argument("--write-thresholds", type=float, metavar="FACTOR", help="Ghi tệp ngưỡng = FACTOR lần kết quả đo")
+    args = parser.parse_args()
+
+    report = run([int(float(rows)) for rows in args.rows], args.work_dir, args.seed, args.repeat, args.chunk_rows, args.keep)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.write_thresholds:
+        thresholds = {}
+        if os.path.exists(args.thresholds):
+            with open(args.thresholds, encoding="utf-8") as f:
+                thresholds = json.load(f)
+        thresholds.update(make_thresholds(report, args.write_thresholds))
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump(thresholds, f, ensure_ascii=False, indent=2)
+    elif os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            failures = check(report, json.load(f))
+        for rows, name, value, limit in failures:
+            unit = "MB" if name.endswith("_mb") else "giây"
+            print(f"Vượt ngưỡng: {rows} dòng, {name}: {value:.3f} {unit} > {limit} {unit}")
+        if failures:
+            raise SystemExit(1)
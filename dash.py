@@ -1,137 +1,193 @@
 import pandas as pd
 import folium
-import numpy as np
-import matplotlib.pyplot as plt
-import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
-from streamlit_folium import folium_static
 import streamlit.components.v1 as components
-import requests
-from io import BytesIO
+import store
+import geo
+import figures
+import graph
+import tctk
+import query
+import telemetry
 
 st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
-@st.cache_data
-def load_data(file_path):
-    response = requests.get(file_path)
-    response.raise_for_status()  # Kiểm tra xem có lỗi khi tải file không
-    data = pd.read_excel(BytesIO(response.content))
-    return data
-
-# URL cho tệp dữ liệu
-file_path_data = "https://raw.githubusercontent.com/thuthuy119/agricultural_products/main/TradeData_DriedMango_processed.xlsx"
-data = load_data(file_path_data)
-data['Supplier_code'] = data['Supplier_code'].fillna(0).astype("int64").astype("object").apply(lambda x: str(x).zfill(10)) 
-data['Purchaser_code'] = data['Purchaser_code'].fillna(0).astype("int64").astype("object").apply(lambda x: str(x).zfill(10)) 
+# Thời gian của mỗi lần chạy lại toàn bộ script (các fragment chạy lại riêng được đo theo từng phần, xem telemetry.py).
+# Phần còn lại của script nằm trong khối with để phần đo luôn được đóng, kể cả khi script dừng giữa chừng
+# (st.stop(), st.rerun() hay lỗi) — nếu không phần đo cũ còn trên ngăn xếp và luồng bị tính là đang bận.
+with telemetry.section("dashboard rerun") as rerun_timer:
+    # Store dạng cột cục bộ (tự ingest từ tệp Excel trong repo nếu chưa có).
+    # Phiên bản dữ liệu được đưa vào khoá của mọi cache để dữ liệu mới thay thế dữ liệu cũ.
+    with telemetry.section("ensure_store"):
+        store.ensure_store()
+    data_version = store.data_version()
+
+    # Các đối tượng dữ liệu dùng chung: st.cache_resource giữ một bản duy nhất cho mọi phiên trong tiến trình
+    # (st.cache_data sẽ pickle và sao chép cho từng phiên). Các đối tượng này chỉ được đọc, không bị sửa;
+    # mỗi phiên chỉ giữ các lựa chọn trên widget.
+
+    # Dữ liệu doanh nghiệp TCTK, đánh chỉ mục theo mã số thuế với pivot tài chính theo năm tính sẵn
+    # (mã số thuế đã được chuẩn hoá 10 chữ số khi ingest)
+    @st.cache_resource(max_entries=2)
+    def load_financials(version):
+        with telemetry.section("load_financials", cache="miss"):
+            return tctk.CompanyFinancials(store.read_table("tctk"))
+
+    # Các tổng hợp đã được cộng dồn khi ingest theo từng lô, dashboard không cần đọc bảng giao dịch gốc.
+    # Mỗi lần append dữ liệu mới phiên bản tăng lên; chỉ giữ các phiên bản gần nhất trong bộ nhớ.
+    # Mảng số lớn (ma trận kề, bitset, đơn giá...) là memory-map chỉ đọc (store.MAPPED_ARRAY_BYTES): tiến trình chỉ giữ
+    # phần pickle nhỏ, các trang của mảng dùng chung với API và hệ điều hành có thể thu hồi.
+    @st.cache_resource(max_entries=2)
+    def load_aggregates(version):
+        with telemetry.section("load_aggregates", cache="miss"):
+            return store.read_aggregates(version=version)
+
+    # Các phép tính nằm trong query.py (dùng chung với API); dashboard chỉ vẽ và hiển thị.
+    # query.view() đọc kết quả tính sẵn bởi precompute.py, chỉ tính trực tiếp khi chưa có.
+    @st.cache_resource(max_entries=2)
+    def load_dataset(version):
+        telemetry.count("load_dataset miss")
+        return query.Dataset(load_aggregates(version), load_financials(version), version, store.STORE_DIR)
+
+    dataset = load_dataset(data_version)
+
+    @st.cache_resource
+    def get_figure_cache():
+        # Cache hình dùng chung cho mọi phiên, giới hạn số hình và dung lượng
+        return figures.FigureCache(max_entries=512, max_bytes=128 * 1024 * 1024)
+
+    figure_cache = get_figure_cache()
+
+    def telemetry_page():
+        # Trang quản trị ẩn (?admin=telemetry): số liệu đo của mọi phiên trong tiến trình này
+        st.markdown("<h2 style='font-weight: bold;color:firebrick;'>Telemetry</h2>", unsafe_allow_html=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            memory = st.toggle('Đo bộ nhớ (tracemalloc)', value=telemetry.memory_tracing())
+            telemetry.set_memory_tracing(memory)
+        with col2:
+            sampling = st.toggle('Lấy mẫu flamegraph', value=telemetry.sampler.active)
+            if sampling:
+                telemetry.sampler.start()
+            else:
+                telemetry.sampler.stop()
+        with col3:
+            if st.button('Xoá số liệu'):
+                telemetry.registry.reset()
+                telemetry.sampler.reset()
+
+        snapshot = telemetry.registry.snapshot()
+        st.write('Thời gian thu thập (giây):', round(snapshot['uptime_seconds'], 1))
+        sections = pd.DataFrame(snapshot['sections'])
+        if sections.empty:
+            st.write("Chưa có số liệu")
+        else:
+            st.dataframe(sections.drop(columns=['buckets']), hide_index=True, use_container_width=True)
+            selected = st.selectbox('Histogram thời gian', sections.index,
+                                    format_func=lambda i: f"{sections['section'][i]} ({sections['cache'][i] or '-'})")
+            st.bar_chart(pd.Series(sections['buckets'][selected], name='Số lần'))
+
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Bộ đếm</h5>", unsafe_allow_html=True)
+        counters = {
+            **snapshot['counters'],
+            'figure cache hits': figure_cache.hits,
+            'figure cache misses': figure_cache.misses,
+            'figure cache entries': len(figure_cache.entries),
+            'figure cache bytes': figure_cache.size,
+        }
+        st.dataframe(pd.Series(counters, name='Giá trị'), use_container_width=True)
+
+        st.write('Số mẫu flamegraph:', telemetry.sampler.samples)
+        st.download_button('Tải ngăn xếp dạng folded (flamegraph.pl, speedscope)', telemetry.sampler.folded(), file_name='dash.folded')
+
+    if st.query_params.get('admin') == 'telemetry':
+        telemetry_page()
+        # st.stop() thoát khỏi khối with, phần đo được đóng dưới tên này
+        rerun_timer.name = "telemetry page"
+        st.stop()
+
+    # Độ rộng vùng vẽ (px) quyết định số cột tối đa của chuỗi thời gian dài (figures.max_points);
+    # server không biết độ rộng màn hình nên dùng mặc định, màn hình hẹp có thể mở với ?width=600
+    try:
+        chart_width = int(st.query_params.get('width', figures.DEFAULT_WIDTH))
+    except ValueError:
+        chart_width = figures.DEFAULT_WIDTH
+
+    def show_chart(chart_id, build, direction=None, country=None, product=None):
+        # Chỉ dựng lại hình khi tổ hợp (biểu đồ, sản phẩm, chiều giao dịch, quốc gia, phiên bản dữ liệu, độ rộng) chưa có trong cache.
+        # product mặc định là sản phẩm đang chọn; chế độ so sánh truyền vào bộ các sản phẩm được so sánh.
+        product = selected_product if product is None else product
+        fig = figure_cache.figure((chart_id, product, direction, country, data_version, chart_width), build)
+        st.plotly_chart(fig, use_container_width=True)
 
-# URL cho tệp dữ liệu TCTK
-file_path_data_tctk = "https://raw.githubusercontent.com/thuthuy119/agricultural_products/main/data_doanh_nghiep_TCTK.xlsx"
-data_tctk = load_data(file_path_data_tctk)
-data_tctk['Mã số thuế'] = data_tctk['Mã số thuế'].fillna(0).astype("int64").astype("object").apply(lambda x: str(x).zfill(10)) 
+    # Lấy các giá trị duy nhất trong cột "Product" (cube giữ thứ tự xuất hiện đầu tiên)
+    product_options = query.products(dataset)
 
-# Lấy các giá trị duy nhất trong cột "Product"
-product_options = data['Product'].unique()
+    # Sử dụng Streamlit để tạo Navigation panel
+    st.sidebar.title('Navigation Panel')
+    selected_product = st.sidebar.radio("Chọn sản phẩm", product_options)
 
-# Sử dụng Streamlit để tạo Navigation panel
-st.sidebar.title('Navigation Panel')
-selected_product = st.sidebar.radio("Chọn sản phẩm", product_options)
-st.markdown("<h2 style='font-weight: bold;text-align: center; color:firebrick;'> PHÂN TÍCH TÌNH HÌNH XUẤT NHẬP KHẨU MỘT SỐ SẢN PHẨM NÔNG SẢN TẠI VIỆT NAM (THÁNG 7/2023 - THÁNG 7/2024)</h2>", unsafe_allow_html=True)
-data = data[data['Product'] == selected_product]
+    # Chế độ so sánh: số liệu của mọi sản phẩm được chọn tính trong một lần groupby trên cube
+    compare_mode = st.sidebar.checkbox("So sánh nhiều sản phẩm")
+    if compare_mode:
+        compared_products = st.sidebar.multiselect("Chọn các sản phẩm để so sánh", product_options, default=product_options[:2])
+    st.markdown("<h2 style='font-weight: bold;text-align: center; color:firebrick;'> PHÂN TÍCH TÌNH HÌNH XUẤT NHẬP KHẨU MỘT SỐ SẢN PHẨM NÔNG SẢN TẠI VIỆT NAM (THÁNG 7/2023 - THÁNG 7/2024)</h2>", unsafe_allow_html=True)
+    cube = query.product_cube(dataset, selected_product)
 
-# # Tạo Multiple Choice cho HS Code
-# hs_code_options = data['HS Code'].unique()  # Lấy danh sách các HS Code duy nhất từ dữ liệu đã lọc
+    # # Tạo Multiple Choice cho HS Code
+    # hs_code_options = data['HS Code'].unique()  # Lấy danh sách các HS Code duy nhất từ dữ liệu đã lọc
 
-# # Đảm bảo rằng tất cả các giá trị trong default đều có trong options
-# default_hs_codes = [code for code in hs_code_options if code ins hs_code_options]
+    # # Đảm bảo rằng tất cả các giá trị trong default đều có trong options
+    # default_hs_codes = [code for code in hs_code_options if code ins hs_code_options]
 
-# # Chọn HS Code từ sidebar
-# selected_hs_codes = st.sidebar.selectbox("Chọn HS Code", hs_code_options, default=default_hs_codes)
+    # # Chọn HS Code từ sidebar
+    # selected_hs_codes = st.sidebar.selectbox("Chọn HS Code", hs_code_options, default=default_hs_codes)
 
-# # Lọc dữ liệu thêm dựa trên các HS Code được chọn
-# data = data[data['HS Code'].isin(selected_hs_codes)]
+    # # Lọc dữ liệu thêm dựa trên các HS Code được chọn
+    # data = data[data['HS Code'].isin(selected_hs_codes)]
 
 
-# # Lọc dữ liệu thêm dựa trên các HS Code được chọn
-# data = data[data['HS Code'].isin(selected_hs_codes)]
+    # # Lọc dữ liệu thêm dựa trên các HS Code được chọn
+    # data = data[data['HS Code'].isin(selected_hs_codes)]
 
 
-# Tính tổng giá trị của cột 'Amount'
-total_amount = data['Amount'].sum()
+    # Tính tổng giá trị của cột 'Amount'
+    total_amount = cube['Amount'].sum()
 
-if total_amount != 0:
-    with st.expander("PHẦN 1 - PHÂN TÍCH TOÀN THỊ TRƯỜNG"):
+    # Mỗi phần phân tích là một fragment: chỉ phần đang được chọn mới được tính toán,
+    # và thao tác trên widget bên trong một phần chỉ chạy lại phần đó.
+    @st.fragment
+    @telemetry.timed("PHẦN 1")
+    def market_section():
         # Sử dụng st.markdown để chèn HTML
         st.markdown("<h3 style='font-weight: bold;color:#AD2A1A;'>Phân tích tổng quan về thị trường</h3>", unsafe_allow_html=True)
 
         # Sử dụng st.markdown để chèn HTML
         st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Số lượng giao dịch</h5>", unsafe_allow_html=True)
 
-        # Đếm số lượng giao dịch theo từng tháng/năm và loại Import/Export
-        transaction_counts = data.groupby(['Month/Year', 'Import/Export']).size().unstack(fill_value=0).reset_index()
-
-        # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-        transaction_counts['Month/Year'] = transaction_counts['Month/Year'].astype(str)
-
-        # Tính tỷ lệ thay đổi theo tháng cho Import và Export
-        transaction_counts['Import Ring Ratio'] = transaction_counts['Import'].pct_change() * 100
-        transaction_counts['Export Ring Ratio'] = transaction_counts['Export'].pct_change() * 100
-
-        # Làm tròn đến 1 chữ số sau dấu phẩy
-        transaction_counts['Import Ring Ratio'] = transaction_counts['Import Ring Ratio'].round(1)
-        transaction_counts['Export Ring Ratio'] = transaction_counts['Export Ring Ratio'].round(1)
-
-        # Vẽ biểu đồ dạng cột cụm bằng Plotly
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(x=transaction_counts['Month/Year'], y=transaction_counts['Import'], name='Import', marker_color='rgb(31, 119, 180)'))
-        fig.add_trace(go.Bar(x=transaction_counts['Month/Year'], y=transaction_counts['Export'], name='Export', marker_color='rgb(255, 127, 14)'))
-    
-        fig.add_trace(go.Scatter(x=transaction_counts['Month/Year'], y=transaction_counts['Import Ring Ratio'], name='Import Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-        fig.add_trace(go.Scatter(x=transaction_counts['Month/Year'], y=transaction_counts['Export Ring Ratio'], name='Export Ring Ratio', line=dict(color='rgb(0, 128, 0)', width=2), yaxis='y2'))
-        
-        fig.update_layout(
-            yaxis={'categoryorder': 'total ascending'},
-            paper_bgcolor='rgb(252, 252, 252)',  
-            plot_bgcolor='rgb(252, 252, 252)',   
-            margin=dict(l=40, r=40, t=40, b=40)  
-        )
-
-        # Chuyển legend xuống dưới, ở giữa biểu đồ và bỏ tên của legend
-        fig.update_layout(
-            legend=dict(
-                title_text='',
-                orientation='h',
-                yanchor='bottom',
-                y=-0.3,
-                xanchor='center',
-                x=0.5
-            ),
-            xaxis=dict(title='Month/Year'),
-            yaxis=dict(title='Tổng số lượng giao dịch', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)'),
-            yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)')
-        )
-
-        # Đồng bộ font chữ cho tất cả text trong biểu đồ
-        fig.update_layout(
-            font=dict(
-                family="Arial",
-                size=12,
-                color="Black"
+        def build_transaction_counts():
+            # Số lượng giao dịch theo từng tháng/năm và loại Import/Export, kèm tỷ lệ thay đổi theo tháng
+            transaction_counts = query.view(dataset, 'monthly', selected_product, measure='count')
+
+            # Cột Import/Export kèm đường tỷ lệ thay đổi của từng chiều trên trục phụ
+            return figures.bar_ratio_figure(
+                transaction_counts,
+                [('Import', 'Import'), ('Export', 'Export')],
+                {direction: (f'{direction} Ring Ratio', f'{direction} Ring Ratio') for direction in ('Import', 'Export')},
+                'Tổng số lượng giao dịch',
+                width=chart_width,
             )
-        )
 
-        # Hiển thị biểu đồ trên Streamlit
-        #st.title("Market Analysis - Transactions")
-        st.plotly_chart(fig, use_container_width=True)
+        show_chart('transaction_counts', build_transaction_counts)
 
         # Tính tổng số giao dịch nhập khẩu và xuất khẩu
-        total_imports = data[data['Import/Export'] == 'Import'].shape[0]
-        total_exports = data[data['Import/Export'] == 'Export'].shape[0]
-        
+        total_imports = query.view(dataset, 'direction_total', selected_product, direction='Import', measure='count')
+        total_exports = query.view(dataset, 'direction_total', selected_product, direction='Export', measure='count')
+
         # Display the output in two columns
         col1, col2 = st.columns(2)
         # Hiển thị tổng số giao dịch nhập khẩu và xuất khẩu
@@ -144,64 +200,24 @@ if total_amount != 0:
         # Sử dụng st.markdown để chèn HTML
         st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Giá trị giao dịch</h5>", unsafe_allow_html=True)
 
-        # Tính tổng giá trị giao dịch theo từng tháng/năm và loại Import/Export
-        transaction_amounts = data.groupby(['Month/Year', 'Import/Export'])['Amount'].sum().unstack(fill_value=0).reset_index()
-
-        # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-        transaction_amounts['Month/Year'] = transaction_amounts['Month/Year'].astype(str)
-
-        # Tính tỷ lệ thay đổi theo tháng cho Export
-        transaction_amounts['Export Ring Ratio'] = transaction_amounts['Export'].pct_change() * 100
-
-        # Làm tròn đến 1 chữ số sau dấu phẩy
-        transaction_amounts['Export Ring Ratio'] = transaction_amounts['Export Ring Ratio'].round(1)
-
-        # Vẽ biểu đồ dạng cột cụm bằng Plotly
-        fig = go.Figure()
-
-        # Thêm các cột Import và Export
-        fig.add_trace(go.Bar(x=transaction_amounts['Month/Year'], y=transaction_amounts['Import'], name='Import', marker_color='rgb(31, 119, 180)'))
-        fig.add_trace(go.Bar(x=transaction_amounts['Month/Year'], y=transaction_amounts['Export'], name='Export', marker_color='rgb(255, 127, 14)'))
-
-        # Thêm đường tỷ lệ thay đổi Export
-        fig.add_trace(go.Scatter(x=transaction_amounts['Month/Year'], y=transaction_amounts['Export Ring Ratio'], name='Export Ring Ratio', line=dict(color='rgb(0, 128, 0)', width=2), yaxis='y2'))
-
-        
-        fig.update_layout(
-            yaxis={'categoryorder': 'total ascending'},
-            paper_bgcolor='rgb(252, 252, 252)',  
-            plot_bgcolor='rgb(252, 252, 252)',   
-            margin=dict(l=40, r=40, t=40, b=40)  
-        )
-
-        fig.update_layout(
-            legend=dict(
-                title_text='',
-                orientation='h',
-                yanchor='bottom',
-                y=-0.3,
-                xanchor='center',
-                x=0.5
-            ),
-            xaxis=dict(title='Month/Year'),
-            yaxis=dict(title='Giá trị giao dịch', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)'),
-            yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)')
-        )
-
-        fig.update_layout(
-            font=dict(
-                family="Arial",
-                size=12,
-                color="Black"
+        def build_transaction_amounts():
+            # Tổng giá trị giao dịch theo từng tháng/năm và loại Import/Export, kèm tỷ lệ thay đổi theo tháng
+            transaction_amounts = query.view(dataset, 'monthly', selected_product, measure='Amount')
+
+            # Cột Import/Export kèm đường tỷ lệ thay đổi Export trên trục phụ
+            return figures.bar_ratio_figure(
+                transaction_amounts,
+                [('Import', 'Import'), ('Export', 'Export')],
+                {'Export': ('Export Ring Ratio', 'Export Ring Ratio')},
+                'Giá trị giao dịch',
+                width=chart_width,
             )
-        )
 
-        # Hiển thị biểu đồ trên Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+        show_chart('transaction_amounts', build_transaction_amounts)
 
         # Tính tổng giá trị nhập khẩu và xuất khẩu
-        total_import_value = data[data['Import/Export'] == 'Import']['Amount'].sum()
-        total_export_value = data[data['Import/Export'] == 'Export']['Amount'].sum()
+        total_import_value = query.view(dataset, 'direction_total', selected_product, direction='Import', measure='Amount')
+        total_export_value = query.view(dataset, 'direction_total', selected_product, direction='Export', measure='Amount')
 
         # Hiển thị tổng giá trị  nhập khẩu và xuất khẩu
         # Display the output in two columns
@@ -212,42 +228,50 @@ if total_amount != 0:
         with col2:
             st.write("Tổng giá trị xuất khẩu:", round(total_export_value, 2))
 
-    
-    with st.expander("PHẦN 2 - PHÂN TÍCH THEO TỪNG QUỐC GIA"):
+
+    @st.fragment
+    @telemetry.timed("PHẦN 2")
+    def country_section():
         # Tạo hộp chọn trong thanh bên để chọn giá trị trong cột "Import/Export"
-        selected_value = st.selectbox('Chọn giá trị Import/Export', data['Import/Export'].unique())
-
-        # Lọc dữ liệu dựa trên giá trị đã chọn
-        filtered_data = data[data['Import/Export'] == selected_value]
-
-        # Tính tổng giá trị (Amount) cho mỗi quốc gia
-        amount_by_country = filtered_data.groupby('Destination')['Amount'].sum().reset_index()
-
-        # Tạo bản đồ
-        political_countries_url = "http://geojson.xyz/naturalearth-3.3.0/ne_50m_admin_0_countries.geojson"
-        m = folium.Map(location=[25, 10], zoom_start=2, tiles="cartodb positron")
-
-        choropleth = folium.Choropleth(
-            geo_data=political_countries_url,
-            data=amount_by_country,
-            columns=["Destination", "Amount"],
-            key_on="feature.properties.name",
-            fill_color="YlGn",
-            fill_opacity=0.7,
-            line_opacity=0.2,
-            nan_fill_color="white",
-            legend_name=f"Tổng giá trị",
-            name=f"Tổng giá trị {selected_value} của Việt Nam"
-        ).add_to(m)
-
-        # Tùy chỉnh thanh legend
-        choropleth.geojson.add_child(
-            folium.features.GeoJsonTooltip(['name'], labels=True)
-        )
-        folium.LayerControl().add_to(m)
+        selected_value = st.selectbox('Chọn giá trị Import/Export', cube['Import/Export'].unique())
+
+        # Chọn độ chi tiết của ranh giới quốc gia (đã đóng gói sẵn, không tải qua mạng)
+        map_resolution = st.radio('Độ chi tiết bản đồ', list(geo.RESOLUTIONS), index=0, horizontal=True)
+
+        def build_map_html():
+            # Tính tổng giá trị (Amount) cho mỗi quốc gia
+            amount_by_country = query.view(dataset, 'country_totals', selected_product, direction=selected_value)
+
+            # Ghép quốc gia với ranh giới theo mã ISO đã tính sẵn thay vì theo tên
+            map_data = amount_by_country.assign(Key=geo.destination_keys(amount_by_country['Destination']).to_numpy())
+
+            # Tạo bản đồ
+            m = folium.Map(location=[25, 10], zoom_start=2, tiles="cartodb positron")
+
+            choropleth = folium.Choropleth(
+                geo_data=geo.load_countries(map_resolution),
+                data=map_data,
+                columns=["Key", "Amount"],
+                key_on="feature.id",
+                fill_color="YlGn",
+                fill_opacity=0.7,
+                line_opacity=0.2,
+                nan_fill_color="white",
+                legend_name=f"Tổng giá trị",
+                name=f"Tổng giá trị {selected_value} của Việt Nam"
+            ).add_to(m)
+
+            # Tùy chỉnh thanh legend
+            choropleth.geojson.add_child(
+                folium.features.GeoJsonTooltip(['name'], labels=True)
+            )
+            folium.LayerControl().add_to(m)
+
+            # Render bản đồ Folium thành HTML
+            return m.get_root().render()
 
-        # Render bản đồ Folium thành HTML
-        map_html = m.get_root().render()
+        # HTML của bản đồ được lưu trong cache, chỉ render lại khi dữ liệu hoặc lựa chọn thay đổi
+        map_html = figure_cache.html(('map-' + map_resolution, selected_product, selected_value, None, data_version), build_map_html)
 
         # Hiển thị bản đồ trong ứng dụng Streamlit với chiều cao và chiều rộng tự động
         components.html(
@@ -264,168 +288,101 @@ if total_amount != 0:
 
         # Chèn tiêu đề vào ứng dụng Streamlit
         st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Giá trị giao dịch của top 10 nước {transaction_type} lớn nhất của Việt Nam</h5>", unsafe_allow_html=True)
-            
-        # Tính tổng giá trị (Amount) cho mỗi quốc gia
-        amount_by_country = filtered_data.groupby('Destination')['Amount'].sum().reset_index()
-
-        # Lấy top 10 quốc gia có tổng giá trị lớn nhất
-        top_10_countries = amount_by_country.nlargest(10, 'Amount')
-
-        # Vẽ biểu đồ bằng Plotly
-        fig = px.bar(top_10_countries, x='Amount', y='Destination', orientation='h',
-                    labels={'Amount': '', 'Destination': ''},
-                    color='Amount', color_continuous_scale=px.colors.sequential.Viridis_r)
-
-        fig.update_layout(
-            yaxis={'categoryorder': 'total ascending'},
-            paper_bgcolor='rgb(252, 252, 252)', 
-            plot_bgcolor='rgb(252, 252, 252)',   
-            margin=dict(l=40, r=40, t=40, b=40)  
-        )
 
-        # Hiển thị biểu đồ trong ứng dụng Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+        def build_top_10_countries():
+            # Lấy top 10 quốc gia có tổng giá trị (Amount) lớn nhất
+            top_10_countries = query.view(dataset, 'top_countries', selected_product, direction=selected_value, k=10)
+
+            # Vẽ biểu đồ cột ngang, màu theo giá trị
+            return figures.top_bar_figure(top_10_countries, 'Amount', 'Destination')
+
+        show_chart('top_10_countries', build_top_10_countries, direction=selected_value)
+
+        # Tăng trưởng của mọi quốc gia được tính một lần trên bảng rộng theo tháng
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Top 10 nước {transaction_type} tăng trưởng nhanh nhất (3 tháng gần nhất so với 3 tháng trước)</h5>", unsafe_allow_html=True)
+        st.dataframe(query.view(dataset, 'destination_growth', selected_product, direction=selected_value), hide_index=True, use_container_width=True)
 
             # Chèn tiêu đề vào ứng dụng Streamlit
         st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Giá trị xuất/nhập khẩu theo quốc gia</h5>", unsafe_allow_html=True)
 
 
         # Tạo danh sách các quốc gia duy nhất từ cột "Destination"
-        countries = data['Destination'].unique()
+        countries = cube['Destination'].unique()
 
         # Tạo một selectbox để chọn quốc gia
         selected_country = st.selectbox('Chọn quốc gia', countries)
 
-        # Lọc dữ liệu cho quốc gia được chọn
-        country_data = data[data['Destination'] == selected_country]
+        # Lọc cube cho quốc gia được chọn
+        country_cube = query.product_cube(dataset, selected_product, destination=selected_country)
 
         # Kiểm tra nếu không có dữ liệu cho quốc gia này
-        if country_data.empty:
+        if country_cube.empty:
             st.write(f"Không có dữ liệu cho quốc gia {selected_country}")
         else:
-            # Thêm cột Month/Year để nhóm dữ liệu
-            country_data['Month/Year'] = country_data['Date'].dt.to_period('M')
-
-            # Tính tổng giá trị  theo từng tháng/năm và loại Import/Export
-            transaction_values = country_data.groupby(['Month/Year', 'Import/Export'])['Amount'].sum().unstack(fill_value=0).reset_index()
-
-            # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-            transaction_values['Month/Year'] = transaction_values['Month/Year'].astype(str)
-
             # In ra tổng giá trị của Import/Export
-            if 'Import' in transaction_values.columns:
-                total_import_value = transaction_values['Import'].sum()
+            country_directions = set(country_cube['Import/Export'])
+            if 'Import' in country_directions:
+                total_import_value = query.view(dataset, 'direction_total', selected_product, direction='Import', measure='Amount', destination=selected_country)
                 st.write(f"Tổng giá trị nhập khẩu của Việt Nam:", round(total_import_value, 2))
             else:
                 total_import_value = 0
                 st.write("Không có dữ liệu Việt Nam nhập khẩu từ nước này")
 
-            if 'Export' in transaction_values.columns:
-                total_export_value = transaction_values['Export'].sum()
+            if 'Export' in country_directions:
+                total_export_value = query.view(dataset, 'direction_total', selected_product, direction='Export', measure='Amount', destination=selected_country)
                 st.write(f"Tổng giá trị xuất khẩu từ Việt Nam:", round(total_export_value, 2))
             else:
                 total_export_value = 0
                 st.write("Không có dữ liệu Việt Nam xuất khẩu sang nước này")
 
-            # Tính tỷ lệ thay đổi theo tháng cho Import và Export nếu tồn tại
-            if 'Import' in transaction_values.columns:
-                transaction_values['Import Ring Ratio'] = transaction_values['Import'].pct_change() * 100
-                transaction_values['Import Ring Ratio'] = transaction_values['Import Ring Ratio'].round(1)
-            else:
-                transaction_values['Import'] = 0
-                transaction_values['Import Ring Ratio'] = 0
+            def build_country_values():
+                # Tổng giá trị theo từng tháng/năm và loại Import/Export, kèm tỷ lệ thay đổi theo tháng nếu tồn tại
+                transaction_values = query.view(dataset, 'monthly', selected_product, measure='Amount', destination=selected_country)
 
-            if 'Export' in transaction_values.columns:
-                transaction_values['Export Ring Ratio'] = transaction_values['Export'].pct_change() * 100
-                transaction_values['Export Ring Ratio'] = transaction_values['Export Ring Ratio'].round(1)
-            else:
-                transaction_values['Export'] = 0
-                transaction_values['Export Ring Ratio'] = 0
-
-            # Vẽ biểu đồ dạng cột cụm bằng Plotly
-            fig = go.Figure()
+                # Chiều giao dịch không có dữ liệu được điền 0
+                for direction in query.DIRECTIONS:
+                    if direction not in transaction_values.columns:
+                        transaction_values[direction] = 0
+                        transaction_values[f'{direction} Ring Ratio'] = 0
 
-            # Thêm các cột Import và Export nếu tồn tại dữ liệu
-            if transaction_values['Import'].sum() > 0:
-                fig.add_trace(go.Bar(x=transaction_values['Month/Year'], y=transaction_values['Import'], name='Import', marker_color='rgb(31, 119, 180)'))
-            if transaction_values['Export'].sum() > 0:
-                fig.add_trace(go.Bar(x=transaction_values['Month/Year'], y=transaction_values['Export'], name='Export', marker_color='rgb(255, 127, 14)'))
-
-            # Thêm các đường tỷ lệ thay đổi Import và Export nếu tồn tại dữ liệu
-            if transaction_values['Import Ring Ratio'].sum() > 0:
-                fig.add_trace(go.Scatter(x=transaction_values['Month/Year'], y=transaction_values['Import Ring Ratio'], name='Import Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-            if transaction_values['Export Ring Ratio'].sum() > 0:
-                fig.add_trace(go.Scatter(x=transaction_values['Month/Year'], y=transaction_values['Export Ring Ratio'], name='Export Ring Ratio', line=dict(color='rgb(0, 128, 0)', width=2), yaxis='y2'))
-
-            fig.update_layout(
-                yaxis={'categoryorder': 'total ascending'},
-                paper_bgcolor='rgb(252, 252, 252)', 
-                plot_bgcolor='rgb(252, 252, 252)',   
-                margin=dict(l=40, r=40, t=40, b=40)  
-            )
+                # Chỉ vẽ cột và đường tỷ lệ thay đổi của các chiều có dữ liệu
+                directions = [direction for direction in ('Import', 'Export') if transaction_values[direction].sum() > 0]
+                return figures.bar_ratio_figure(
+                    transaction_values,
+                    [(direction, direction) for direction in directions],
+                    {direction: (f'{direction} Ring Ratio', f'{direction} Ring Ratio') for direction in directions},
+                    'Tổng giá trị giao dịch',
+                    width=chart_width,
+                    legend_y=-0.2,
+                )
 
-            fig.update_layout(
-                legend=dict(
-                    title_text='',
-                    orientation='h',
-                    yanchor='bottom',
-                    y=-0.2,
-                    xanchor='center',
-                    x=0.5
-                ),
-                xaxis=dict(title='Month/Year'),
-                yaxis=dict(title='Tổng giá trị giao dịch', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)'),
-                yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', title_standoff=10, showgrid=True, gridcolor='rgba(0, 0, 0, 0)')
-            )
-            # Hiển thị biểu đồ
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart('country_values', build_country_values, country=selected_country)
 
 
-    with st.expander("PHẦN 3 - PHÂN TÍCH THEO NHÀ NHẬP KHẨU/NHÀ XUẤT KHẨU"):
+    @st.fragment
+    @telemetry.timed("PHẦN 3")
+    def company_section():
 
         # Tạo selection bar với hai giá trị "Xuất khẩu" và "Nhập khẩu"
         selection = st.selectbox('Chọn loại giao dịch', ['Việt Nam xuất khẩu đến các nước khác', 'Việt Nam nhập khẩu từ các nước khác'])
 
         #hàm vẽ biểu đồ 
-        def plot_top_20_with_hover(data, import_export, role, title, hover_column):
-            # Lọc dữ liệu theo Import/Export
-            filtered_data = data[data['Import/Export'] == import_export]
-            
-            # Tính tổng giá trị (Amount) cho mỗi Purchaser hoặc Supplier và lấy thêm cột Country
-            if role == 'Purchaser':
-                grouped_data = filtered_data.groupby([role, hover_column])['Amount'].sum().reset_index()
-            elif role == 'Supplier':
-                grouped_data = filtered_data.groupby([role, hover_column])['Amount'].sum().reset_index()
-
-            # Lấy top 20 Purchasers hoặc Suppliers có tổng giá trị lớn nhất
-            top_20 = grouped_data.nlargest(20, 'Amount')
-
-            # Vẽ biểu đồ bằng Plotly
-            fig = px.bar(top_20, x='Amount', y=role, orientation='h',
-                        labels={'Amount': '', role: ''},
-                        color='Amount', color_continuous_scale=px.colors.sequential.Viridis_r,
-                        hover_data={hover_column: True, 'Amount': True})
-
-            # Đổi tên các cột trong hover data và làm tròn Amount
-            fig.update_traces(hovertemplate='<b>%{y}</b><br>Giá trị: %{x:.2f}<br>' + hover_column + ': %{customdata[0]}<extra></extra>')
-
-            # Cập nhật nền thành màu xám cực nhạt
-            fig.update_layout(
-                yaxis={'categoryorder': 'total ascending'},
-                paper_bgcolor='rgb(252, 252, 252)',  # Màu xám cực nhạt
-                plot_bgcolor='rgb(252, 252, 252)',   # Màu xám cực nhạt
-                margin=dict(l=40, r=40, t=40, b=40),  # Thu hẹp phần nền lại
-                #title=title
-            )
+        def plot_top_20_with_hover(import_export, role, title, hover_column, k=20):
+            # Lấy top k Purchasers hoặc Suppliers có tổng giá trị lớn nhất (kèm cột Country)
+            # từ tổng cộng dồn đã tính sẵn theo sản phẩm và Import/Export
+            top_20 = query.view(dataset, 'top_companies', selected_product, direction=import_export, role=role, by=hover_column, k=k)
+
+            def build_top():
+                # Vẽ biểu đồ cột ngang, rê chuột hiện giá trị làm tròn và cột hover_column
+                return figures.top_bar_figure(top_20, 'Amount', role, hover=hover_column)
 
-            # Hiển thị biểu đồ trong Streamlit
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(f'top_{role}_{hover_column}_{k}', build_top, direction=import_export)
             return top_20 
-        
+
         # def generate_pivot_table_for_top_20(data, data_tctk, import_export, role, hover_column):
         #     # Lấy dữ liệu top 20 doanh nghiệp
         #     top_20_df = plot_top_20_with_hover(data, import_export, role, 'Top 20 ' + role + ' by Total Amount (' + import_export + ')', hover_column)
-            
+
         #     # Merge dữ liệu top 20 với data_tctk
         #     merged_data = data_tctk.merge(top_20_df, left_on='Tên DN', right_on=role, how='inner')
 
@@ -444,247 +401,314 @@ if total_amount != 0:
 
 
         if selection == 'Việt Nam xuất khẩu đến các nước khác':
-            
-            st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà nhập khẩu </h5>", unsafe_allow_html=True)
 
-            # Chọn dữ liệu Export
-            export_data = data[data['Import/Export'] == 'Export']
+            st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà nhập khẩu </h5>", unsafe_allow_html=True)
 
             # Đếm số lượng nhà cung cấp (unique)
-            unique_suppliers_count = export_data['Purchaser'].nunique()
+            unique_suppliers_count = query.view(dataset, 'counterpart_total', selected_product, direction='Export', role='Purchaser')
 
             # Hiển thị giá trị đó thông qua st.write
             st.write('Tổng số lượng nhà nhập khẩu:', unique_suppliers_count)
 
-            # Group by Month/Year and count unique Purchasers for Export
-            export_purchasers = export_data.groupby('Month/Year')['Purchaser'].nunique().reset_index()
-
-            # Calculate ring ratio for Export Purchasers
-            export_purchasers['Ring Ratio'] = export_purchasers['Purchaser'].pct_change() * 100
-            export_purchasers['Ring Ratio'] = export_purchasers['Ring Ratio'].round(1)
-
-            # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-            export_purchasers['Month/Year'] = export_purchasers['Month/Year'].astype(str)
-
-            # Plot for Export Purchasers
-            fig1 = go.Figure()
-            fig1.add_trace(go.Bar(x=export_purchasers['Month/Year'], y=export_purchasers['Purchaser'], name='Số lượng nhà nhập khẩu', marker_color='rgb(31, 119, 180)'))
-            fig1.add_trace(go.Scatter(x=export_purchasers['Month/Year'], y=export_purchasers['Ring Ratio'], name='Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-
-            fig1.update_layout(
-                yaxis=dict(title='Số lượng nhà nhập khẩu', showgrid=False),
-                paper_bgcolor='rgb(252, 252, 252)', 
-                plot_bgcolor='rgb(252, 252, 252)',   
-                margin=dict(l=40, r=40, t=40, b=40),  # Thu hẹp phần nền lại
-                legend=dict(
-                    title_text='',
-                    orientation='h',
-                    yanchor='bottom',
-                    y=-0.3,
-                    xanchor='center',
-                    x=0.5
-                ),
-                xaxis=dict(title='Month/Year', showgrid=False),
-                yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', showgrid=False)
-            )
+            def build_export_purchasers():
+                # Count unique Purchasers per Month/Year for Export, with ring ratio
+                export_purchasers = query.view(dataset, 'counterpart_monthly', selected_product, direction='Export', role='Purchaser')
 
-            st.plotly_chart(fig1, use_container_width=True)
+                # Số doanh nghiệp khác nhau theo tháng không cộng được, khi gộp khoảng lấy trung bình các tháng
+                return figures.bar_ratio_figure(
+                    export_purchasers,
+                    [('Purchaser', 'Số lượng nhà nhập khẩu')],
+                    {'Purchaser': ('Ring Ratio', 'Ring Ratio')},
+                    'Số lượng nhà nhập khẩu',
+                    how='mean',
+                    width=chart_width,
+                )
+
+            show_chart('unique_purchasers', build_export_purchasers, direction='Export')
 
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Top 20 nhà nhập khẩu lớn nhất </h5>", unsafe_allow_html=True)
 
-            plot_top_20_with_hover(data, 'Export', 'Purchaser', 'Top 20 Purchasers by Total Amount (Export)', 'Destination')
+            plot_top_20_with_hover('Export', 'Purchaser', 'Top 20 Purchasers by Total Amount (Export)', 'Destination')
+
 
-            
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà xuất khẩu </h5>", unsafe_allow_html=True)
             # Đếm số lượng nhà cung cấp (unique)
-            unique_suppliers_count = export_data['Supplier'].nunique()
+            unique_suppliers_count = query.view(dataset, 'counterpart_total', selected_product, direction='Export', role='Supplier')
 
             # Hiển thị giá trị đó thông qua st.write
             st.write('Tổng số lượng nhà xuất khẩu:', unique_suppliers_count)
-            export_suppliers_vn = export_data.groupby('Month/Year')['Supplier'].nunique().reset_index()
 
-            # Calculate ring ratio for Export Suppliers in Vietnam
-            export_suppliers_vn['Ring Ratio'] = export_suppliers_vn['Supplier'].pct_change() * 100
-            export_suppliers_vn['Ring Ratio'] = export_suppliers_vn['Ring Ratio'].round(1)
+            def build_export_suppliers():
+                # Count unique Suppliers in Vietnam per Month/Year for Export, with ring ratio
+                export_suppliers_vn = query.view(dataset, 'counterpart_monthly', selected_product, direction='Export', role='Supplier')
 
-            # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-            export_suppliers_vn['Month/Year'] = export_suppliers_vn['Month/Year'].astype(str)
-
-            # Plot for Export Suppliers in Vietnam
-            fig = go.Figure()
-            fig.add_trace(go.Bar(x=export_suppliers_vn['Month/Year'], y=export_suppliers_vn['Supplier'], name='Số lượng nhà xuất khẩu', marker_color='rgb(31, 119, 180)'))
-            fig.add_trace(go.Scatter(x=export_suppliers_vn['Month/Year'], y=export_suppliers_vn['Ring Ratio'], name='Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-
-            fig.update_layout(
-                yaxis=dict(title='số lượng nhà xuất khẩu', showgrid=False),
-                paper_bgcolor='rgb(252, 252, 252)', 
-                plot_bgcolor='rgb(252, 252, 252)',   
-                margin=dict(l=40, r=40, t=40, b=40),  # Thu hẹp phần nền lại
-                legend=dict(
-                    title_text='',
-                    orientation='h',
-                    yanchor='bottom',
-                    y=-0.3,
-                    xanchor='center',
-                    x=0.5
-                ),
-                xaxis=dict(title='Month/Year', showgrid=False),
-                yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', showgrid=False)
-            )
+                # Số doanh nghiệp khác nhau theo tháng không cộng được, khi gộp khoảng lấy trung bình các tháng
+                return figures.bar_ratio_figure(
+                    export_suppliers_vn,
+                    [('Supplier', 'Số lượng nhà xuất khẩu')],
+                    {'Supplier': ('Ring Ratio', 'Ring Ratio')},
+                    'Số lượng nhà xuất khẩu',
+                    how='mean',
+                    width=chart_width,
+                )
 
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart('unique_suppliers', build_export_suppliers, direction='Export')
 
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Top 20 nhà xuất khẩu lớn nhất </h5>", unsafe_allow_html=True)
 
-            plot_top_20_with_hover(data, 'Export', 'Supplier', 'Top 20 Purchasers by Total Amount (Export)', 'Destination')
+            plot_top_20_with_hover('Export', 'Supplier', 'Top 20 Purchasers by Total Amount (Export)', 'Destination')
 
-            #Merge dữ liệu để lấy thông tin tài chính từ data_tctk
-            supplier_amounts = export_data.groupby(['Supplier', 'Supplier_code'])['Amount'].sum().reset_index()
-            supplier_amounts.rename(columns={'Amount': 'Total_Amount'}, inplace=True)
-
-            supplier_amounts_sorted = supplier_amounts.sort_values(by='Total_Amount', ascending=False)
-
-            top_20_suppliers = supplier_amounts_sorted.nlargest(20, 'Total_Amount')[['Supplier', 'Supplier_code']]
-
-            merged_data = top_20_suppliers.merge(data_tctk, left_on='Supplier_code', right_on='Mã số thuế', how='left')
-            
-            # filtered_data_tctk = data_tctk[data_tctk['Tên DN'].isin(merged_data)]
-
-            # Tạo bảng pivot table
-            pivot_table = pd.pivot_table(
-                merged_data,
-                columns=['Năm'],
-                values=['Doanh thu (triệu đồng)', 'Lợi nhuận (triệu đồng)', 'Số lao động (người)'],
-                aggfunc='sum', 
-                index=['Tên DN'],        
-            )
+            # Thông tin tài chính từ data_tctk theo mã số thuế của top 20 doanh nghiệp,
+            # tra cứu trực tiếp trong bảng pivot đã tính sẵn
+            pivot_table = query.view(dataset, 'company_financials', selected_product, direction='Export', role='Supplier', k=20)
             #Streamlit display
             st.write(pivot_table, use_container_width=True)
 
 
 
         elif selection == 'Việt Nam nhập khẩu từ các nước khác':
-            
-            st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà xuất khẩu </h5>", unsafe_allow_html=True)
 
-            # Chọn dữ liệu Import
-            import_data = data[data['Import/Export'] == 'Import']
+            st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà xuất khẩu </h5>", unsafe_allow_html=True)
 
             # Đếm số lượng nhà cung cấp (unique)
-            unique_suppliers_count = import_data['Supplier'].nunique()
+            unique_suppliers_count = query.view(dataset, 'counterpart_total', selected_product, direction='Import', role='Supplier')
 
             # Hiển thị giá trị đó thông qua st.write
             st.write('Tổng số lượng nhà xuất khẩu:', unique_suppliers_count)
 
-            # Group by Month/Year and count unique Suppliers for Import
-            import_suppliers = import_data.groupby('Month/Year')['Supplier'].nunique().reset_index()
-
-            # Calculate ring ratio for Import Suppliers
-            import_suppliers['Ring Ratio'] = import_suppliers['Supplier'].pct_change()
-
-            # Calculate ring ratio for Import Suppliers
-            import_suppliers['Ring Ratio'] = import_suppliers['Supplier'].pct_change() * 100
-            import_suppliers['Ring Ratio'] = import_suppliers['Ring Ratio'].round(1)
-
-            # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-            import_suppliers['Month/Year'] = import_suppliers['Month/Year'].astype(str)
-
-            # Plot for Import Suppliers
-            fig1 = go.Figure()
-            fig1.add_trace(go.Bar(x=import_suppliers['Month/Year'], y=import_suppliers['Supplier'], name='Số lượng nhà xuất khẩu', marker_color='rgb(31, 119, 180)'))
-            fig1.add_trace(go.Scatter(x=import_suppliers['Month/Year'], y=import_suppliers['Ring Ratio'], name='Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-
-            fig1.update_layout(
-                yaxis=dict(title='Số lượng nhà xuất khẩu', showgrid=False),
-                paper_bgcolor='rgb(252, 252, 252)', 
-                plot_bgcolor='rgb(252, 252, 252)',   
-                margin=dict(l=40, r=40, t=40, b=40),  # Thu hẹp phần nền lại
-                legend=dict(
-                    title_text='',
-                    orientation='h',
-                    yanchor='bottom',
-                    y=-0.3,
-                    xanchor='center',
-                    x=0.5
-                ),
-                xaxis=dict(title='Month/Year', showgrid=False),
-                yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', showgrid=False)
-            )
+            def build_import_suppliers():
+                # Count unique Suppliers per Month/Year for Import, with ring ratio
+                import_suppliers = query.view(dataset, 'counterpart_monthly', selected_product, direction='Import', role='Supplier')
+
+                # Số doanh nghiệp khác nhau theo tháng không cộng được, khi gộp khoảng lấy trung bình các tháng
+                return figures.bar_ratio_figure(
+                    import_suppliers,
+                    [('Supplier', 'Số lượng nhà xuất khẩu')],
+                    {'Supplier': ('Ring Ratio', 'Ring Ratio')},
+                    'Số lượng nhà xuất khẩu',
+                    how='mean',
+                    width=chart_width,
+                )
 
-            st.plotly_chart(fig1, use_container_width=True)
+            show_chart('unique_suppliers', build_import_suppliers, direction='Import')
 
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Top 20 nhà xuất khẩu lớn nhất </h5>", unsafe_allow_html=True)
 
-            plot_top_20_with_hover(data, 'Import', 'Supplier', 'Top 20 Suppliers by Total Amount (Import)', 'Destination')
+            plot_top_20_with_hover('Import', 'Supplier', 'Top 20 Suppliers by Total Amount (Import)', 'Destination')
 
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tổng số lượng nhà nhập khẩu </h5>", unsafe_allow_html=True)
-            
+
             # Đếm số lượng nhà nhập khẩu (unique)
-            unique_purchasers_count = import_data['Purchaser'].nunique()
+            unique_purchasers_count = query.view(dataset, 'counterpart_total', selected_product, direction='Import', role='Purchaser')
 
             # Hiển thị giá trị đó thông qua st.write
             st.write('Tổng số lượng nhà nhập khẩu:', unique_purchasers_count)
 
-            import_purchasers = import_data.groupby('Month/Year')['Purchaser'].nunique().reset_index()
-
-            # Calculate ring ratio for Import Purchasers
-            import_purchasers['Ring Ratio'] = import_purchasers['Purchaser'].pct_change() * 100
-            import_purchasers['Ring Ratio'] = import_purchasers['Ring Ratio'].round(1)
-
-            # Chuyển đổi cột 'Month/Year' thành chuỗi để Plotly có thể xử lý
-            import_purchasers['Month/Year'] = import_purchasers['Month/Year'].astype(str)
-
-            # Plot for Import Purchasers
-            fig2 = go.Figure()
-            fig2.add_trace(go.Bar(x=import_purchasers['Month/Year'], y=import_purchasers['Purchaser'], name='Số lượng nhà nhập khẩu', marker_color='rgb(31, 119, 180)'))
-            fig2.add_trace(go.Scatter(x=import_purchasers['Month/Year'], y=import_purchasers['Ring Ratio'], name='Ring Ratio', line=dict(color='rgb(255, 0, 0)', width=2), yaxis='y2'))
-
-            fig2.update_layout(
-                yaxis=dict(title='Số lượng nhà nhập khẩu', showgrid=False),
-                paper_bgcolor='rgb(252, 252, 252)', 
-                plot_bgcolor='rgb(252, 252, 252)',   
-                margin=dict(l=40, r=40, t=40, b=40),  # Thu hẹp phần nền lại
-                legend=dict(
-                    title_text='',
-                    orientation='h',
-                    yanchor='bottom',
-                    y=-0.3,
-                    xanchor='center',
-                    x=0.5
-                ),
-                xaxis=dict(title='Month/Year', showgrid=False),
-                yaxis2=dict(title='Ring Ratio (%)', overlaying='y', side='right', tickformat='.1f', showgrid=False)
-            )
+            def build_import_purchasers():
+                # Count unique Purchasers per Month/Year for Import, with ring ratio
+                import_purchasers = query.view(dataset, 'counterpart_monthly', selected_product, direction='Import', role='Purchaser')
 
-            st.plotly_chart(fig2, use_container_width=True)
+                # Số doanh nghiệp khác nhau theo tháng không cộng được, khi gộp khoảng lấy trung bình các tháng
+                return figures.bar_ratio_figure(
+                    import_purchasers,
+                    [('Purchaser', 'Số lượng nhà nhập khẩu')],
+                    {'Purchaser': ('Ring Ratio', 'Ring Ratio')},
+                    'Số lượng nhà nhập khẩu',
+                    how='mean',
+                    width=chart_width,
+                )
+
+            show_chart('unique_purchasers', build_import_purchasers, direction='Import')
 
             st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Top 20 nhà nhập khẩu lớn nhất </h5>", unsafe_allow_html=True)
 
-            plot_top_20_with_hover(data, 'Import', 'Purchaser', 'Top 20 Purchasers by Total Amount (Import)', 'Destination')
+            plot_top_20_with_hover('Import', 'Purchaser', 'Top 20 Purchasers by Total Amount (Import)', 'Destination')
+
+            # Thông tin tài chính từ data_tctk theo mã số thuế của top 20 doanh nghiệp,
+            # tra cứu trực tiếp trong bảng pivot đã tính sẵn
+            pivot_table = query.view(dataset, 'company_financials', selected_product, direction='Import', role='Purchaser', k=20)
+            #Streamlit display
+            st.write(pivot_table, use_container_width=True)
+
+        # Doanh nghiệp nước ngoài tăng trưởng nhanh nhất (3 tháng gần nhất so với 3 tháng trước), tính một lần cho mọi doanh nghiệp
+        if selection == 'Việt Nam xuất khẩu đến các nước khác':
+            growth_direction, growth_role, growth_label = 'Export', 'Purchaser', 'nhà nhập khẩu'
+        else:
+            growth_direction, growth_role, growth_label = 'Import', 'Supplier', 'nhà xuất khẩu'
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Top 10 {growth_label} tăng trưởng nhanh nhất (3 tháng gần nhất so với 3 tháng trước)</h5>", unsafe_allow_html=True)
+        st.dataframe(query.view(dataset, 'company_growth', selected_product, direction=growth_direction, role=growth_role), hide_index=True, use_container_width=True)
+
+        # Mạng lưới giao dịch: đọc ma trận kề Supplier–Purchaser–quốc gia đã xây khi ingest (graph.py)
+        domestic_role = graph.other_role(growth_role)
+        domestic_label = 'nhà xuất khẩu' if domestic_role == 'Supplier' else 'nhà nhập khẩu'
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Mạng lưới giao dịch của {domestic_label} Việt Nam</h5>", unsafe_allow_html=True)
+        network_companies = query.view(dataset, 'network_companies', selected_product, direction=growth_direction, role=domestic_role)
+        if network_companies:
+            company = st.selectbox(f'Chọn {domestic_label} Việt Nam', network_companies, key='network_company')
+            st.write(f'Các {growth_label} của doanh nghiệp (Competitors: số {domestic_label} Việt Nam khác cùng giao dịch với đối tác)')
+            st.dataframe(query.counterparts(dataset, selected_product, growth_direction, domestic_role, company), hide_index=True, use_container_width=True)
+            st.write(f'Các {domestic_label} Việt Nam có chung {growth_label} với doanh nghiệp')
+            shared = query.shared_counterparts(dataset, selected_product, growth_direction, domestic_role, company)
+            if shared.empty:
+                st.write(f"Không có doanh nghiệp nào có chung {growth_label}")
+            else:
+                st.dataframe(shared, hide_index=True, use_container_width=True)
+
+        # HHI = tổng bình phương tỷ trọng Amount theo quốc gia; 1 = chỉ giao dịch với một quốc gia
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>{domestic_label.capitalize()} Việt Nam phụ thuộc nhiều nhất vào một thị trường (HHI theo quốc gia)</h5>", unsafe_allow_html=True)
+        concentration = query.view(dataset, 'concentration', selected_product, direction=growth_direction, role=domestic_role)
+        if concentration.empty:
+            st.write(f"Không có {domestic_label} nào có từ {graph.MIN_COUNT} giao dịch trở lên và có giá trị giao dịch")
+        else:
+            st.dataframe(concentration, hide_index=True, use_container_width=True)
+
+
+    @st.fragment
+    @telemetry.timed("PHẦN 4")
+    def search_section():
+        # Tìm theo chỉ mục từ khoá/trigram xây sẵn cùng ảnh chụp dữ liệu, không quét chuỗi trên từng dòng
+        direction = st.selectbox('Chọn giá trị Import/Export', cube['Import/Export'].unique(), key='search_direction')
+
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tìm giao dịch theo mô tả hàng hoá</h5>", unsafe_allow_html=True)
+        text = st.text_input('Từ khoá (không cần dấu; thêm "-" trước từ để loại trừ, vd. "xoai lat -duong")', key='search_text')
+        if text.strip():
+            descriptions = query.search_descriptions(dataset, selected_product, text, direction)
+            st.write('Số giao dịch khớp:', int(descriptions['count'].sum()))
+            st.write('Tổng giá trị giao dịch:', round(descriptions['Amount'].sum(), 2))
+            st.dataframe(descriptions.head(50), hide_index=True, use_container_width=True)
+
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Tìm doanh nghiệp (gần đúng theo tên)</h5>", unsafe_allow_html=True)
+        role = st.radio('Doanh nghiệp', query.ROLES, horizontal=True, key='search_role')
+        name = st.text_input('Tên doanh nghiệp', key='search_company')
+        if name.strip():
+            companies = query.search_companies(dataset, selected_product, name, role, direction)
+            if companies.empty:
+                st.write("Không tìm thấy doanh nghiệp phù hợp")
+            else:
+                st.dataframe(companies, hide_index=True, use_container_width=True)
 
-            #Merge dữ liệu để lấy thông tin tài chính từ data_tctk
-            supplier_amounts = import_data.groupby(['Purchaser', 'Purchaser_code'])['Amount'].sum().reset_index()
-            supplier_amounts.rename(columns={'Amount': 'Total_Amount'}, inplace=True)
 
-            supplier_amounts_sorted = supplier_amounts.sort_values(by='Total_Amount', ascending=False)
+    PRICE_BASES = {
+        'Quantity': 'Theo số lượng (Amount / Quantity)',
+        'Weight': 'Theo khối lượng (Amount / Weight)',
+    }
+    ALL_COUNTRIES = 'Tất cả quốc gia'
 
-            top_20_suppliers = supplier_amounts_sorted.nlargest(20, 'Total_Amount')[['Purchaser', 'Purchaser_code']]
+    @st.fragment
+    @telemetry.timed("PHẦN 5")
+    def price_section():
+        # Phân bố đơn giá theo (sản phẩm, chiều giao dịch, quốc gia, tháng) đã tính sẵn khi ingest:
+        # trang chỉ đọc bảng thống kê, không tính phân vị khi người dùng thao tác
+        col1, col2 = st.columns(2)
+        with col1:
+            direction = st.selectbox('Chọn giá trị Import/Export', cube['Import/Export'].unique(), key='price_direction')
+        with col2:
+            country = st.selectbox('Chọn quốc gia', [ALL_COUNTRIES] + list(cube['Destination'].dropna().unique()), key='price_country')
+        basis = st.radio('Đơn giá', list(PRICE_BASES), format_func=PRICE_BASES.get, horizontal=True, key='price_basis')
+        destination = None if country == ALL_COUNTRIES else country
 
-            merged_data = top_20_suppliers.merge(data_tctk, left_on='Purchaser_code', right_on='Mã số thuế', how='left')
-            
-            # filtered_data_tctk = data_tctk[data_tctk['Tên DN'].isin(merged_data)]
+        prices = query.view(dataset, 'unit_prices', selected_product, direction=direction, basis=basis, destination=destination)
+        if prices.empty:
+            st.write("Không có giao dịch có đủ Amount và " + basis + " để tính đơn giá")
+            return
 
-            # Tạo bảng pivot table
-            pivot_table = pd.pivot_table(
-                merged_data,
-                columns=['Năm'],
-                values=['Doanh thu (triệu đồng)', 'Lợi nhuận (triệu đồng)', 'Số lao động (người)'],
-                aggfunc='sum', 
-                index=['Tên DN'],        
-            )
-            #Streamlit display
-            st.write(pivot_table, use_container_width=True)
-else:
-    st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Hiện tại chưa có dữ liệu</h5>", unsafe_allow_html=True)
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Đơn giá theo tháng (trung vị và khoảng tứ phân vị)</h5>", unsafe_allow_html=True)
+
+        def build_prices():
+            return figures.price_band_figure(prices, f'Đơn giá (Amount / {basis})', width=chart_width)
+
+        show_chart(f'unit_prices_{basis}', build_prices, direction=direction, country=destination)
+
+        st.write('Số giao dịch có đơn giá:', int(prices['count'].sum()), '— đánh dấu bất thường:', int(prices['outliers'].sum()))
+        st.dataframe(prices, hide_index=True, use_container_width=True)
+
+        # Giao dịch bất thường: |0.6745 * (đơn giá - trung vị) / MAD| > 3.5 trong nhóm (quốc gia, tháng) của giao dịch
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Giao dịch có đơn giá bất thường</h5>", unsafe_allow_html=True)
+        outliers = query.view(dataset, 'price_outliers', selected_product, direction=direction, basis=basis, destination=destination)
+        if outliers.empty:
+            st.write("Không có giao dịch bất thường")
+        else:
+            st.dataframe(outliers, hide_index=True, use_container_width=True)
+
+
+    MEASURE_LABELS = {
+        'Amount': 'Giá trị giao dịch',
+        'count': 'Số lượng giao dịch',
+        'Quantity': 'Số lượng hàng',
+        'Weight': 'Khối lượng',
+    }
+
+    @st.fragment
+    @telemetry.timed("So sánh")
+    def comparison_section(products):
+        st.markdown("<h3 style='font-weight: bold;color:#AD2A1A;'>So sánh giữa các sản phẩm</h3>", unsafe_allow_html=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            direction = st.selectbox('Chọn giá trị Import/Export', query.DIRECTIONS[::-1], key='compare_direction')
+        with col2:
+            measure = st.selectbox('Chọn chỉ tiêu', list(MEASURE_LABELS), format_func=MEASURE_LABELS.get, key='compare_measure')
+        role = st.radio('Doanh nghiệp', query.ROLES, horizontal=True, key='compare_role')
+
+        # Một lần tính cho mọi sản phẩm: chuỗi theo tháng, tổng theo quốc gia và top doanh nghiệp
+        comparison = query.compare(dataset, products, measure, direction, role, k=10)
+        key = tuple(products)
+
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>{MEASURE_LABELS[measure]} theo tháng</h5>", unsafe_allow_html=True)
+
+        def build_monthly():
+            monthly = comparison['monthly']
+            return figures.line_figure(monthly, list(products), MEASURE_LABELS[measure], width=chart_width)
+
+        show_chart(f'compare_monthly_{measure}', build_monthly, direction=direction, product=key)
+
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Giá trị giao dịch của top 10 quốc gia</h5>", unsafe_allow_html=True)
+
+        def build_countries():
+            countries = comparison['countries']
+            fig = go.Figure()
+            for product in products:
+                fig.add_trace(go.Bar(x=figures.values(countries[product]), y=countries['Destination'].to_numpy(), name=product, orientation='h'))
+            fig.update_layout(template=figures.template(), barmode='group', yaxis=dict(autorange='reversed'))
+            return fig
+
+        show_chart('compare_countries', build_countries, direction=direction, product=key)
+
+        st.markdown(f"<h5 style='font-weight: bold;color:#AD2A1A;'>Top 10 {role} theo từng sản phẩm</h5>", unsafe_allow_html=True)
+
+        # Các sản phẩm hiển thị cạnh nhau, mỗi sản phẩm một cột
+        for column, product in zip(st.columns(len(products)), products):
+            with column:
+                st.markdown(f"**{product}**")
+                top = comparison['top_companies'][product]
+                if top.empty:
+                    st.write("Không có dữ liệu")
+                    continue
+
+                def build_top(top=top):
+                    return figures.top_bar_figure(top, 'Amount', role, showscale=False, margin=10)
+
+                show_chart(f'compare_top_{role}', build_top, direction=direction, product=product)
+
+
+    SECTIONS = {
+        "PHẦN 1 - PHÂN TÍCH TOÀN THỊ TRƯỜNG": market_section,
+        "PHẦN 2 - PHÂN TÍCH THEO TỪNG QUỐC GIA": country_section,
+        "PHẦN 3 - PHÂN TÍCH THEO NHÀ NHẬP KHẨU/NHÀ XUẤT KHẨU": company_section,
+        "PHẦN 4 - TÌM KIẾM GIAO DỊCH VÀ DOANH NGHIỆP": search_section,
+        "PHẦN 5 - PHÂN TÍCH ĐƠN GIÁ": price_section,
+    }
+
+    if compare_mode:
+        if compared_products:
+            comparison_section(compared_products)
+        else:
+            st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Chọn ít nhất một sản phẩm để so sánh</h5>", unsafe_allow_html=True)
+    elif total_amount != 0:
+        selected_section = st.sidebar.radio("Chọn phần phân tích", list(SECTIONS))
+        st.markdown(f"<h4 style='font-weight: bold;color:firebrick;'>{selected_section}</h4>", unsafe_allow_html=True)
+        SECTIONS[selected_section]()
+    else:
+        st.markdown("<h5 style='font-weight: bold;color:#AD2A1A;'>Hiện tại chưa có dữ liệu</h5>", unsafe_allow_html=True)
 
     #st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,240 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import search
+
+# Gộp các biến thể tên của cùng một doanh nghiệp (chính tả, hoa thường, dấu, loại hình "Co., Ltd"...)
+# thành một mã doanh nghiệp chuẩn. Không so sánh mọi cặp tên: tên chỉ được so với các tên cùng khối
+# (blocking), và trong khối chỉ với WINDOW tên liền kề sau khi sắp xếp (sorted neighbourhood), nên số cặp
+# cần so là O(n * WINDOW). Độ tương đồng là cosine của TF-IDF n-gram ký tự, tính cho mọi cặp cùng lúc.
+
+# Cột mã số thuế đi kèm mỗi cột tên doanh nghiệp
+ROLES = {"Purchaser": "Purchaser_code", "Supplier": "Supplier_code"}
+
+# Mã của dòng không có mã số thuế (như store.MISSING_TAX_CODE)
+MISSING_CODE = "0000000000"
+
+# Các từ chỉ loại hình doanh nghiệp, bỏ khi so sánh tên
+LEGAL_WORDS = {
+    "co", "company", "corp", "corporation", "inc", "incorporated", "ltd", "limited", "llc", "llp", "lp",
+    "plc", "jsc", "gmbh", "ag", "bv", "sa", "srl", "sro", "pty", "pte", "bhd", "sdn", "ooo", "uab", "the",
+    "cong", "ty", "tnhh", "mtv", "cp", "dntn", "tm", "xnk", "ооо", "тов", "зао", "оао",
+}
+
+# Hai tên là cùng doanh nghiệp khi cosine >= STRICT_THRESHOLD (lỗi chính tả, dấu cách), hoặc cosine >= THRESHOLD
+# và các từ của tên ngắn hơn đều có trong tên dài hơn (thiếu tên đệm, thêm địa danh...). Chỉ dùng cosine
+# thì tên người như "Nguyen Uyen"/"Nguyen Nguyen" bị gộp nhầm.
+THRESHOLD = 0.8
+STRICT_THRESHOLD = 0.9
+# Hai tên người (is_person_name) chỉ được gộp khi có cùng các từ (không kể thứ tự, kể cả số lần lặp),
+# hoặc cùng số từ và cosine >= PERSON_THRESHOLD (lỗi chính tả trong một từ). Tên người ngắn trùng họ hoặc
+# tên ("Nguyen Dinh Nguyen"/"Nguyen Nguyen", "Le My Le"/"My Le") thường là hai người khác nhau.
+PERSON_MAX_WORDS = 4
+PERSON_THRESHOLD = 0.95
+# Số tên liền kề (theo thứ tự tên chuẩn hoá trong cùng khối) được so với mỗi tên
+WINDOW = 20
+# Số cặp tính cosine mỗi lần (giới hạn bộ nhớ của các dòng TF-IDF được lấy ra)
+PAIR_CHUNK = 100_000
+
+
+def name_key(name):
+    # Tên đã chuẩn hoá (không dấu, chữ thường) và bỏ từ chỉ loại hình; tên chỉ gồm các từ đó giữ nguyên
+    tokens = search.tokenize(name)
+    core = [token for token in tokens if token not in LEGAL_WORDS]
+    return " ".join(core or tokens)
+
+
+def is_person_name(name):
+    # Tên dạng tên người: không có từ chỉ loại hình doanh nghiệp và không quá PERSON_MAX_WORDS từ
+    tokens = search.tokenize(name)
+    return 0 < len(tokens) <= PERSON_MAX_WORDS and not any(token in LEGAL_WORDS for token in tokens)
+
+
+def blocking_keys(keys):
+    # Các cách chia khối: từ hiếm nhất của tên (có trong ít tên nhất của cả danh sách) và hai từ đầu tiên
+    # của tên chuẩn hoá. Hai biến thể chỉ được so sánh khi trùng ít nhất một khoá.
+    words = keys.str.split()
+    frequency = Counter(word for name_words in words for word in set(name_words))
+    rarest = [min(name_words, key=lambda word: (frequency[word], word)) if name_words else "" for name_words in words]
+    return {
+        "rarest": pd.Series(rarest, index=keys.index),
+        "first_two": words.str[:2].str.join(" ").fillna(""),
+    }
+
+
+class UnionFind:
+    # Gộp nhóm có kiểm tra mã số thuế: không gộp hai nhóm đã có hai mã hợp lệ khác nhau
+    def __init__(self, codes):
+        self.parent = np.arange(len(codes))
+        self.codes = list(codes)
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return True
+        code_a, code_b = self.codes[a], self.codes[b]
+        if code_a != MISSING_CODE and code_b != MISSING_CODE and code_a != code_b:
+            return False
+        if b < a:
+            a, b = b, a
+            code_a, code_b = code_b, code_a
+        self.parent[b] = a
+        self.codes[a] = code_a if code_a != MISSING_CODE else code_b
+        return True
+
+    def roots(self):
+        return np.array([self.find(i) for i in range(len(self.parent))])
+
+
+def candidate_pairs(blocks, keys, window=WINDOW):
+    # Các cặp (i, j) cùng khối và cách nhau không quá window vị trí khi sắp xếp theo (khối, tên chuẩn hoá).
+    # Khối nhỏ hơn window + 1 tên được so đủ mọi cặp; khối lớn không làm số cặp tăng theo bình phương.
+    pairs = []
+    for block in blocks.values():
+        valid = block.to_numpy() != ""
+        order = np.lexsort((keys.to_numpy()[valid], block.to_numpy()[valid]))
+        members = np.flatnonzero(valid)[order]
+        labels = block.to_numpy()[members]
+        for distance in range(1, min(window, len(members) - 1) + 1):
+            same = labels[:-distance] == labels[distance:]
+            pairs.append(np.column_stack([members[:-distance][same], members[distance:][same]]))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    # Bỏ cặp trùng (cùng cặp ở cả hai cách chia khối) bằng một khoá số nguyên cho mỗi cặp
+    pairs = np.sort(np.concatenate(pairs), axis=1).astype(np.int64)
+    codes = np.unique(pairs[:, 0] * len(keys) + pairs[:, 1])
+    return np.column_stack([codes // len(keys), codes % len(keys)])
+
+
+def similarities(vectors, pairs):
+    # Cosine của từng cặp (vectors đã chuẩn hoá L2): tích từng phần tử của hai dòng rồi cộng theo dòng
+    scores = np.empty(len(pairs))
+    for start in range(0, len(pairs), PAIR_CHUNK):
+        chunk = pairs[start:start + PAIR_CHUNK]
+        scores[start:start + len(chunk)] = np.asarray(vectors[chunk[:, 0]].multiply(vectors[chunk[:, 1]]).sum(axis=1)).ravel()
+    return scores
+
+
+def same_order(words_a, words_b):
+    # Các từ chung của hai tên xuất hiện theo cùng thứ tự (n-gram ký tự không phân biệt thứ tự từ,
+    # nên "Grand Harvest Global" và "Harvest Global Grand" có cosine gần 1 dù là hai doanh nghiệp khác nhau)
+    common = set(words_a) & set(words_b)
+    return [word for word in words_a if word in common] == [word for word in words_b if word in common]
+
+
+def same_company(key_a, key_b, score, threshold=THRESHOLD, person=False):
+    # person: cả hai tên đều là tên người (thứ tự họ/tên có thể đảo: "Anh Nguyen"/"Nguyen Anh")
+    # Đếm cả số lần lặp của từ: "Nguyen Nguyen" không nằm trong "Huyen Nguyen"
+    words_a, words_b = key_a.split(), key_b.split()
+    counts_a, counts_b = Counter(words_a), Counter(words_b)
+    if person:
+        return counts_a == counts_b or (len(words_a) == len(words_b) and score >= max(threshold, PERSON_THRESHOLD))
+    if not same_order(words_a, words_b):
+        return False
+    if score >= max(threshold, STRICT_THRESHOLD):
+        return True
+    return not counts_a - counts_b or not counts_b - counts_a
+
+
+def name_table(pairs):
+    # Một dòng cho mỗi tên: mã số thuế hợp lệ xuất hiện nhiều nhất (hoặc mã thiếu) và tổng số giao dịch
+    pairs = pairs[pairs["name"].notna()].copy()
+    pairs["name"] = pairs["name"].astype(str)
+    pairs["code"] = pairs["code"].fillna(MISSING_CODE).astype(str)
+    counts = pairs.groupby("name")["count"].sum()
+    valid = pairs[pairs["code"] != MISSING_CODE].sort_values(["count", "code"], ascending=[False, True])
+    codes = valid.drop_duplicates("name").set_index("name")["code"]
+    return pd.DataFrame({
+        "name": counts.index,
+        "code": codes.reindex(counts.index).fillna(MISSING_CODE).to_numpy(),
+        "count": counts.to_numpy(),
+    })
+
+
+def resolve(pairs, threshold=THRESHOLD):
+    # pairs: DataFrame [name, code, count] gồm các cặp (tên, mã số thuế) khác nhau và số giao dịch.
+    # Trả về bảng [name, code, company_id, canonical, tax_code, count]: code là mã của riêng tên đó,
+    # tên chuẩn là biến thể có nhiều giao dịch nhất, tax_code là mã hợp lệ của nhóm (để điền cho các dòng thiếu mã).
+    names = name_table(pairs)
+    if names.empty:
+        return pd.DataFrame(columns=["name", "code", "company_id", "canonical", "tax_code", "count"])
+    keys = names["name"].map(name_key)
+    person = names["name"].map(is_person_name).to_numpy()
+    groups = UnionFind(names["code"])
+
+    # Cùng mã số thuế hợp lệ hoặc cùng tên chuẩn hoá: gộp trực tiếp, không cần tính độ tương đồng
+    for column in (names["code"].where(names["code"] != MISSING_CODE), keys.where(keys != "")):
+        for members in pd.Series(np.arange(len(names))).groupby(column.to_numpy(), sort=False).indices.values():
+            for other in members[1:]:
+                groups.union(members[0], other)
+
+    # Tên gần giống nhau trong cùng khối
+    vectors = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True).fit_transform(keys)
+    pairs = candidate_pairs(blocking_keys(keys), keys)
+    scores = similarities(vectors, pairs)
+    keep = scores >= threshold
+    for (a, b), score in zip(pairs[keep], scores[keep]):
+        if same_company(keys[a], keys[b], score, threshold, person[a] and person[b]):
+            groups.union(a, b)
+
+    names["root"] = groups.roots()
+    names["tax_code"] = [groups.codes[root] for root in names["root"]]
+    ranked = names.sort_values(["count", "name"], ascending=[False, True])
+    canonical = ranked.drop_duplicates("root").set_index("root")["name"]
+    names["canonical"] = canonical.reindex(names["root"]).to_numpy()
+    # Mã doanh nghiệp theo thứ tự tổng số giao dịch giảm dần
+    totals = names.groupby("root")["count"].sum().sort_values(ascending=False, kind="stable")
+    names["company_id"] = pd.Series(np.arange(len(totals)), index=totals.index).reindex(names["root"]).to_numpy()
+    return names[["name", "code", "company_id", "canonical", "tax_code", "count"]].sort_values(["company_id", "name"], ignore_index=True)
+
+
+class CompanyResolution:
+    # Bảng doanh nghiệp chuẩn của từng vai trò (Purchaser/Supplier), dùng khi tính mọi tổng hợp:
+    # tên được thay bằng tên chuẩn, dòng thiếu mã số thuế nhận mã của nhóm
+    def __init__(self, tables):
+        self.tables = {role: table.set_index("name") for role, table in tables.items()}
+
+    @classmethod
+    def build(cls, pairs, threshold=THRESHOLD):
+        return cls({role: resolve(frame, threshold) for role, frame in pairs.items()})
+
+    def companies(self, role):
+        return self.tables[role].reset_index()
+
+    def code_map(self, role, categories):
+        # Mã tên chuẩn cho mỗi giá trị trong từ điển categories (tên chưa có trong bảng giữ nguyên),
+        # kèm từ điển tên chuẩn; phần tử cuối của mảng mã là -1 cho giá trị thiếu
+        categories = pd.Index(categories)
+        canonical = self.tables[role]["canonical"].reindex(categories.astype(str))
+        canonical = canonical.fillna(pd.Series(categories.astype(str), index=canonical.index))
+        codes, uniques = pd.factorize(canonical.to_numpy())
+        return np.append(codes, -1), pd.Index(uniques)
+
+    def apply(self, data):
+        # Trả về bản sao của lô với tên chuẩn và mã số thuế đã điền; các cột khác không đổi
+        changes = {}
+        for role, code_column in ROLES.items():
+            if role not in data.columns or role not in self.tables:
+                continue
+            values = data[role]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("category")
+            mapping, canonical = self.code_map(role, values.cat.categories)
+            codes = values.cat.codes.to_numpy()
+            changes[role] = pd.Categorical.from_codes(mapping[codes], categories=canonical)
+            if code_column in data.columns:
+                cluster_codes = self.tables[role]["tax_code"].reindex(values.cat.categories.astype(str)).to_numpy()
+                row_codes = np.append(cluster_codes, None)[codes]
+                current = data[code_column].astype("object").to_numpy()
+                fill = (current == MISSING_CODE) & pd.notna(row_codes) & (row_codes != MISSING_CODE)
+                changes[code_column] = pd.Categorical(np.where(fill, row_codes, current))
+        return data.assign(**changes)
@@ -0,0 +1,226 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+import telemetry
+import timeseries
+
+# Dựng hình plotly với dữ liệu gửi xuống trình duyệt gọn nhất có thể:
+#   - mọi hình dùng chung một mẫu (template) nhỏ chỉ chứa phần giao diện chung (nền, lề, legend, font),
+#     thay cho mẫu mặc định của plotly/Streamlit lặp lại đầy đủ trong JSON của từng hình;
+#   - chuỗi thời gian dài được gộp thành các khoảng liên tiếp trên server, số cột/điểm không vượt quá
+#     số điểm ảnh của vùng vẽ cho phép (max_points);
+#   - mảng số được đưa vào hình dưới dạng mảng numpy, plotly mã hoá thành base64 nhị phân ({"dtype", "bdata"})
+#     thay vì danh sách số dạng văn bản.
+
+# Độ rộng mặc định của vùng vẽ (px, khi không biết độ rộng màn hình) và số px tối thiểu cho mỗi cột/điểm
+DEFAULT_WIDTH = 1200
+PIXELS_PER_POINT = 4
+MIN_POINTS = 24
+BACKGROUND = "rgb(252, 252, 252)"
+# Màu cột và màu đường Ring Ratio của từng chuỗi; chuỗi khác (vd. số doanh nghiệp) dùng màu của Import
+SERIES_COLORS = {
+    "Import": ("rgb(31, 119, 180)", "rgb(255, 0, 0)"),
+    "Export": ("rgb(255, 127, 14)", "rgb(0, 128, 0)"),
+}
+TOP_COLORSCALE = "Viridis_r"
+
+# Mẫu gọn theo tên mẫu mặc định đang dùng (Streamlit đặt mẫu "streamlit" khi được import)
+templates = {}
+
+
+def template():
+    # Giữ colorway của mẫu mặc định (mẫu "streamlit" dùng mã màu giữ chỗ, frontend thay bằng màu của theme)
+    base = pio.templates.default
+    if base not in templates:
+        colorway = pio.templates[base].layout.colorway if base in pio.templates else None
+        templates[base] = go.layout.Template(layout=dict(
+            colorway=colorway,
+            paper_bgcolor=BACKGROUND,
+            plot_bgcolor=BACKGROUND,
+            margin=dict(l=40, r=40, t=40, b=40),
+            legend=dict(title_text="", orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+            font=dict(family="Arial", size=12, color="Black"),
+            xaxis=dict(showgrid=False),
+            yaxis=dict(showgrid=False),
+        ))
+    return templates[base]
+
+
+def max_points(width=None):
+    # Số cột/điểm tối đa của một chuỗi cho vùng vẽ rộng width px
+    return max(MIN_POINTS, int((width or DEFAULT_WIDTH) / PIXELS_PER_POINT))
+
+
+def values(series):
+    # Mảng numpy kiểu số để plotly mã hoá nhị phân (cột object/nullable được đổi sang float, thiếu thành NaN)
+    array = np.asarray(series)
+    if array.dtype.kind not in "biuf":
+        array = np.asarray(series, dtype=np.float64)
+    return array
+
+
+def bucket(frame, columns, limit, x="Month/Year", how="sum"):
+    # Gộp các dòng liên tiếp thành tối đa limit khoảng bằng nhau: cột số theo how (sum cho tổng, mean cho
+    # số doanh nghiệp khác nhau vốn không cộng được), nhãn x là "đầu–cuối" của khoảng. Chuỗi ngắn giữ nguyên.
+    if len(frame) <= limit:
+        return frame, False
+    size = math.ceil(len(frame) / limit)
+    groups = np.arange(len(frame)) // size
+    result = frame[columns].groupby(groups).agg(how)
+    labels = frame[x].astype(str).to_numpy()
+    first = labels[::size]
+    last = labels[np.minimum(np.arange(size - 1, len(frame) + size - 1, size), len(frame) - 1)]
+    result.insert(0, x, [start if start == end else f"{start}–{end}" for start, end in zip(first, last)])
+    return result.reset_index(drop=True), True
+
+
+def bar_ratio_figure(frame, bars, ratios, y_title, x="Month/Year", how="sum", width=None, legend_y=-0.3):
+    # Cột theo thời gian kèm đường Ring Ratio (%) trên trục phụ bên phải.
+    # bars: [(cột, tên hiển thị)]; ratios: {cột: (cột Ring Ratio, tên đường)}.
+    # Khi chuỗi bị gộp khoảng, Ring Ratio được tính lại trên các khoảng thay vì lấy từ frame.
+    columns = [column for column, _ in bars]
+    frame, bucketed = bucket(frame, columns, max_points(width), x, how)
+    fig = go.Figure()
+    for column, name in bars:
+        fig.add_trace(go.Bar(x=frame[x].to_numpy(), y=values(frame[column]), name=name,
+                             marker_color=SERIES_COLORS.get(column, SERIES_COLORS["Import"])[0]))
+    for column, name in bars:
+        if column not in ratios:
+            continue
+        ratio_column, ratio_name = ratios[column]
+        ratio = timeseries.ring_ratio(frame[column].astype(np.float64)) if bucketed else frame[ratio_column]
+        fig.add_trace(go.Scatter(x=frame[x].to_numpy(), y=values(ratio), name=ratio_name, yaxis="y2",
+                                 line=dict(color=SERIES_COLORS.get(column, SERIES_COLORS["Import"])[1], width=2)))
+    fig.update_layout(
+        template=template(),
+        legend_y=legend_y,
+        xaxis_title=x,
+        yaxis=dict(title=y_title, title_standoff=10),
+        yaxis2=dict(title="Ring Ratio (%)", overlaying="y", side="right", tickformat=".1f", title_standoff=10, showgrid=False),
+    )
+    return fig
+
+
+def line_figure(frame, columns, y_title, x="Month/Year", how="sum", width=None):
+    # Mỗi cột một đường theo thời gian (vd. so sánh sản phẩm), gộp khoảng như bar_ratio_figure
+    frame, _ = bucket(frame, columns, max_points(width), x, how)
+    fig = go.Figure()
+    for column in columns:
+        fig.add_trace(go.Scatter(x=frame[x].to_numpy(), y=values(frame[column]), name=column, mode="lines+markers"))
+    fig.update_layout(template=template(), xaxis_title=x, yaxis_title=y_title)
+    return fig
+
+
+def price_band_figure(frame, y_title, x="Month/Year", width=None):
+    # Trung vị đơn giá theo thời gian trong dải tứ phân vị (q1–q3); khi gộp khoảng lấy trung vị của các tháng
+    frame, _ = bucket(frame, ["median", "q1", "q3"], max_points(width), x, how="median")
+    months = frame[x].to_numpy()
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=months, y=values(frame["q3"]), name="Q3", mode="lines", line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(x=months, y=values(frame["q1"]), name="Q1–Q3", mode="lines", line=dict(width=0),
+                             fill="tonexty", fillcolor="rgba(31, 119, 180, 0.2)"))
+    fig.add_trace(go.Scatter(x=months, y=values(frame["median"]), name="Trung vị", mode="lines+markers",
+                             line=dict(color=SERIES_COLORS["Import"][0], width=2)))
+    fig.update_layout(template=template(), xaxis_title=x, yaxis_title=y_title, hovermode="x unified")
+    return fig
+
+
+def top_bar_figure(frame, x, y, hover=None, showscale=True, margin=None):
+    # Cột ngang top-K, màu theo giá trị (thang màu gửi theo tên thay vì danh sách màu), lớn nhất ở trên.
+    # hover: cột hiển thị thêm khi rê chuột (vd. quốc gia của doanh nghiệp)
+    hovertemplate = "<b>%{y}</b><br>Giá trị: %{x:.2f}"
+    customdata = None
+    if hover is not None:
+        hovertemplate += "<br>" + hover + ": %{customdata}"
+        customdata = frame[hover].astype(str).to_numpy()
+    amounts = values(frame[x])
+    fig = go.Figure(go.Bar(
+        x=amounts, y=frame[y].astype(str).to_numpy(), orientation="h", customdata=customdata,
+        hovertemplate=hovertemplate + "<extra></extra>",
+        marker=dict(color=amounts, colorscale=TOP_COLORSCALE, showscale=showscale),
+    ))
+    fig.update_layout(template=template(), yaxis_categoryorder="total ascending", showlegend=False)
+    if margin is not None:
+        fig.update_layout(margin=dict(l=margin, r=margin, t=margin, b=margin))
+    return fig
+
+
+def to_json(fig):
+    # JSON gọn (không thụt lề, không kiểm tra lại schema) để lưu trong FigureCache
+    return pio.to_json(fig, validate=False, pretty=False)
+
+
+class FigureCache:
+    # Bộ nhớ đệm LRU cho hình đã dựng sẵn (go.Figure của plotly hoặc HTML của bản đồ folium).
+    # Khoá gợi ý: (chart id, sản phẩm, chiều giao dịch, quốc gia, phiên bản dữ liệu).
+    # Dùng chung giữa các phiên Streamlit nên mọi thao tác đều có khoá (lock).
+    # Dung lượng mỗi mục: độ dài chuỗi HTML, hoặc độ dài JSON của hình.
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+                self.size -= self.sizes.pop(key)
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.size += size
+            # Bỏ các hình ít được dùng gần đây nhất khi vượt giới hạn số lượng hoặc dung lượng
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                old_key, _ = self.entries.popitem(last=False)
+                self.size -= self.sizes.pop(old_key)
+        return value
+
+    def get_or_build(self, key, build):
+        # build() trả về (giá trị, dung lượng) và chỉ được gọi khi hình chưa có trong cache.
+        # Thời gian được ghi vào telemetry theo chart id (phần tử đầu của khoá), tách cache trúng/trượt.
+        with telemetry.section(f"figure {key[0]}", cache="hit") as timer:
+            value = self.get(key)
+            if value is None:
+                timer.cache = "miss"
+                value = self.put(key, *build())
+        return value
+
+    def html(self, key, build):
+        # build() trả về chuỗi HTML (vd. bản đồ folium)
+        return self.get_or_build(key, lambda: (build(), None))
+
+    def figure(self, key, build):
+        # Trả về go.Figure để đưa thẳng vào st.plotly_chart; build() trả về go.Figure.
+        # Giữ chính đối tượng Figure (không phải dict): st.plotly_chart coi Figure là đã kiểm tra schema và chỉ
+        # chép ra dict, còn dict thì bị dựng lại thành Figure để kiểm tra mỗi lần vẽ (~4 lần chậm hơn).
+        # Figure dùng chung cho mọi phiên nên không được sửa; dung lượng tính theo độ dài JSON của hình.
+        def build_figure():
+            fig = build()
+            return fig, len(to_json(fig))
+
+        return self.get_or_build(key, build_figure)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Bộ ranh giới quốc gia đóng gói sẵn trong repo (Natural Earth), không cần tải qua mạng
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COUNTRIES_PATH = os.path.join(BASE_DIR, "geodata", "countries.geojson")
+
+# Các mức độ chi tiết: (sai số Douglas-Peucker theo độ, số chữ số thập phân giữ lại)
+RESOLUTIONS = {
+    "low": (0.5, 1),
+    "medium": (0.1, 2),
+    "high": (0.0, 3),
+}
+
+# Tên Destination trong dữ liệu khác với tên trong bộ ranh giới -> mã ISO A3
+DESTINATION_ALIASES = {
+    "Hong Kong": "HKG",
+    "Seychelles": "SYC",
+    "Czech Republic": "CZE",
+    "Korea": "KOR",
+    "Republic of Korea": "KOR",
+    "Russian Federation": "RUS",
+    "Viet Nam": "VNM",
+    "USA": "USA",
+    "United States": "USA",
+    "UK": "GBR",
+    "UAE": "ARE",
+}
+
+
+def simplify_line(points, tolerance):
+    # Douglas-Peucker cho một dãy điểm (mảng n x 2), giữ điểm đầu và điểm cuối
+    n = len(points)
+    if tolerance <= 0 or n < 3:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = start + 1 + index
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return points[keep]
+
+
+def round_ring(ring, decimals):
+    points = np.round(np.asarray(ring, dtype=np.float64), decimals)
+    # Bỏ các điểm trùng liên tiếp sau khi làm tròn
+    if len(points) > 1:
+        points = points[np.r_[True, np.any(np.diff(points, axis=0) != 0, axis=1)]]
+    return points
+
+
+class SharedArcs:
+    # Đơn giản hoá theo cung chung (như TopoJSON): mỗi vòng được cắt tại các điểm nối (nơi hai vòng bắt đầu
+    # hoặc thôi đi chung một đoạn biên giới) thành các cung, mỗi cung được đơn giản hoá một lần và dùng lại
+    # cho mọi vòng đi qua nó (kể cả theo chiều ngược lại), nên hai nước láng giềng giữ cùng một đường biên,
+    # không có khe hở hay phần chồng lấn. Vòng không có điểm nối (đảo, vùng nằm trọn trong nước khác)
+    # là một cung khép kín.
+    def __init__(self, rings, tolerance):
+        self.tolerance = tolerance
+        self.junctions = self.find_junctions(rings)
+        self.cache = {}
+        # Số vòng đi qua mỗi cung: cung chỉ thuộc một vòng (vd. bờ biển) được giữ thêm điểm khi vòng bị suy biến
+        self.uses = {}
+        for points in rings:
+            for arc in self.split(points):
+                key = self.key(arc)[0]
+                self.uses[key] = self.uses.get(key, 0) + 1
+
+    @staticmethod
+    def find_junctions(rings):
+        # Điểm nối: điểm có các cặp điểm kề khác nhau ở các lần xuất hiện (trong cùng vòng hoặc ở vòng khác)
+        neighbours = {}
+        junctions = set()
+        for points in rings:
+            ring = [tuple(point) for point in points.tolist()[:-1]]
+            for i, point in enumerate(ring):
+                pair = frozenset((ring[i - 1], ring[(i + 1) % len(ring)]))
+                if neighbours.setdefault(point, pair) != pair:
+                    junctions.add(point)
+        return junctions
+
+    @staticmethod
+    def key(arc):
+        # Khoá của cung không phụ thuộc chiều đi; kèm cờ cho biết cung đang đi ngược chiều khoá
+        key = tuple(map(tuple, arc.tolist()))
+        reverse = key[::-1]
+        return (key, False) if key <= reverse else (reverse, True)
+
+    def split(self, points):
+        # Cắt vòng khép kín (điểm cuối trùng điểm đầu) đã làm tròn thành các cung nối tiếp nhau
+        ring = points[:-1]
+        if len(ring) < 3:
+            return [points]
+        cuts = [i for i, point in enumerate(map(tuple, ring.tolist())) if point in self.junctions]
+        if not cuts:
+            # Cung khép kín: bắt đầu từ điểm nhỏ nhất để cùng một vòng ở hai nước cho cùng một cung
+            cuts = [min(range(len(ring)), key=lambda i: tuple(ring[i]))]
+        ring = np.roll(ring, -cuts[0], axis=0)
+        ring = np.vstack([ring, ring[:1]])
+        bounds = [i - cuts[0] for i in cuts] + [len(ring) - 1]
+        return [ring[start:end + 1] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def arc(self, arc):
+        # Đơn giản hoá một cung; cung và cung ngược chiều của nó dùng chung một kết quả
+        key, reverse = self.key(arc)
+        if key not in self.cache:
+            self.cache[key] = simplify_line(np.array(key), self.tolerance)
+        result = self.cache[key]
+        return result[::-1] if reverse else result
+
+    def simplify(self, points):
+        arcs = self.split(points)
+        parts = [self.arc(arc) for arc in arcs]
+        if sum(len(part) - 1 for part in parts) < 3:
+            # Vòng suy biến thành đoạn thẳng (vd. nước nhỏ hơn sai số): giữ điểm xa nhất của các cung
+            # chỉ thuộc vòng này, không đổi cung dùng chung với nước láng giềng
+            parts = [
+                farthest(arc) if self.uses[self.key(arc)[0]] == 1 and len(part) == 2 else part
+                for arc, part in zip(arcs, parts)
+            ]
+        return np.vstack([parts[0]] + [part[1:] for part in parts[1:]])
+
+
+def farthest(points):
+    # Điểm đầu, điểm xa đoạn nối hai đầu nhất và điểm cuối của một cung
+    if len(points) < 3:
+        return points
+    segment = points[-1] - points[0]
+    offsets = points[1:-1] - points[0]
+    distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0])
+    if not distances.any():
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+    return points[[0, 1 + int(np.argmax(distances)), -1]]
+
+
+def simplify_ring(ring, tolerance, decimals, arcs=None):
+    points = round_ring(ring, decimals)
+    points = simplify_line(points, tolerance) if arcs is None else arcs.simplify(points)
+    if len(points) < 4:
+        return None
+    return points.tolist()
+
+
+def simplify_polygon(polygon, tolerance, decimals, arcs=None):
+    rings = [simplify_ring(ring, tolerance, decimals, arcs) for ring in polygon]
+    if rings[0] is None:
+        return None
+    return [ring for ring in rings if ring is not None]
+
+
+def polygons_of(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def simplify_geometry(geometry, tolerance, decimals, arcs=None):
+    # Đơn giản hoá Polygon/MultiPolygon; nếu mọi phần đều bị loại thì giữ phần lớn nhất ở dạng làm tròn.
+    # arcs (SharedArcs) đơn giản hoá theo cung chung với các hình khác thay vì từng vòng riêng lẻ.
+    polygons = polygons_of(geometry)
+    simplified = [p for p in (simplify_polygon(p, tolerance, decimals, arcs) for p in polygons) if p is not None]
+    if not simplified:
+        largest = max(polygons, key=lambda p: len(p[0]))
+        simplified = [simplify_polygon(largest, 0, decimals) or largest]
+    if len(simplified) == 1:
+        return {"type": "Polygon", "coordinates": simplified[0]}
+    return {"type": "MultiPolygon", "coordinates": simplified}
+
+
+def feature_key(properties):
+    # Khoá của mỗi quốc gia là mã ISO A3; một số bản ghi Natural Earth dùng -99 nên lấy tên thay thế
+    for field in ("iso_a3", "ISO_A3", "adm0_a3", "ADM0_A3"):
+        value = properties.get(field)
+        if value and value != "-99":
+            return value
+    return properties.get("name") or properties.get("NAME")
+
+
+def build(source, target=COUNTRIES_PATH):
+    # Chuyển một GeoJSON quốc gia (vd. Natural Earth) sang bộ ranh giới gọn nhẹ đóng gói trong repo
+    with open(source, encoding="utf-8") as f:
+        collection = json.load(f)
+    _, decimals = RESOLUTIONS["high"]
+    features = []
+    for feature in collection["features"]:
+        properties = feature["properties"]
+        name = properties.get("name") or properties.get("NAME")
+        features.append({
+            "type": "Feature",
+            "id": feature_key(properties),
+            "properties": {"name": name},
+            "geometry": simplify_geometry(feature["geometry"], 0, decimals),
+        })
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False, separators=(",", ":"))
+    return len(features)
+
+
+@lru_cache(maxsize=None)
+def load_countries_json(resolution="medium"):
+    # Đọc và đơn giản hoá bộ ranh giới một lần cho mỗi mức độ chi tiết, trả về chuỗi GeoJSON
+    tolerance, decimals = RESOLUTIONS[resolution]
+    with open(COUNTRIES_PATH, encoding="utf-8") as f:
+        collection = json.load(f)
+    # Biên giới chung của hai nước được đơn giản hoá một lần (SharedArcs) để không hở hoặc chồng lên nhau
+    rings = [
+        round_ring(ring, decimals)
+        for feature in collection["features"]
+        for polygon in polygons_of(feature["geometry"])
+        for ring in polygon
+    ]
+    arcs = SharedArcs(rings, tolerance)
+    for feature in collection["features"]:
+        feature["geometry"] = simplify_geometry(feature["geometry"], tolerance, decimals, arcs)
+    return json.dumps(collection, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_countries(resolution="medium"):
+    # Mỗi lần gọi trả về một bản dict riêng để folium có thể sửa mà không ảnh hưởng bộ nhớ đệm
+    return json.loads(load_countries_json(resolution))
+
+
+@lru_cache(maxsize=None)
+def destination_lookup():
+    # Bảng ánh xạ tên quốc gia -> khoá hình học, tính một lần
+    with open(COUNTRIES_PATH, encoding="utf-8") as f:
+        collection = json.load(f)
+    lookup = {feature["properties"]["name"]: feature["id"] for feature in collection["features"]}
+    lookup.update(DESTINATION_ALIASES)
+    return lookup
+
+
+def destination_keys(destinations):
+    # Đổi cột Destination sang khoá hình học (mã ISO A3) để ghép với bản đồ qua feature.id
+    return pd.Series(destinations).astype("object").map(destination_lookup())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo bộ ranh giới quốc gia đóng gói cho bản đồ")
+    parser.add_argument("source", help="Tệp GeoJSON quốc gia nguồn (vd. Natural Earth admin 0)")
+    parser.add_argument("--target", default=COUNTRIES_PATH)
+    args = parser.parse_args()
+
+    count = build(args.source, args.target)
+    print(f"Đã ghi {count} quốc gia vào {args.target}")
+    for resolution in RESOLUTIONS:
+        print(f"  {resolution}: {len(load_countries_json(resolution)) / 1024:.0f} KB")
@@ -0,0 +1,265 @@
+import numpy as np
+import pandas as pd
+
+# Chỉ mục đồ thị giao dịch giữa Supplier, Purchaser và quốc gia (Destination), xây khi ingest cùng các tổng hợp.
+# Mỗi tên được đổi thành mã số nguyên; cạnh (Supplier, Purchaser, Destination) được cộng số giao dịch và Amount
+# theo từng (Product, Import/Export), rồi chiếu thành ma trận kề dạng CSR cho từng quan hệ (vd. Supplier -> Purchaser).
+# Truy vấn láng giềng, đối tác chung và mức độ tập trung (HHI) chỉ cắt mảng và np.bincount trên các mảng này,
+# không tự nối (self-join) DataFrame.
+
+NODE_KINDS = ["Supplier", "Purchaser", "Destination"]
+EDGE_KEYS = ["Product", "Import/Export"]
+# Các quan hệ (nguồn, đích) được xây sẵn
+RELATIONS = [
+    ("Supplier", "Purchaser"),
+    ("Purchaser", "Supplier"),
+    ("Supplier", "Destination"),
+    ("Purchaser", "Destination"),
+]
+# Bảng mức độ tập trung chỉ gồm doanh nghiệp có ít nhất ngần này giao dịch (tránh HHI = 1 của doanh nghiệp chỉ giao dịch một lần)
+MIN_COUNT = 5
+
+
+def other_role(role):
+    return "Purchaser" if role == "Supplier" else "Supplier"
+
+
+class NodeDictionary:
+    # Tên -> mã số nguyên ổn định qua các lô (tên mới được thêm vào cuối), như DistinctIndex.encode
+    def __init__(self):
+        self.names = []
+        self.lookup = {}
+
+    def encode(self, series):
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+        ids = np.empty(len(series.cat.categories) + 1, dtype=np.int64)
+        for i, name in enumerate(series.cat.categories):
+            if name not in self.lookup:
+                self.lookup[name] = len(self.names)
+                self.names.append(name)
+            ids[i] = self.lookup[name]
+        ids[-1] = -1
+        return ids[series.cat.codes.to_numpy()]
+
+    def get(self, name):
+        return self.lookup.get(name, -1)
+
+    def take(self, ids):
+        return pd.Index(self.names, dtype="object")[ids] if len(self.names) else pd.Index([], dtype="object")
+
+
+def expand_ranges(starts, ends):
+    # Chỉ số của mọi phần tử trong các đoạn [start, end) ghép liên tiếp, và đoạn chứa từng phần tử
+    lengths = ends - starts
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - offsets[owner] + starts[owner], owner
+
+
+class Adjacency:
+    # Ma trận kề CSR chỉ trên các nút nguồn có cạnh: nodes (mã nguồn, tăng dần), indptr, và cho từng cạnh
+    # mã đích, số giao dịch, Amount. Các cạnh trùng (nguồn, đích) được cộng lại khi xây.
+    def __init__(self, sources, targets, count, amount):
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        starts = np.flatnonzero(np.r_[True, (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])]) if len(sources) else np.empty(0, dtype=np.int64)
+        self.targets = targets[starts]
+        self.count = np.add.reduceat(count[order], starts) if len(starts) else np.empty(0, dtype=np.int64)
+        self.amount = np.add.reduceat(amount[order], starts) if len(starts) else np.empty(0, dtype=np.float64)
+        edge_sources = sources[starts]
+        self.nodes, first = np.unique(edge_sources, return_index=True)
+        self.indptr = np.r_[first, len(edge_sources)].astype(np.int64)
+
+    def rows(self, nodes):
+        # Vị trí dòng của các mã nguồn (-1 nếu nút không có cạnh)
+        nodes = np.asarray(nodes, dtype=np.int64)
+        positions = np.searchsorted(self.nodes, nodes)
+        positions = np.minimum(positions, max(len(self.nodes) - 1, 0))
+        found = (len(self.nodes) > 0) & (self.nodes[positions] == nodes) if len(self.nodes) else np.zeros(len(nodes), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def neighbours(self, node):
+        # Các cạnh của một nút: (mã đích, số giao dịch, Amount)
+        row = self.rows([node])[0]
+        if row < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        edges = slice(self.indptr[row], self.indptr[row + 1])
+        return self.targets[edges], self.count[edges], self.amount[edges]
+
+    def expand(self, nodes):
+        # Cạnh của nhiều nút cùng lúc: chỉ số cạnh và vị trí (trong nodes) của nút nguồn của từng cạnh
+        rows = self.rows(nodes)
+        valid = np.flatnonzero(rows >= 0)
+        edges, owner = expand_ranges(self.indptr[rows[valid]], self.indptr[rows[valid] + 1])
+        return edges, valid[owner]
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def edges(self):
+        # Các cạnh dạng (nguồn, đích, số giao dịch, Amount), để cộng thêm cạnh của lô mới rồi xây lại
+        return np.repeat(self.nodes, self.degree()), self.targets, self.count, self.amount
+
+    def totals(self):
+        # Tổng Amount và số giao dịch của từng nút nguồn
+        edge_rows = np.repeat(np.arange(len(self.nodes)), self.degree())
+        return (
+            np.bincount(edge_rows, weights=self.amount, minlength=len(self.nodes)),
+            np.bincount(edge_rows, weights=self.count, minlength=len(self.nodes)).astype(np.int64),
+        )
+
+    def concentration(self):
+        # Chỉ số Herfindahl-Hirschman theo Amount của mọi nút nguồn (tổng bình phương tỷ trọng, 1 = chỉ một đối tác),
+        # kèm đích lớn nhất và tỷ trọng của nó
+        degree = self.degree()
+        edge_rows = np.repeat(np.arange(len(self.nodes)), degree)
+        amount, _ = self.totals()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = self.amount / amount[edge_rows]
+        hhi = np.bincount(edge_rows, weights=share ** 2, minlength=len(self.nodes))
+        hhi[amount <= 0] = np.nan
+        # Cạnh lớn nhất của mỗi dòng: sắp xếp theo (dòng, Amount) và lấy phần tử cuối của từng đoạn
+        order = np.lexsort((self.amount, edge_rows))
+        top = order[self.indptr[1:] - 1] if len(self.nodes) else np.empty(0, dtype=np.int64)
+        return hhi, degree, self.targets[top], share[top]
+
+
+class TradeGraph:
+    # Cạnh (Supplier, Purchaser, Destination) cộng dồn theo từng lô cho mỗi (Product, Import/Export);
+    # finish() chiếu các lô đang chờ lên từng quan hệ và cộng vào ma trận kề đã có (không giữ bảng cạnh ba chiều:
+    # mỗi quan hệ chỉ cần tổng theo cặp nên lô append được cộng thẳng vào ma trận kề của nó)
+    def __init__(self):
+        self.nodes = {kind: NodeDictionary() for kind in NODE_KINDS}
+        self.partitions = {}
+        self.pending = []
+        self.adjacency = {}
+
+    def encode_partitions(self, data):
+        # Mã (Product, Import/Export) của từng dòng từ mã categorical của hai cột (-1 nếu thiếu một trong hai)
+        columns = [data[key] if isinstance(data[key].dtype, pd.CategoricalDtype) else data[key].astype("category") for key in EDGE_KEYS]
+        (product_codes, direction_codes), (products, directions) = zip(*[(column.cat.codes.to_numpy(), column.cat.categories) for column in columns])
+        combined = np.where((product_codes >= 0) & (direction_codes >= 0), product_codes.astype(np.int64) * len(directions) + direction_codes, -1)
+        unique, inverse = np.unique(combined, return_inverse=True)
+        parts = np.array([
+            self.partitions.setdefault((products[key // len(directions)], directions[key % len(directions)]), len(self.partitions)) if key >= 0 else -1
+            for key in unique
+        ], dtype=np.int64)
+        return parts[inverse.reshape(-1)] if len(unique) else np.empty(0, dtype=np.int64)
+
+    def add(self, data):
+        frame = pd.DataFrame({kind: self.nodes[kind].encode(data[kind]) for kind in NODE_KINDS})
+        frame["part"] = self.encode_partitions(data)
+        frame["count"] = 1
+        frame["Amount"] = data["Amount"].to_numpy(dtype=np.float64, na_value=np.nan)
+        frame = frame[(frame["part"] >= 0) & ((frame["Supplier"] >= 0) | (frame["Purchaser"] >= 0))]
+        self.pending.append(frame.groupby(["part"] + NODE_KINDS, sort=False)[["count", "Amount"]].sum().reset_index())
+        return self
+
+    def finish(self):
+        if not self.pending:
+            return self
+        edges = pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        keys = {part: key for key, part in self.partitions.items()}
+        for part, part_edges in edges.groupby("part", sort=False):
+            key = keys[part]
+            for source, target in RELATIONS:
+                pairs = part_edges[(part_edges[source] >= 0) & (part_edges[target] >= 0)]
+                arrays = [
+                    pairs[source].to_numpy(), pairs[target].to_numpy(),
+                    pairs["count"].to_numpy(dtype=np.int64), pairs["Amount"].to_numpy(dtype=np.float64),
+                ]
+                old = self.adjacency.get(key + (source, target))
+                if old is not None:
+                    arrays = [np.concatenate([before, after]) for before, after in zip(old.edges(), arrays)]
+                self.adjacency[key + (source, target)] = Adjacency(*arrays)
+        return self
+
+    def relation(self, product, direction, source, target):
+        # Ma trận kề của một quan hệ cho một sản phẩm/chiều giao dịch (None nếu không có giao dịch)
+        return self.adjacency.get((product, direction, source, target))
+
+    def ranked(self, product, direction, role, k=None):
+        # Tên doanh nghiệp có giao dịch, tổng Amount giảm dần (danh sách chọn của dashboard)
+        adjacency = self.relation(product, direction, role, other_role(role))
+        if adjacency is None:
+            return []
+        amount, _ = adjacency.totals()
+        order = np.argsort(-amount, kind="stable")[:k]
+        return list(self.nodes[role].take(adjacency.nodes[order]))
+
+    def counterparts(self, product, direction, role, company, target=None, k=20):
+        # Đối tác của một doanh nghiệp (target: phía bên kia hoặc Destination), Amount lớn nhất trước.
+        # Với đối tác là doanh nghiệp, Competitors = số doanh nghiệp khác cùng vai trò cũng giao dịch với đối tác đó.
+        target = target or other_role(role)
+        columns = [target, "count", "Amount", "Share (%)"] + (["Competitors"] if target != "Destination" else [])
+        adjacency = self.relation(product, direction, role, target)
+        node = self.nodes[role].get(company)
+        if adjacency is None or node < 0:
+            return pd.DataFrame(columns=columns)
+        targets, count, amount = adjacency.neighbours(node)
+        order = np.lexsort((-count, -amount))[:k]
+        frame = pd.DataFrame({
+            target: self.nodes[target].take(targets[order]),
+            "count": count[order],
+            "Amount": amount[order],
+            "Share (%)": (amount[order] / amount.sum() * 100).round(1) if amount.sum() > 0 else np.nan,
+        })
+        if target != "Destination":
+            backward = self.relation(product, direction, target, role)
+            frame["Competitors"] = backward.degree()[backward.rows(targets[order])] - 1
+        return frame
+
+    def shared(self, product, direction, role, company, k=10):
+        # Các doanh nghiệp cùng vai trò có chung đối tác với company: số đối tác chung, chỉ số Jaccard của hai tập
+        # đối tác, Amount của company và của doanh nghiệp đó với các đối tác chung. Đi qua hai ma trận kề
+        # (company -> đối tác -> doanh nghiệp khác) rồi đếm bằng np.bincount.
+        partner = other_role(role)
+        columns = [role, "Shared", "Jaccard", "Amount", "Competitor Amount"]
+        forward = self.relation(product, direction, role, partner)
+        node = self.nodes[role].get(company)
+        if forward is None or node < 0:
+            return pd.DataFrame(columns=columns)
+        backward = self.relation(product, direction, partner, role)
+        partners, _, partner_amount = forward.neighbours(node)
+        edges, owner = backward.expand(partners)
+        competitors = backward.targets[edges]
+        others = competitors != node
+        edges, owner, competitors = edges[others], owner[others], competitors[others]
+        size = len(self.nodes[role].names)
+        shared = np.bincount(competitors, minlength=size)
+        ids = np.flatnonzero(shared)
+        own_amount = np.bincount(competitors, weights=partner_amount[owner], minlength=size)[ids]
+        competitor_amount = np.bincount(competitors, weights=backward.amount[edges], minlength=size)[ids]
+        shared = shared[ids]
+        degree = forward.degree()[forward.rows(ids)]
+        order = np.lexsort((-own_amount, -shared))[:k]
+        return pd.DataFrame({
+            role: self.nodes[role].take(ids[order]),
+            "Shared": shared[order],
+            "Jaccard": (shared / (len(partners) + degree - shared))[order].round(3),
+            "Amount": own_amount[order],
+            "Competitor Amount": competitor_amount[order],
+        })
+
+    def concentration(self, product, direction, role, by="Destination", k=20, min_count=MIN_COUNT):
+        # Mức độ tập trung của từng doanh nghiệp theo quốc gia (by="Destination") hoặc theo đối tác:
+        # HHI cao nhất trước (1 = chỉ phụ thuộc một quốc gia/đối tác), cùng HHI thì Amount lớn hơn trước
+        columns = [role, "HHI", f"{by}s", f"Top {by}", "Top Share (%)", "count", "Amount"]
+        adjacency = self.relation(product, direction, role, by)
+        if adjacency is None:
+            return pd.DataFrame(columns=columns)
+        hhi, degree, top, top_share = adjacency.concentration()
+        amount, count = adjacency.totals()
+        rows = np.flatnonzero((count >= min_count) & ~np.isnan(hhi))
+        rows = rows[np.lexsort((-amount[rows], -hhi[rows]))[:k]]
+        return pd.DataFrame({
+            role: self.nodes[role].take(adjacency.nodes[rows]),
+            "HHI": hhi[rows].round(3),
+            f"{by}s": degree[rows],
+            f"Top {by}": self.nodes[by].take(top[rows]),
+            "Top Share (%)": (top_share[rows] * 100).round(1),
+            "count": count[rows],
+            "Amount": amount[rows],
+        }, columns=columns)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import telemetry
+
+# Tải tệp nguồn qua HTTP(S) cho store.ingest: một Session dùng chung với pool kết nối, timeout, tự thử lại
+# khi lỗi mạng/5xx, và bộ nhớ đệm trên đĩa. Tệp đã có trong cache chỉ được tải lại khi máy chủ báo đã thay đổi
+# (yêu cầu có điều kiện If-None-Match/If-Modified-Since, trả về 304 nếu không đổi). Đường dẫn cục bộ giữ nguyên.
+
+# Địa chỉ gốc của các tệp nguồn trong repo (dùng khi không có bản sao cục bộ của tệp)
+REMOTE_BASE = "https://raw.githubusercontent.com/thuthuy119/agricultural_products/main/"
+# Timeout (kết nối, đọc) tính bằng giây; đọc là thời gian chờ giữa hai gói dữ liệu, không phải cả lần tải
+TIMEOUT = (5, 60)
+# Số lần thử lại và hệ số chờ lũy thừa (0.5, 1, 2... giây) cho lỗi kết nối và các mã 429/5xx
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Số kết nối giữ trong pool và số tệp tải cùng lúc
+POOL_SIZE = 8
+CHUNK_BYTES = 1 << 20
+
+
+def is_url(source):
+    return urlparse(str(source)).scheme in ("http", "https")
+
+
+def locate(path):
+    # Đường dẫn cục bộ nếu tệp tồn tại, nếu không thì URL của tệp cùng tên trong repo
+    if is_url(path) or os.path.exists(path):
+        return path
+    return REMOTE_BASE + os.path.basename(path)
+
+
+def source_name(source):
+    # Tên tệp của nguồn (phần cuối của đường dẫn hoặc URL), dùng trong manifest
+    if is_url(source):
+        return unquote(os.path.basename(urlparse(source).path))
+    return os.path.basename(source)
+
+
+def make_session(retries=RETRIES, pool_size=POOL_SIZE):
+    retry = Retry(
+        total=retries,
+        backoff_factor=BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class Loader:
+    # Tải về cache_dir: mỗi URL một tệp (giữ phần mở rộng để store.iter_source nhận ra .csv/.xlsx)
+    # và một tệp .json bên cạnh chứa ETag/Last-Modified của lần tải trước.
+    def __init__(self, cache_dir, session=None, timeout=TIMEOUT, workers=POOL_SIZE):
+        self.cache_dir = cache_dir
+        self.session = session or make_session(pool_size=workers)
+        self.timeout = timeout
+        self.workers = workers
+
+    def cache_path(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{digest}-{source_name(url)}")
+
+    def read_meta(self, path):
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, path, meta):
+        tmp_path = f"{path}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, f"{path}.json")
+
+    def fetch(self, source):
+        # Trả về đường dẫn cục bộ của source; URL được tải (hoặc xác nhận không đổi) vào cache.
+        # Khi không kết nối được mà đã có bản trong cache, dùng bản đó thay vì báo lỗi.
+        if not is_url(source):
+            return source
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path(source)
+        meta = self.read_meta(path) if os.path.exists(path) else {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        with telemetry.section(f"download {source_name(source)}", cache="miss") as timer:
+            try:
+                with self.session.get(source, headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304:
+                        timer.cache = "hit"
+                        return path
+                    response.raise_for_status()
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    try:
+                        with open(tmp_path, "wb") as f:
+                            for block in response.iter_content(CHUNK_BYTES):
+                                f.write(block)
+                        os.replace(tmp_path, path)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    self.write_meta(path, {
+                        "url": source,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "bytes": os.path.getsize(path),
+                    })
+                    return path
+            except requests.RequestException:
+                if meta:
+                    timer.cache = "stale"
+                    telemetry.count(f"download failed, using cache: {source_name(source)}")
+                    return path
+                raise
+
+    def fetch_all(self, sources):
+        # Tải song song {tên: nguồn} -> {tên: đường dẫn cục bộ}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            paths = {name: pool.submit(self.fetch, source) for name, source in sources.items()}
+            return {name: task.result() for name, task in paths.items()}
@@ -0,0 +1,120 @@
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aggregates
+import graph
+import query
+import store
+import transactions
+import views
+
+# Tính sẵn mọi số liệu dashboard hiển thị cho từng sản phẩm × chiều giao dịch × quốc gia × vai trò,
+# song song trên nhiều tiến trình (mỗi tiến trình một sản phẩm), và ghi ra views-<phiên bản>/.
+# Dashboard và API đọc kết quả này qua query.view(); truy vấn chưa có kết quả vẫn được tính trực tiếp.
+#   python precompute.py [--store data_store] [--workers 4]
+
+# Dataset của tiến trình con, mở một lần trong init_worker
+worker_dataset = None
+
+
+def view_specs(dataset, product):
+    # Danh sách (tên truy vấn, tham số) của mọi số liệu dashboard cho một sản phẩm
+    cube = query.product_cube(dataset, product)
+    directions = [direction for direction in query.DIRECTIONS if direction in set(cube["Import/Export"])]
+    countries = list(cube["Destination"].dropna().unique())
+    specs = []
+    # PHẦN 1: chuỗi theo tháng và tổng theo chiều giao dịch
+    for measure in ("count", "Amount"):
+        specs.append(("monthly", {"measure": measure}))
+        for direction in query.DIRECTIONS:
+            specs.append(("direction_total", {"direction": direction, "measure": measure}))
+    # PHẦN 2: tổng theo quốc gia, top quốc gia, tăng trưởng, chuỗi và tổng của từng quốc gia
+    for direction in directions:
+        specs.append(("country_totals", {"direction": direction}))
+        specs.append(("top_countries", {"direction": direction, "k": 10}))
+        specs.append(("destination_growth", {"direction": direction}))
+    for country in countries:
+        specs.append(("monthly", {"measure": "Amount", "destination": country}))
+        for direction in query.DIRECTIONS:
+            specs.append(("direction_total", {"direction": direction, "measure": "Amount", "destination": country}))
+    # PHẦN 3: số doanh nghiệp, top 20, bảng TCTK và tăng trưởng theo vai trò
+    for direction in query.DIRECTIONS:
+        for role in query.ROLES:
+            specs.append(("counterpart_total", {"direction": direction, "role": role}))
+            specs.append(("counterpart_monthly", {"direction": direction, "role": role}))
+            specs.append(("top_companies", {"direction": direction, "role": role, "by": "Destination", "k": 20}))
+            specs.append(("company_financials", {"direction": direction, "role": role, "k": 20}))
+            specs.append(("company_growth", {"direction": direction, "role": role}))
+            specs.append(("network_companies", {"direction": direction, "role": role}))
+            for by in ("Destination", graph.other_role(role)):
+                specs.append(("concentration", {"direction": direction, "role": role, "by": by}))
+    # PHẦN 5: phân bố đơn giá (gộp và theo từng quốc gia) và các giao dịch có giá bất thường
+    for direction in directions:
+        for basis in aggregates.PRICE_BASES:
+            specs.append(("price_outliers", {"direction": direction, "basis": basis}))
+            for country in [None] + countries:
+                specs.append(("unit_prices", {"direction": direction, "basis": basis, "destination": country}))
+    return specs
+
+
+def compute_views(dataset, product):
+    results = {}
+    for name, params in view_specs(dataset, product):
+        _, defaults = query.QUERIES[name]
+        results[views.view_key(name, product, {**defaults, **params})] = query.run(dataset, name, product, **params)
+    return results
+
+
+def init_worker(store_dir):
+    global worker_dataset
+    worker_dataset = query.open_dataset(store_dir)
+
+
+def precompute_product(tmp_path, position, product):
+    start = time.perf_counter()
+    product_views = compute_views(worker_dataset, product)
+    name = views.write_product(tmp_path, position, product_views)
+    return product, name, len(product_views), time.perf_counter() - start
+
+
+def precompute(store_dir=store.STORE_DIR, workers=None):
+    # Tính cho mọi sản phẩm của phiên bản dữ liệu hiện tại; trả về {sản phẩm: (số truy vấn, giây)}
+    dataset = query.open_dataset(store_dir)
+    # Xây ảnh chụp dạng cột trước để các tiến trình con chỉ mở bằng memory-map, không xây trùng
+    transactions.build_columns(store_dir)
+    tmp_path = f"{views.views_dir(dataset.version, store_dir)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    files = {}
+    report = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(store_dir,)) as pool:
+            tasks = [
+                pool.submit(precompute_product, tmp_path, position, product)
+                for position, product in enumerate(query.products(dataset))
+            ]
+            for task in tasks:
+                product, name, count, seconds = task.result()
+                files[product] = name
+                report[product] = (count, seconds)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    views.publish(tmp_path, dataset.version, files, store_dir)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tính sẵn các số liệu của dashboard cho mọi sản phẩm")
+    parser.add_argument("--store", default=store.STORE_DIR, help="Thư mục store")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình (mặc định: số lõi CPU)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = precompute(args.store, args.workers)
+    for product, (count, seconds) in report.items():
+        print(f"{product}: {count} số liệu trong {seconds:.1f} giây")
+    print(f"Hoàn tất phiên bản {store.data_version(args.store)} trong {time.perf_counter() - start:.1f} giây")
@@ -0,0 +1,350 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import store
+import tctk
+import telemetry
+import timeseries
+import transactions
+import views
+
+# Bộ máy truy vấn dùng chung cho dashboard, API HTTP (api.py) và các job báo cáo.
+# Mọi hàm đều là hàm thuần trên Dataset (không gọi Streamlit, không sửa dữ liệu dùng chung).
+
+DIRECTIONS = ["Import", "Export"]
+ROLES = ["Purchaser", "Supplier"]
+
+
+class Dataset:
+    # Các tổng hợp tính sẵn khi ingest và bảng tài chính TCTK của một phiên bản dữ liệu
+    def __init__(self, trade_aggregates, financials, version=None, store_dir=store.STORE_DIR):
+        self.aggregates = trade_aggregates
+        self.financials = financials
+        self.version = version
+        self.store_dir = store_dir
+        self._transactions = None
+        self._views = None
+        self._lock = threading.Lock()
+
+    @property
+    def cube(self):
+        return self.aggregates.cube
+
+    @property
+    def transactions(self):
+        # Bảng giao dịch dạng cột (memory-map), chỉ mở khi có truy vấn cần tới từng doanh nghiệp theo tháng
+        with self._lock:
+            if self._transactions is None:
+                self._transactions = transactions.TransactionTable.open(self.store_dir)
+            return self._transactions
+
+    @property
+    def views(self):
+        # Kết quả tính sẵn của precompute.py cho phiên bản này (None nếu chưa có; được kiểm tra lại ở lần gọi sau)
+        with self._lock:
+            if self._views is None:
+                self._views = views.ViewStore.open(self.version, self.store_dir)
+            return self._views
+
+
+def open_dataset(store_dir=store.STORE_DIR):
+    store.ensure_store(store_dir)
+    version = store.data_version(store_dir)
+    return Dataset(
+        store.read_aggregates(store_dir, version),
+        tctk.CompanyFinancials(store.read_table("tctk", store_dir)),
+        version,
+        store_dir,
+    )
+
+
+def products(dataset):
+    # Danh sách sản phẩm theo thứ tự xuất hiện đầu tiên trong dữ liệu
+    return list(dataset.cube["Product"].unique())
+
+
+def product_cube(dataset, product, direction=None, destination=None):
+    return aggregates.slice_cube(dataset.cube, product=product, direction=direction, destination=destination)
+
+
+def monthly_by_direction(dataset, product, measure="count", destination=None):
+    # Chuỗi theo tháng của một chỉ tiêu (count/Amount/Quantity/Weight), mỗi chiều Import/Export một cột,
+    # kèm tỷ lệ thay đổi theo tháng "<chiều> Ring Ratio" cho các chiều có dữ liệu
+    monthly = timeseries.panel(product_cube(dataset, product, destination=destination), "Import/Export", measure)
+    ratios = timeseries.ring_ratio(monthly)
+    frame = monthly.assign(**{f"{direction} Ring Ratio": ratios[direction] for direction in DIRECTIONS if direction in monthly})
+    return to_frame(frame)
+
+
+def to_frame(monthly):
+    # Bảng rộng theo PeriodIndex thành DataFrame có cột Month/Year dạng chuỗi "YYYY-MM" để hiển thị
+    frame = monthly.set_axis(monthly.index.astype(str)).rename_axis("Month/Year").reset_index()
+    frame.columns.name = None
+    return frame
+
+
+def direction_total(dataset, product, direction, measure="count", destination=None):
+    return aggregates.direction_total(product_cube(dataset, product, destination=destination), direction, measure)
+
+
+def country_totals(dataset, product, direction):
+    # Tổng giá trị (Amount) theo quốc gia cho một chiều giao dịch
+    return aggregates.totals_by(product_cube(dataset, product, direction=direction), "Destination", "Amount")
+
+
+def top_countries(dataset, product, direction, k=10):
+    return aggregates.top_k(country_totals(dataset, product, direction), "Amount", k)
+
+
+def top_companies(dataset, product, direction, role, by="Destination", k=20):
+    # Top k Purchaser/Supplier theo tổng Amount, kèm cột by (Destination hoặc mã số thuế)
+    return dataset.aggregates.topk[(role, by)].top(product, direction, k)
+
+
+def counterpart_total(dataset, product, direction, role):
+    # Số Purchaser/Supplier khác nhau trên toàn bộ các tháng
+    return dataset.aggregates.distinct[role].total(product, direction)
+
+
+def counterpart_monthly(dataset, product, direction, role):
+    # Số Purchaser/Supplier khác nhau theo tháng, kèm tỷ lệ thay đổi theo tháng
+    frame = dataset.aggregates.distinct[role].monthly(product, direction)
+    monthly = timeseries.fill_months(frame.set_index(timeseries.month_index(frame["Month/Year"]))[[role]])
+    return to_frame(monthly.assign(**{"Ring Ratio": timeseries.ring_ratio(monthly[role])}))
+
+
+def company_financials(dataset, product, direction, role, k=20):
+    # Bảng tài chính TCTK theo năm của top k doanh nghiệp (tra theo mã số thuế)
+    code_column = f"{role}_code"
+    top = top_companies(dataset, product, direction, role, by=code_column, k=k)
+    return dataset.financials.table(top[code_column])
+
+
+def destination_panel(dataset, product, direction, measure="Amount"):
+    # Chuỗi theo tháng của mọi quốc gia (mỗi quốc gia một cột) trong một lần groupby trên cube
+    return timeseries.panel(product_cube(dataset, product, direction=direction), "Destination", measure)
+
+
+def company_panel(dataset, product, direction, role, measure="Amount"):
+    # Chuỗi theo tháng của mọi Purchaser/Supplier, cộng bằng np.bincount trên mã của bảng giao dịch
+    # Các biến thể tên của một doanh nghiệp được gộp theo bảng doanh nghiệp chuẩn (nếu đã chạy resolve_companies)
+    table = dataset.transactions
+    rows = table.select({"Product": product, "Import/Export": direction})
+    weights = None if measure == "count" else table.values[measure][rows]
+    codes, names = table.codes[role][rows], table.categories[role]
+    companies = dataset.aggregates.companies
+    if companies is not None:
+        mapping, names = companies.code_map(role, names)
+        codes = mapping[codes]
+    return timeseries.code_panel(table.codes["Month/Year"][rows], codes, weights, table.categories["Month/Year"], names)
+
+
+def destination_growth(dataset, product, direction, measure="Amount", window=3, k=10):
+    # Các quốc gia tăng trưởng nhanh nhất: tổng window tháng gần nhất so với window tháng liền trước
+    return timeseries.top_growth(destination_panel(dataset, product, direction, measure), k, window, name="Destination")
+
+
+def company_growth(dataset, product, direction, role, measure="Amount", window=3, k=10):
+    # Các doanh nghiệp tăng trưởng nhanh nhất, tính một lần cho mọi doanh nghiệp
+    return timeseries.top_growth(company_panel(dataset, product, direction, role, measure), k, window, name=role)
+
+
+def unit_prices(dataset, product, direction, basis="Quantity", destination=None):
+    # Phân bố đơn giá (Amount / basis) theo tháng, tính sẵn khi ingest: số giao dịch có giá, trung vị,
+    # tứ phân vị, IQR, MAD, ngưỡng và số giao dịch ngoại lai; destination None = gộp mọi quốc gia
+    return to_frame(dataset.aggregates.prices[basis].table(product, direction, destination).set_index("Month/Year"))
+
+
+def price_outliers(dataset, product, direction, basis="Quantity", destination=None, k=50):
+    # Các giao dịch có đơn giá ngoài ngưỡng của nhóm (Product, Import/Export, Destination, Month/Year),
+    # lệch nhiều nhất (|điểm z vững| lớn nhất) trước
+    stats = dataset.aggregates.prices[basis].stats
+    columns = ["Date", "Month/Year", "Destination", "Purchaser", "Supplier", basis, "Amount"]
+    if stats is None:
+        return pd.DataFrame(columns=columns + ["Unit Price", "Median", "Robust z"])
+    stats = stats[(stats["Product"] == product) & (stats["Import/Export"] == direction) & stats["lower"].notna()]
+    table = dataset.transactions
+    rows = table.select({"Product": product, "Import/Export": direction, "Destination": destination})
+    frame = table.frame(rows, columns)
+    for column in ("Month/Year", "Destination"):
+        frame[column] = frame[column].astype("object")
+    frame = frame.merge(stats[["Destination", "Month/Year", "median", "lower", "upper"]], on=["Destination", "Month/Year"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["Unit Price"] = frame["Amount"] / frame[basis].astype(np.float64)
+    frame = frame[(frame["Unit Price"] < frame["lower"]) | (frame["Unit Price"] > frame["upper"])]
+    # Ngưỡng là trung vị ± PRICE_Z_THRESHOLD * thang đo của nhóm, suy ngược ra điểm z của từng giao dịch
+    scale = (frame["upper"] - frame["median"]) / aggregates.PRICE_Z_THRESHOLD
+    frame = frame.assign(**{"Median": frame["median"], "Robust z": ((frame["Unit Price"] - frame["median"]) / scale).round(1)})
+    frame = frame.iloc[np.argsort(-frame["Robust z"].abs().to_numpy(), kind="stable")[:k]]
+    return frame[columns + ["Unit Price", "Median", "Robust z"]].reset_index(drop=True)
+
+
+def network_companies(dataset, product, direction, role, k=None):
+    # Doanh nghiệp có giao dịch trong đồ thị giao dịch, tổng Amount giảm dần
+    return dataset.aggregates.graph.ranked(product, direction, role, k)
+
+
+def counterparts(dataset, product, direction, role, company, target=None, k=20):
+    # Đối tác (phía bên kia hoặc Destination) của một doanh nghiệp, đọc từ ma trận kề đã xây khi ingest
+    return dataset.aggregates.graph.counterparts(product, direction, role, company, target, k)
+
+
+def shared_counterparts(dataset, product, direction, role, company, k=10):
+    # Doanh nghiệp cùng vai trò có chung đối tác với company (vd. đối thủ bán cho cùng nhà nhập khẩu nước ngoài)
+    return dataset.aggregates.graph.shared(product, direction, role, company, k)
+
+
+def concentration(dataset, product, direction, role, by="Destination", k=20):
+    # Doanh nghiệp phụ thuộc nhiều nhất vào một quốc gia/đối tác (HHI theo Amount)
+    return dataset.aggregates.graph.concentration(product, direction, role, by, k)
+
+
+def product_rows(dataset, product, direction=None):
+    # Chỉ số các dòng giao dịch của một sản phẩm (và chiều giao dịch) trong bảng dạng cột
+    return dataset.transactions.select({"Product": product, "Import/Export": direction})
+
+
+def sums_by_code(table, column, rows):
+    # Số giao dịch và tổng Amount theo mã của một cột categorical trên các dòng được chọn (một lần np.bincount).
+    # Amount thiếu (NaN) được tính là 0 như sum() của pandas.
+    codes = table.codes[column][rows].astype(np.int64)
+    valid = codes >= 0
+    size = len(table.categories[column])
+    counts = np.bincount(codes[valid], minlength=size)
+    weights = table.values["Amount"][rows][valid].astype(np.float64)
+    amounts = np.bincount(codes[valid], weights=np.where(np.isnan(weights), 0.0, weights), minlength=size)
+    return counts, amounts
+
+
+def search_descriptions(dataset, product, text, direction=None, k=None):
+    # Các mô tả hàng chứa từ khoá (không dấu, từ cuối theo tiền tố, "-từ" để loại trừ), kèm số giao dịch
+    # và tổng Amount, sắp xếp theo Amount giảm dần
+    table = dataset.transactions
+    rows = table.match("Product Description", text, product_rows(dataset, product, direction))
+    counts, amounts = sums_by_code(table, "Product Description", rows)
+    codes = np.flatnonzero(counts)
+    frame = pd.DataFrame({
+        "Product Description": table.categories["Product Description"][codes],
+        "count": counts[codes],
+        "Amount": amounts[codes],
+    })
+    frame = frame.sort_values("Amount", ascending=False, kind="stable", ignore_index=True)
+    return frame if k is None else frame.head(k)
+
+
+def search_companies(dataset, product, text, role="Purchaser", direction=None, k=10):
+    # Tìm gần đúng tên Purchaser/Supplier (trigram), kèm số giao dịch và tổng Amount của sản phẩm
+    table = dataset.transactions
+    codes, scores = table.search[role].fuzzy(text, k=k)
+    counts, amounts = sums_by_code(table, role, product_rows(dataset, product, direction))
+    return pd.DataFrame({
+        role: table.categories[role][codes],
+        "Score": scores.round(2),
+        "count": counts[codes],
+        "Amount": amounts[codes],
+    })
+
+
+def compare_cube(dataset, product_list, direction=None):
+    # Phần cube của nhiều sản phẩm cùng lúc (một phép lọc isin thay vì N lần lọc theo từng sản phẩm)
+    cube = dataset.cube
+    mask = cube["Product"].isin(product_list)
+    if direction is not None:
+        mask &= cube["Import/Export"] == direction
+    return cube[mask]
+
+
+def monthly_by_product(dataset, product_list, measure="Amount", direction="Export"):
+    # Chuỗi theo tháng của một chỉ tiêu cho nhiều sản phẩm trong một lần groupby, mỗi sản phẩm một cột
+    monthly = timeseries.panel(compare_cube(dataset, product_list, direction), "Product", measure)
+    return to_frame(monthly.reindex(columns=list(product_list), fill_value=0))
+
+
+def country_totals_by_product(dataset, product_list, direction="Export", k=10):
+    # Tổng Amount theo quốc gia cho nhiều sản phẩm trong một lần groupby; giữ k quốc gia có tổng lớn nhất
+    frame = compare_cube(dataset, product_list, direction).groupby(["Destination", "Product"], observed=True)["Amount"].sum()
+    frame = frame.unstack(fill_value=0)
+    frame = frame.reindex(columns=list(product_list), fill_value=0)
+    frame.columns = list(frame.columns)
+    frame = frame.iloc[aggregates.top_positions(frame.sum(axis=1).to_numpy(), k)]
+    frame.index = frame.index.astype(str)
+    return frame.rename_axis("Destination").reset_index()
+
+
+def top_companies_by_product(dataset, product_list, direction="Export", role="Purchaser", by="Destination", k=10):
+    # Top k doanh nghiệp cho từng sản phẩm, đọc từ tổng cộng dồn đã tính sẵn (không lọc lại dữ liệu)
+    return {product: top_companies(dataset, product, direction, role, by, k) for product in product_list}
+
+
+def compare(dataset, product_list, measure="Amount", direction="Export", role="Purchaser", k=10):
+    # Toàn bộ số liệu của chế độ so sánh nhiều sản phẩm
+    return {
+        "monthly": monthly_by_product(dataset, product_list, measure, direction),
+        "countries": country_totals_by_product(dataset, product_list, direction, k),
+        "top_companies": top_companies_by_product(dataset, product_list, direction, role, k=k),
+    }
+
+
+# Các truy vấn có tên, dùng cho API và truy vấn hàng loạt: tên -> (hàm, tham số mặc định)
+QUERIES = {
+    "monthly": (monthly_by_direction, {"measure": "count", "destination": None}),
+    "direction_total": (direction_total, {"direction": "Export", "measure": "count", "destination": None}),
+    "country_totals": (country_totals, {"direction": "Export"}),
+    "top_countries": (top_countries, {"direction": "Export", "k": 10}),
+    "top_companies": (top_companies, {"direction": "Export", "role": "Purchaser", "by": "Destination", "k": 20}),
+    "counterpart_total": (counterpart_total, {"direction": "Export", "role": "Purchaser"}),
+    "counterpart_monthly": (counterpart_monthly, {"direction": "Export", "role": "Purchaser"}),
+    "company_financials": (company_financials, {"direction": "Export", "role": "Supplier", "k": 20}),
+    "destination_growth": (destination_growth, {"direction": "Export", "measure": "Amount", "window": 3, "k": 10}),
+    "company_growth": (company_growth, {"direction": "Export", "role": "Purchaser", "measure": "Amount", "window": 3, "k": 10}),
+    "unit_prices": (unit_prices, {"direction": "Export", "basis": "Quantity", "destination": None}),
+    "price_outliers": (price_outliers, {"direction": "Export", "basis": "Quantity", "destination": None, "k": 50}),
+    "network_companies": (network_companies, {"direction": "Export", "role": "Supplier", "k": None}),
+    "counterparts": (counterparts, {"direction": "Export", "role": "Supplier", "company": "", "target": None, "k": 20}),
+    "shared_counterparts": (shared_counterparts, {"direction": "Export", "role": "Supplier", "company": "", "k": 10}),
+    "concentration": (concentration, {"direction": "Export", "role": "Supplier", "by": "Destination", "k": 20}),
+    "search_descriptions": (search_descriptions, {"text": "", "direction": None, "k": 50}),
+    "search_companies": (search_companies, {"text": "", "role": "Purchaser", "direction": None, "k": 10}),
+}
+
+
+def run(dataset, name, product, **params):
+    # Chạy một truy vấn có tên; tham số không khai báo trong QUERIES bị từ chối
+    if name not in QUERIES:
+        raise KeyError(f"Không có truy vấn {name}")
+    function, defaults = QUERIES[name]
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise TypeError(f"Tham số không hợp lệ cho {name}: {', '.join(sorted(unknown))}")
+    with telemetry.section(f"query {name}"):
+        return function(dataset, product, **{**defaults, **params})
+
+
+def view(dataset, name, product, **params):
+    # Như run() nhưng đọc kết quả tính sẵn (precompute.py) nếu có; kết quả được sao chép để người gọi
+    # sửa thoải mái mà không ảnh hưởng bản dùng chung
+    with telemetry.section(f"view {name}", cache="miss") as timer:
+        if name in QUERIES and dataset.views is not None:
+            _, defaults = QUERIES[name]
+            result = dataset.views.get(views.view_key(name, product, {**defaults, **params}))
+            if result is not None:
+                timer.cache = "hit"
+                return result.copy() if isinstance(result, (pd.DataFrame, pd.Series)) else result
+        return run(dataset, name, product, **params)
+
+
+def batch(dataset, product_list, queries):
+    # Chạy nhiều truy vấn cho nhiều sản phẩm trong một lần gọi.
+    # queries: {khoá kết quả: {"name": tên truy vấn, ...tham số}}; product_list None = mọi sản phẩm
+    if product_list is None:
+        product_list = products(dataset)
+    results = {}
+    for product in product_list:
+        results[product] = {}
+        for key, spec in queries.items():
+            params = dict(spec)
+            results[product][key] = view(dataset, params.pop("name", key), product, **params)
+    return results
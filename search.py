@@ -0,0 +1,131 @@
+import pickle
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Chỉ mục tìm kiếm toàn văn trên từ điển của các cột văn bản (mỗi giá trị khác nhau chỉ được tách từ một lần,
+# không phải mỗi dòng). Kết quả tìm kiếm là danh sách mã trong từ điển; lọc dòng chỉ là so sánh số nguyên
+# trên mảng mã của TransactionTable, không quét chuỗi bằng str.contains.
+
+# Các cột được đánh chỉ mục từ khoá; các cột tên doanh nghiệp có thêm chỉ mục trigram để tìm gần đúng
+TEXT_COLUMNS = ["Product Description", "Purchaser", "Supplier", "Purchaser_raw", "Supplier_raw"]
+FUZZY_COLUMNS = ["Purchaser", "Supplier"]
+
+# Chữ cái (mọi bảng chữ, vd. tên tiếng Nga) và chữ số; dấu câu và gạch dưới là dấu phân cách
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def normalize(text):
+    # Chữ thường, bỏ dấu tiếng Việt (đ -> d) để "Xoài sấy", "xoai say" và "XOAI SAY" như nhau
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    return "".join(char for char in text if unicodedata.category(char) != "Mn")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def trigrams(text):
+    # Các bộ 3 ký tự liên tiếp của chuỗi đã chuẩn hoá (gộp khoảng trắng, thêm khoảng trắng ở hai đầu)
+    text = f" {' '.join(tokenize(text))} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Postings:
+    # Danh sách mã theo khoá dạng CSR: khoá được sắp xếp, mã của khoá i nằm ở postings[offsets[i]:offsets[i + 1]]
+    def __init__(self, key_sets):
+        keys = [key for item in key_sets for key in item]
+        codes = np.repeat(np.arange(len(key_sets), dtype=np.int32), [len(item) for item in key_sets])
+        keys = np.array(keys, dtype=str)
+        order = np.lexsort((codes, keys))
+        self.keys, starts = np.unique(keys[order], return_index=True)
+        self.offsets = np.append(starts, len(order)).astype(np.int64)
+        self.codes = codes[order]
+
+    def range(self, low, high):
+        # Mã của các khoá ở vị trí low..high-1 (các khoá liền nhau nên là một đoạn liên tục)
+        return self.codes[self.offsets[low]:self.offsets[high]]
+
+    def get(self, key):
+        position = np.searchsorted(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.range(position, position + 1)
+        return self.codes[:0]
+
+    def prefix(self, prefix):
+        # Mã của mọi khoá bắt đầu bằng prefix (hai lần tìm nhị phân trên khoá đã sắp xếp)
+        low = np.searchsorted(self.keys, prefix, side="left")
+        high = np.searchsorted(self.keys, prefix + "\uffff", side="left")
+        return np.unique(self.range(low, high))
+
+
+class TextIndex:
+    # Chỉ mục cho một cột: từ khoá -> mã giá trị; với cột tên doanh nghiệp thêm trigram -> mã
+    def __init__(self, values, fuzzy=False):
+        self.size = len(values)
+        self.tokens = Postings([set(tokenize(value)) for value in values])
+        self.trigrams = None
+        if fuzzy:
+            grams = [trigrams(value) for value in values]
+            self.trigrams = Postings(grams)
+            self.trigram_counts = np.array([len(item) for item in grams], dtype=np.int32)
+
+    def match(self, text):
+        # Mã các giá trị chứa mọi từ trong text; từ cuối được so theo tiền tố (gõ dở vẫn khớp),
+        # từ bắt đầu bằng "-" bị loại trừ (vd. "xoai say -duong" cho loại không tẩm đường).
+        # Trả về None khi text không có từ nào (không lọc).
+        words = str(text).split()
+        include = [word for word in words if not word.startswith("-")]
+        exclude = [word[1:] for word in words if word.startswith("-")]
+        include_tokens = [token for word in include for token in tokenize(word)]
+        exclude_tokens = [token for word in exclude for token in tokenize(word)]
+        if not include_tokens and not exclude_tokens:
+            return None
+        result = np.arange(self.size, dtype=np.int32)
+        for i, token in enumerate(include_tokens):
+            codes = self.tokens.prefix(token) if i == len(include_tokens) - 1 else self.tokens.get(token)
+            result = np.intersect1d(result, codes, assume_unique=True)
+        for token in exclude_tokens:
+            result = np.setdiff1d(result, self.tokens.get(token), assume_unique=True)
+        return result
+
+    def fuzzy(self, text, k=10, min_score=0.2):
+        # Tìm gần đúng theo độ tương đồng Jaccard trên trigram; cộng số trigram chung bằng một lần np.bincount
+        grams = trigrams(text)
+        if self.trigrams is None or not grams:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        hits = np.concatenate([self.trigrams.get(gram) for gram in grams])
+        shared = np.bincount(hits, minlength=self.size)
+        scores = shared / (len(grams) + self.trigram_counts - shared).clip(min=1)
+        codes = np.flatnonzero(scores >= min_score)
+        order = np.lexsort((codes, -scores[codes]))[:k]
+        return codes[order], scores[codes[order]]
+
+
+class SearchIndex:
+    # Chỉ mục của mọi cột văn bản, xây cùng ảnh chụp dạng cột của một phiên bản dữ liệu
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    @classmethod
+    def build(cls, categories):
+        indexes = {}
+        for column in TEXT_COLUMNS:
+            if column in categories:
+                values = pd.Index(categories[column]).astype(str)
+                indexes[column] = TextIndex(values, fuzzy=column in FUZZY_COLUMNS)
+        return cls(indexes)
+
+    def __getitem__(self, column):
+        return self.indexes[column]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,665 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+
+import aggregates
+import entity_resolution
+import loader
+
+# Thư mục chứa dữ liệu dạng cột (Arrow IPC) sau khi ingest
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(BASE_DIR, "data_store")
+
+# Các tệp nguồn nằm sẵn trong repo; khi thiếu tệp cục bộ, ingest tải bản trong repo trên GitHub (loader.locate)
+TRADE_SOURCE = os.path.join(BASE_DIR, "TradeData_DriedMango_processed.xlsx")
+TCTK_SOURCE = os.path.join(BASE_DIR, "data_doanh_nghiep_TCTK.xlsx")
+
+# Tăng giá trị này khi thay đổi cách ghi store để các store cũ được ingest lại
+STORE_FORMAT = 10
+
+# Số dòng mỗi lô khi đọc tệp nguồn; bộ nhớ khi ingest tỉ lệ với kích thước lô chứ không với kích thước tệp
+CHUNK_ROWS = 100_000
+
+# Mảng số trong tổng hợp từ kích thước này trở lên (vd. ma trận kề CSR của đồ thị) được ghi thành tệp .npy riêng
+# và mở lại bằng memory-map chỉ đọc: mọi tiến trình dashboard/API đọc chung các trang thay vì giữ bản sao riêng
+MAPPED_ARRAY_BYTES = 4096
+
+# Các cột ít giá trị khác nhau được lưu dưới dạng categorical (dictionary trong Arrow)
+TRADE_CATEGORY_COLUMNS = [
+    "Data Source", "Import/Export", "Purchaser", "Supplier", "Destination", "Origin", "Product", "Month/Year",
+]
+# Cột văn bản gần như mỗi dòng một giá trị (mô tả hàng, tên gốc chưa chuẩn hoá) được lưu dạng chuỗi thường:
+# từ điển chung của chúng sẽ lớn dần theo số dòng và nằm trong bộ nhớ suốt lượt ingest.
+# Ảnh chụp dạng cột (transactions.build_columns) tự đánh mã các cột này khi xây.
+TRADE_TEXT_COLUMNS = ["Product Description", "Purchaser_raw", "Supplier_raw"]
+TCTK_CATEGORY_COLUMNS = ["Công ty", "Tên DN"]
+
+# Kiểu dữ liệu cố định cho các cột còn lại để mọi lô có cùng schema.
+# Weight/Quantity dùng float32 (7 chữ số có nghĩa là đủ, tổng vẫn cộng bằng float64);
+# Amount là tiền và HS Code có 8 chữ số (vượt 2**24) nên giữ float64.
+COLUMN_TYPES = {
+    "trade": {
+        "Date": "datetime64[ns]",
+        "HS Code_raw": "float64",
+        "HS Code": "float64",
+        "Weight": "float32",
+        "Quantity": "float32",
+        "Amount": "float64",
+        **{column: "str" for column in TRADE_TEXT_COLUMNS},
+    },
+    "tctk": {
+        "Doanh thu (triệu đồng)": "float64",
+        "Lợi nhuận (triệu đồng)": "float64",
+        "Thị phần (%)": "float64",
+    },
+}
+
+# Các cột mã số thuế được chuẩn hoá về chuỗi 10 chữ số khi ingest
+TAX_CODE_COLUMNS = {
+    "trade": ["Supplier_code", "Purchaser_code"],
+    "tctk": ["Mã số thuế"],
+}
+# Mã dùng cho các dòng không có mã số thuế (giữ nguyên cách làm cũ: fillna(0) rồi zfill)
+MISSING_TAX_CODE = "0000000000"
+
+TABLES = {
+    "trade": (TRADE_SOURCE, TRADE_CATEGORY_COLUMNS),
+    "tctk": (TCTK_SOURCE, TCTK_CATEGORY_COLUMNS),
+}
+
+
+def iter_excel(path, chunksize):
+    # Đọc Excel ở chế độ read_only (streaming) và trả về từng lô DataFrame.
+    # data_only=True lấy giá trị đã tính của các ô công thức như read_excel.
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [f"Unnamed: {i}" if name is None else str(name) for i, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            # Bỏ các dòng trống hoàn toàn ở cuối sheet
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(columns)])
+            if len(batch) == chunksize:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_source(path, chunksize=CHUNK_ROWS):
+    # Đọc tệp nguồn Excel hoặc CSV theo từng lô, không tải cả tệp vào bộ nhớ
+    if path.lower().endswith(".csv"):
+        chunks = pd.read_csv(path, index_col=0, chunksize=chunksize)
+    else:
+        chunks = iter_excel(path, chunksize)
+    for chunk in chunks:
+        # Bỏ cột chỉ số thừa khi xuất từ pandas ra Excel
+        yield chunk.drop(columns=["Unnamed: 0"], errors="ignore")
+
+
+def coerce_types(data, column_types):
+    # Ép kiểu các cột ngày, số và chuỗi theo COLUMN_TYPES; giá trị không đọc được thành NaN/NaT
+    for column, dtype in column_types.items():
+        if column not in data.columns:
+            continue
+        if dtype.startswith("datetime"):
+            data[column] = pd.to_datetime(data[column], errors="coerce")
+        elif dtype == "str":
+            # Giữ giá trị thiếu; giá trị khác thành chuỗi để mọi lô cùng kiểu (vd. lô chỉ có tên toàn chữ số)
+            values = data[column].astype(object)
+            data[column] = values.where(values.isna(), values.astype(str))
+        else:
+            data[column] = pd.to_numeric(data[column], errors="coerce").astype(dtype)
+    return data
+
+
+def to_columnar(data, category_columns):
+    # Ép kiểu các cột chuỗi thành categorical để Arrow lưu dưới dạng dictionary
+    data = data.reset_index(drop=True)
+    for column in category_columns:
+        if column in data.columns:
+            data[column] = data[column].astype("category")
+    return data
+
+
+def normalize_tax_codes(values):
+    # Chuẩn hoá mã số thuế bằng phép toán vector: chỉ định dạng chuỗi cho các giá trị duy nhất
+    values = pd.Series(values).reset_index(drop=True)
+    numbers = pd.to_numeric(values, errors="coerce")
+
+    # Ghi nhận lý do mã không hợp lệ cho từng dòng (None nếu hợp lệ hoặc bị thiếu)
+    reasons = pd.Series(None, index=values.index, dtype="object")
+    reasons[numbers.isna() & values.notna()] = "không phải số"
+    reasons[numbers < 0] = "số âm"
+    reasons[numbers.notna() & (numbers % 1 != 0)] = "không phải số nguyên"
+    reasons[numbers >= 10**10] = "quá 10 chữ số"
+
+    # Mã thiếu hoặc không hợp lệ được đưa về 0000000000 như trước đây
+    valid = numbers.where(reasons.isna()).fillna(0).astype("int64")
+    codes, uniques = pd.factorize(valid, sort=True)
+    categories = pd.Index(uniques.astype(str)).str.zfill(10)
+    return pd.Categorical.from_codes(codes, categories=categories), reasons
+
+
+def normalize_table_codes(data, columns):
+    # Chuẩn hoá các cột mã số thuế và gom toàn bộ mã lỗi vào một bảng báo cáo
+    issues = []
+    for column in columns:
+        if column not in data.columns:
+            data[column] = pd.Categorical([MISSING_TAX_CODE] * len(data))
+            continue
+        raw = data[column]
+        data[column], reasons = normalize_tax_codes(raw)
+        bad = reasons.notna().to_numpy()
+        issues.append(pd.DataFrame({
+            "column": column,
+            "row": data.index[bad],
+            "value": raw[bad].astype(str).to_numpy(),
+            "reason": reasons[bad].to_numpy(),
+        }))
+        issues.append(pd.DataFrame({
+            "column": column,
+            "row": data.index[raw.isna().to_numpy()],
+            "value": "",
+            "reason": "thiếu mã",
+        }))
+    if not issues:
+        return data, pd.DataFrame(columns=["column", "row", "value", "reason"])
+    return data, pd.concat(issues, ignore_index=True)
+
+
+def summarize_tax_code_issues(issues):
+    # Tổng hợp số lượng mã lỗi theo cột và lý do
+    if issues.empty:
+        return {}
+    counts = issues.groupby(["column", "reason"]).size()
+    summary = {}
+    for (column, reason), count in counts.items():
+        summary.setdefault(column, {})[reason] = int(count)
+    return summary
+
+
+def merge_issue_counts(total, counts):
+    for column, reasons in counts.items():
+        for reason, count in reasons.items():
+            total.setdefault(column, {})
+            total[column][reason] = total[column].get(reason, 0) + count
+    return total
+
+
+def table_path(name, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"{name}.arrow")
+
+
+def part_name(name, part):
+    # Tên tệp của phần dữ liệu append thứ part (phần gốc là {name}.arrow)
+    return f"{name}.{part:04d}.arrow"
+
+
+def table_parts(name, manifest):
+    # Danh sách tệp của một bảng theo manifest: phần gốc rồi đến các lô đã append theo thứ tự
+    info = (manifest or {}).get("tables", {}).get(name, {})
+    return [f"{name}.arrow"] + [batch["part"] for batch in info.get("batches", [])]
+
+
+def aggregates_dir(version, store_dir=STORE_DIR):
+    # Tổng hợp của một phiên bản dữ liệu: aggregates.pkl (các bảng theo nhóm, mọi tiến trình đọc), các mảng số lớn
+    # arrays/*.npy (mở bằng memory-map, xem ArrayPickler) và các mảng theo từng dòng .npz (đơn giá của từng giao dịch)
+    # chỉ append đọc lại, dashboard không tải
+    return os.path.join(store_dir, f"aggregates-{version}")
+
+
+def aggregates_path(version, store_dir=STORE_DIR):
+    return os.path.join(aggregates_dir(version, store_dir), "aggregates.pkl")
+
+
+def downloads_dir(store_dir=STORE_DIR):
+    # Bộ nhớ đệm của các tệp nguồn tải qua HTTP(S)
+    return os.path.join(store_dir, "downloads")
+
+
+def companies_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, "companies.pkl")
+
+
+def manifest_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, "manifest.json")
+
+
+def read_manifest(store_dir=STORE_DIR):
+    try:
+        with open(manifest_path(store_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class TableWriter:
+    # Ghi bảng vào tệp Arrow IPC dạng stream (không nén, đọc được bằng memory-map) theo từng lô,
+    # bộ nhớ chỉ tỉ lệ với một lô. Cột categorical dùng một từ điển chung tăng dần qua các lô:
+    # mỗi lô chỉ ghi thêm phần giá trị mới (dictionary delta), mã của giá trị cũ không đổi.
+    # Dùng dạng stream vì dạng file không cho phép từ điển rỗng ở lô đầu (cột toàn null) rồi có giá trị sau.
+    def __init__(self, path, category_columns):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self.category_columns = category_columns
+        self.lookups = {}
+        self.vocabularies = {}
+        self.schema = None
+        self.sink = None
+        self.writer = None
+        self.rows = 0
+
+    def encode(self, column, values, value_type):
+        # Đổi mã categorical của lô sang mã trong từ điển chung
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype("category")
+        lookup = self.lookups.setdefault(column, {})
+        vocabulary = self.vocabularies.setdefault(column, [])
+        ids = np.empty(len(values.cat.categories) + 1, dtype=np.int32)
+        for i, value in enumerate(values.cat.categories):
+            if value not in lookup:
+                lookup[value] = len(vocabulary)
+                vocabulary.append(value)
+            ids[i] = lookup[value]
+        ids[-1] = 0
+        codes = values.cat.codes.to_numpy()
+        indices = pa.array(ids[codes], mask=codes < 0)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(vocabulary, type=value_type))
+
+    def write(self, data):
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        for column in data.columns:
+            # Cột categorical ngoài category_columns (vd. mã số thuế đã chuẩn hoá) cũng dùng từ điển chung:
+            # nếu không mỗi lô ghi một từ điển thay thế riêng, không phải delta của từ điển trước
+            if column not in self.category_columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+                continue
+            index = table.schema.get_field_index(column)
+            if self.schema is not None:
+                value_type = self.schema.field(column).type.value_type
+            else:
+                value_type = table.schema.field(index).type
+                if pa.types.is_dictionary(value_type):
+                    value_type = value_type.value_type
+                if pa.types.is_null(value_type):
+                    value_type = pa.string()
+            table = table.set_column(index, column, self.encode(column, data[column], value_type))
+        if self.writer is None:
+            # Cột chuỗi toàn null ở lô đầu được ghi kiểu chuỗi để các lô sau có giá trị vẫn khớp schema
+            for index, field in enumerate(table.schema):
+                if pa.types.is_null(field.type):
+                    table = table.set_column(index, field.name, table.column(index).cast(pa.string()))
+            self.schema = table.schema
+            self.sink = pa.OSFile(self.tmp_path, "wb")
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_stream(self.sink, self.schema, options=options)
+        else:
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+        self.rows += len(data)
+
+    def close(self):
+        if self.writer is None:
+            return None
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+
+def write_table(data, name, category_columns=(), store_dir=STORE_DIR):
+    # Ghi cả một DataFrame vào store (một lô)
+    writer = TableWriter(table_path(name, store_dir), category_columns)
+    writer.write(data)
+    return writer.close()
+
+
+def ingest_table(name, source, path, chunksize=CHUNK_ROWS, trade_aggregates=None):
+    # Ingest một tệp nguồn theo từng lô: ép kiểu, chuẩn hoá mã số thuế, ghi lô vào tệp path
+    # và cộng dồn vào các tổng hợp (nếu có). Không lô nào được giữ lại sau khi xử lý.
+    _, category_columns = TABLES[name]
+    writer = TableWriter(path, category_columns)
+    issue_counts = {}
+    for chunk in iter_source(source, chunksize):
+        chunk = to_columnar(coerce_types(chunk, COLUMN_TYPES.get(name, {})), category_columns)
+        # Đánh số dòng theo vị trí trong cả tệp để báo cáo mã lỗi đúng dòng
+        chunk.index = pd.RangeIndex(writer.rows, writer.rows + len(chunk))
+        chunk, issues = normalize_table_codes(chunk, TAX_CODE_COLUMNS.get(name, []))
+        merge_issue_counts(issue_counts, summarize_tax_code_issues(issues))
+        writer.write(chunk)
+        if trade_aggregates is not None:
+            trade_aggregates.add(chunk)
+    writer.close()
+    return {
+        "source": os.path.basename(source),
+        "rows": writer.rows,
+        "source_mtime": os.path.getmtime(source),
+        "tax_code_issues": issue_counts,
+    }
+
+
+class ArrayPickler(pickle.Pickler):
+    # Pickle các tổng hợp, trừ mảng số lớn: mỗi mảng thành một tệp arrays/<số>.npy, pickle chỉ giữ tên tệp
+    def __init__(self, file, path):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.path = path
+        self.count = 0
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.kind not in "biuf" or obj.nbytes < MAPPED_ARRAY_BYTES:
+            return None
+        name = f"{self.count:05d}.npy"
+        self.count += 1
+        np.save(os.path.join(self.path, name), obj)
+        return name
+
+
+class ArrayUnpickler(pickle.Unpickler):
+    # Mở lại các mảng đã tách bằng memory-map chỉ đọc (không sao chép vào bộ nhớ riêng của tiến trình)
+    def __init__(self, file, path):
+        super().__init__(file)
+        self.path = path
+
+    def persistent_load(self, name):
+        return np.asarray(np.load(os.path.join(self.path, name), mmap_mode="r"))
+
+
+def write_aggregates(trade_aggregates, version, store_dir=STORE_DIR):
+    # Tính các thống kê cần toàn bộ dữ liệu (phân bố đơn giá) của các lô vừa cộng trước khi ghi.
+    # Ghi vào thư mục tạm rồi đổi tên nguyên tử thành thư mục của phiên bản
+    trade_aggregates.finish()
+    target = aggregates_dir(version, store_dir)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, "arrays"))
+    trade_aggregates.save_rows(tmp_path)
+    with open(os.path.join(tmp_path, "aggregates.pkl"), "wb") as f:
+        ArrayPickler(f, os.path.join(tmp_path, "arrays")).dump(trade_aggregates)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_path, target)
+    return target
+
+
+def read_aggregates(store_dir=STORE_DIR, version=None, rows=False):
+    # Tổng hợp được tính sẵn khi ingest (cube, top-K, đếm doanh nghiệp khác nhau, phân bố đơn giá, đồ thị).
+    # rows=True mở thêm các mảng theo từng dòng để cộng tiếp lô mới (append)
+    if version is None:
+        version = data_version(store_dir)
+    path = aggregates_dir(version, store_dir)
+    with open(os.path.join(path, "aggregates.pkl"), "rb") as f:
+        trade_aggregates = ArrayUnpickler(f, os.path.join(path, "arrays")).load()
+    if rows:
+        trade_aggregates.load_rows(path)
+    return trade_aggregates
+
+
+def prune_aggregates(version, store_dir=STORE_DIR):
+    # Bỏ tổng hợp của các phiên bản cũ; giữ phiên bản ngay trước cho tiến trình vừa đọc manifest cũ.
+    # aggregates.pkl ở thư mục gốc là tệp của định dạng cũ (trước khi tách theo phiên bản)
+    legacy = os.path.join(store_dir, "aggregates.pkl")
+    if os.path.exists(legacy):
+        os.remove(legacy)
+    for entry in os.listdir(store_dir):
+        if entry.startswith("aggregates-") and not entry.endswith(".tmp"):
+            if int(entry.split("-", 1)[1]) < version - 1:
+                shutil.rmtree(os.path.join(store_dir, entry), ignore_errors=True)
+
+
+def write_companies(companies, store_dir=STORE_DIR):
+    path = companies_path(store_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(companies, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_companies(store_dir=STORE_DIR):
+    # Bảng doanh nghiệp chuẩn (entity_resolution.CompanyResolution), None nếu chưa chạy resolve_companies()
+    try:
+        with open(companies_path(store_dir), "rb") as f:
+            return pickle.load(f)
+    except OSError:
+        return None
+
+
+def write_manifest(manifest, store_dir=STORE_DIR):
+    # Manifest được ghi sau cùng và thay thế nguyên tử: người đọc luôn thấy một phiên bản hoàn chỉnh
+    path = manifest_path(store_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def label_source(info, source):
+    # Manifest ghi tên tệp và URL gốc thay vì đường dẫn của bản trong cache tải về
+    info["source"] = loader.source_name(source)
+    if loader.is_url(source):
+        info["url"] = source
+    return info
+
+
+def fetch_and_ingest(downloader, name, source, path, chunksize=CHUNK_ROWS, trade_aggregates=None):
+    # Tải nguồn (nếu là URL, qua cache) rồi ingest
+    return label_source(ingest_table(name, downloader.fetch(source), path, chunksize, trade_aggregates), source)
+
+
+def ingest(sources=None, store_dir=STORE_DIR, chunksize=CHUNK_ROWS):
+    # Xây lại toàn bộ store từ các tệp nguồn Excel/CSV (đường dẫn hoặc URL http(s)) theo từng lô.
+    # Các lô đã append trước đó bị bỏ; dùng append() cho dữ liệu mới hằng tháng.
+    sources = dict(sources or {})
+    # Mỗi lần ingest tăng phiên bản dữ liệu để các cache phía sau (hình, tổng hợp) được làm mới
+    previous = read_manifest(store_dir) or {}
+    manifest = {"format": STORE_FORMAT, "version": previous.get("version", 0) + 1, "tables": {}}
+    trade_aggregates = aggregates.TradeAggregates(read_companies(store_dir))
+    downloader = loader.Loader(downloads_dir(store_dir))
+    # Mỗi bảng tải và ingest trên một luồng riêng: bảng này được đọc trong khi bảng kia còn đang tải,
+    # nên thời gian khởi động lạnh gần với bảng chậm nhất thay vì tổng của các bảng
+    with ThreadPoolExecutor(max_workers=len(TABLES)) as pool:
+        tasks = {
+            name: pool.submit(
+                fetch_and_ingest, downloader, name, sources.get(name) or loader.locate(default_source),
+                table_path(name, store_dir), chunksize, trade_aggregates if name == "trade" else None,
+            )
+            for name, (default_source, _) in TABLES.items()
+        }
+        for name, task in tasks.items():
+            manifest["tables"][name] = task.result()
+    write_aggregates(trade_aggregates, manifest["version"], store_dir)
+    write_manifest(manifest, store_dir)
+    prune_aggregates(manifest["version"], store_dir)
+    # Xoá các tệp của lô append cũ không còn trong manifest mới
+    for name in TABLES:
+        for part in table_parts(name, previous)[1:]:
+            if os.path.exists(os.path.join(store_dir, part)):
+                os.remove(os.path.join(store_dir, part))
+    return manifest
+
+
+def append(source, name="trade", store_dir=STORE_DIR, chunksize=CHUNK_ROWS):
+    # Thêm một lô giao dịch mới (vd. dữ liệu hải quan của một tháng) vào store mà không đọc lại lịch sử:
+    # lô được ghi thành một tệp phần riêng, chỉ các ô tổng hợp mà lô chạm tới được cập nhật,
+    # rồi phiên bản dữ liệu tăng lên để các cache phía sau được làm mới.
+    ensure_store(store_dir)
+    manifest = read_manifest(store_dir)
+    info = manifest["tables"][name]
+    batches = info.setdefault("batches", [])
+    # URL được tải vào cache trước; tệp không đổi (304) giữ nguyên thời điểm sửa nên vẫn bị nhận ra là trùng
+    path = loader.Loader(downloads_dir(store_dir)).fetch(source)
+    mtime = os.path.getmtime(path)
+    for batch in batches:
+        if batch["source"] == loader.source_name(source) and batch["source_mtime"] == mtime:
+            raise ValueError(f"Lô {source} đã được append (phần {batch['part']})")
+
+    trade_aggregates = read_aggregates(store_dir, manifest["version"], rows=True) if name == "trade" else None
+    part = part_name(name, len(batches) + 1)
+    batch = label_source(ingest_table(name, path, os.path.join(store_dir, part), chunksize, trade_aggregates=trade_aggregates), source)
+    batch["part"] = part
+    batches.append(batch)
+    info["rows"] += batch["rows"]
+    if trade_aggregates is not None:
+        write_aggregates(trade_aggregates, manifest["version"] + 1, store_dir)
+    else:
+        # Bảng khác không đổi tổng hợp: phiên bản mới dùng lại các tệp tổng hợp của phiên bản trước (hard link)
+        shutil.copytree(aggregates_dir(manifest["version"], store_dir), aggregates_dir(manifest["version"] + 1, store_dir), copy_function=os.link)
+    manifest["version"] += 1
+    write_manifest(manifest, store_dir)
+    prune_aggregates(manifest["version"], store_dir)
+    return manifest
+
+
+def iter_table_batches(name, store_dir=STORE_DIR):
+    # Đọc lần lượt các lô đã ghi của một bảng (mọi phần) thành DataFrame, bộ nhớ chỉ tỉ lệ với một lô
+    for part in table_parts(name, read_manifest(store_dir)):
+        for batch in pa.ipc.open_stream(pa.memory_map(os.path.join(store_dir, part))):
+            yield batch.to_pandas()
+
+
+def company_pairs(store_dir=STORE_DIR):
+    # Các cặp (tên doanh nghiệp, mã số thuế) khác nhau của từng vai trò và số giao dịch, đọc từ store theo lô
+    pairs = {role: [] for role in entity_resolution.ROLES}
+    for data in iter_table_batches("trade", store_dir):
+        for role, code_column in entity_resolution.ROLES.items():
+            frame = pd.DataFrame({
+                "name": data[role].astype("object"),
+                "code": data[code_column].astype("object") if code_column in data else MISSING_TAX_CODE,
+            })
+            counts = frame.groupby(["name", "code"], dropna=False).size().rename("count").reset_index()
+            pairs[role].append(counts)
+    return {
+        role: pd.concat(frames, ignore_index=True).groupby(["name", "code"], dropna=False)["count"].sum().reset_index()
+        for role, frames in pairs.items()
+    }
+
+
+def rebuild_aggregates(store_dir=STORE_DIR):
+    # Tính lại các tổng hợp từ dữ liệu đã ghi trong store (không đọc lại tệp nguồn), dùng bảng doanh nghiệp
+    # chuẩn hiện tại, rồi tăng phiên bản dữ liệu
+    manifest = read_manifest(store_dir)
+    trade_aggregates = aggregates.TradeAggregates(read_companies(store_dir))
+    for data in iter_table_batches("trade", store_dir):
+        trade_aggregates.add(data)
+    write_aggregates(trade_aggregates, manifest["version"] + 1, store_dir)
+    manifest["version"] += 1
+    write_manifest(manifest, store_dir)
+    prune_aggregates(manifest["version"], store_dir)
+    return manifest
+
+
+def resolve_companies(store_dir=STORE_DIR, threshold=entity_resolution.THRESHOLD):
+    # Bước offline: gộp biến thể tên doanh nghiệp thành mã doanh nghiệp chuẩn, lưu bảng vào store
+    # và tính lại các tổng hợp theo bảng đó. Các lần ingest/append sau dùng lại bảng đã lưu.
+    ensure_store(store_dir)
+    companies = entity_resolution.CompanyResolution.build(company_pairs(store_dir), threshold)
+    write_companies(companies, store_dir)
+    manifest = rebuild_aggregates(store_dir)
+    manifest["companies"] = {
+        role: {
+            "names": len(table),
+            "companies": int(table["company_id"].nunique()),
+            # Số tên không có mã số thuế nhưng nhận được mã của doanh nghiệp chuẩn
+            "tax_codes_filled": int(((table["code"] == MISSING_TAX_CODE) & (table["tax_code"] != MISSING_TAX_CODE)).sum()),
+        }
+        for role, table in companies.tables.items()
+    }
+    return write_manifest(manifest, store_dir)
+
+
+def is_stale(store_dir=STORE_DIR):
+    # Store cần ingest lại khi chưa có, khác định dạng hoặc tệp nguồn mới hơn
+    manifest = read_manifest(store_dir)
+    if manifest is None or manifest.get("format") != STORE_FORMAT:
+        return True
+    if not os.path.exists(aggregates_path(manifest.get("version", 0), store_dir)):
+        return True
+    for name, (source, _) in TABLES.items():
+        info = manifest["tables"].get(name)
+        if info is None:
+            return True
+        if not all(os.path.exists(os.path.join(store_dir, part)) for part in table_parts(name, manifest)):
+            return True
+        if os.path.basename(source) == info["source"] and os.path.exists(source):
+            if os.path.getmtime(source) > info["source_mtime"]:
+                return True
+    return False
+
+
+def read_table(name, store_dir=STORE_DIR):
+    # Mở bảng bằng memory-map, không cần tải qua mạng
+    # Ghép phần gốc và các lô đã append; cột thiếu ở một phần được điền null
+    tables = [
+        pa.ipc.open_stream(pa.memory_map(os.path.join(store_dir, part))).read_all()
+        for part in table_parts(name, read_manifest(store_dir))
+    ]
+    data = pa.concat_tables(tables, promote_options="default").to_pandas()
+    # Từ điển chung được ghi theo thứ tự xuất hiện; sắp xếp lại categories như astype("category")
+    # để groupby/sort trên cột categorical cho kết quả như trước
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            categories = data[column].cat.categories
+            if not categories.is_monotonic_increasing:
+                data[column] = data[column].cat.reorder_categories(categories.sort_values())
+    return data
+
+
+def data_version(store_dir=STORE_DIR):
+    manifest = read_manifest(store_dir)
+    return manifest.get("version", 0) if manifest else 0
+
+
+def ensure_store(store_dir=STORE_DIR):
+    if is_stale(store_dir):
+        ingest(store_dir=store_dir)
+
+
+def open_store(store_dir=STORE_DIR):
+    ensure_store(store_dir)
+    return {name: read_table(name, store_dir) for name in TABLES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest dữ liệu nguồn vào store dạng cột")
+    parser.add_argument("--trade", help="Tệp giao dịch (.xlsx hoặc .csv, đường dẫn hoặc URL http(s); mặc định: tệp trong repo)")
+    parser.add_argument("--tctk", help="Tệp doanh nghiệp TCTK (.xlsx hoặc .csv, đường dẫn hoặc URL http(s); mặc định: tệp trong repo)")
+    parser.add_argument("--store", default=STORE_DIR, help="Thư mục store")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Số dòng mỗi lô khi đọc tệp nguồn")
+    parser.add_argument("--append", metavar="PATH", help="Thêm một lô giao dịch mới thay vì xây lại toàn bộ store")
+    parser.add_argument("--resolve-companies", action="store_true", help="Gộp biến thể tên doanh nghiệp và tính lại các tổng hợp")
+    parser.add_argument("--threshold", type=float, default=entity_resolution.THRESHOLD, help="Ngưỡng tương đồng khi gộp tên")
+    args = parser.parse_args()
+
+    if args.resolve_companies:
+        result = resolve_companies(args.store, args.threshold)
+        for role, info in result["companies"].items():
+            print(f"{role}: {info['names']} tên -> {info['companies']} doanh nghiệp (phiên bản {result['version']})")
+        reports = {}
+    elif args.append:
+        result = append(args.append, store_dir=args.store, chunksize=args.chunk_rows)
+        batch = result["tables"]["trade"]["batches"][-1]
+        print(f"Đã append {batch['rows']} dòng từ {batch['source']} vào {batch['part']} (phiên bản {result['version']})")
+        reports = {batch["part"]: batch}
+    else:
+        result = ingest({"trade": args.trade, "tctk": args.tctk}, store_dir=args.store, chunksize=args.chunk_rows)
+        reports = result["tables"]
+        for name, info in reports.items():
+            print(f"{name}: {info['rows']} dòng từ {info['source']}")
+    for name, info in reports.items():
+        for column, reasons in info["tax_code_issues"].items():
+            for reason, count in reasons.items():
+                print(f"  {column}: {count} dòng {reason}")
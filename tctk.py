@@ -0,0 +1,39 @@
+import pandas as pd
+
+# Khoá là mã số thuế đã chuẩn hoá 10 chữ số (xem store.normalize_tax_codes)
+TAX_CODE_COLUMN = "Mã số thuế"
+NAME_COLUMN = "Tên DN"
+YEAR_COLUMN = "Năm"
+FINANCIAL_COLUMNS = ["Doanh thu (triệu đồng)", "Lợi nhuận (triệu đồng)", "Số lao động (người)"]
+
+
+class CompanyFinancials:
+    # Dữ liệu doanh nghiệp TCTK đánh chỉ mục theo mã số thuế, với bảng pivot tài chính theo năm
+    # được tính sẵn cho từng doanh nghiệp. Tra cứu K doanh nghiệp chỉ tốn O(K), không cần merge.
+    def __init__(self, data_tctk):
+        codes = data_tctk[TAX_CODE_COLUMN].astype(str)
+        frame = data_tctk.assign(**{TAX_CODE_COLUMN: codes})
+        self.pivot = pd.pivot_table(
+            frame,
+            index=TAX_CODE_COLUMN,
+            columns=YEAR_COLUMN,
+            values=FINANCIAL_COLUMNS,
+            aggfunc="sum",
+            observed=True,
+        )
+        self.names = frame.groupby(TAX_CODE_COLUMN, observed=True)[NAME_COLUMN].first().astype(str)
+
+    def __contains__(self, code):
+        return code in self.pivot.index
+
+    def lookup(self, codes):
+        # Tra cứu hàng loạt theo danh sách mã số thuế bất kỳ; chỉ trả về các mã có trong TCTK
+        codes = pd.Index(pd.unique(pd.Series(codes, dtype="object").astype(str)))
+        codes = codes[codes.isin(self.pivot.index)]
+        return self.pivot.loc[codes]
+
+    def table(self, codes):
+        # Bảng hiển thị: mỗi dòng là một doanh nghiệp (theo Tên DN), cột là (chỉ tiêu, Năm)
+        result = self.lookup(codes)
+        result = result.set_axis(self.names.loc[result.index].rename(NAME_COLUMN))
+        return result.sort_index().dropna(axis=1, how="all")
@@ -0,0 +1,297 @@
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Đo thời gian theo từng phần có tên (PHẦN 1, truy vấn, dựng hình...) trong tiến trình: thời gian thực (wall),
+# thời gian CPU của luồng và đỉnh bộ nhớ (khi bật tracemalloc), tách theo cache trúng/trượt.
+# Số liệu được cộng vào histogram dùng chung cho mọi phiên Streamlit/mọi yêu cầu API của tiến trình
+# (module chỉ được import một lần), xem trên trang quản trị ẩn của dashboard (?admin=telemetry) hoặc /metrics của api.py.
+#   TELEMETRY_MEMORY=1  bật đo bộ nhớ bằng tracemalloc (chậm hơn đáng kể, chỉ nên bật khi cần)
+#   TELEMETRY_SAMPLE=1  bật lấy mẫu ngăn xếp cho flamegraph từ lúc khởi động
+
+# Biên trên của các khoảng histogram thời gian (giây); khoảng cuối là vô hạn
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+# Chu kỳ lấy mẫu ngăn xếp (giây)
+SAMPLE_INTERVAL = 0.005
+
+
+class Histogram:
+    # Phân bố thời gian của một phần: số lần rơi vào mỗi khoảng, tổng wall/CPU và đỉnh bộ nhớ lớn nhất
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.peak_memory = None
+
+    def observe(self, wall, cpu, memory=None):
+        self.buckets[bisect.bisect_left(BUCKETS, wall)] += 1
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+        if memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, memory)
+
+    def quantile(self, q):
+        # Ước lượng bằng biên trên của khoảng chứa phân vị q (không lớn hơn giá trị lớn nhất đã gặp)
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max_wall)
+        return self.max_wall
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "mean_seconds": self.wall / self.count if self.count else 0.0,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "p99_seconds": self.quantile(0.99),
+            "max_seconds": self.max_wall,
+            "peak_memory_bytes": self.peak_memory,
+            "buckets": dict(zip([str(bound) for bound in BUCKETS], self.buckets)),
+        }
+
+
+class Registry:
+    # Histogram theo (tên phần, cache) và các bộ đếm sự kiện; mọi thao tác đều có khoá vì nhiều phiên ghi cùng lúc
+    def __init__(self):
+        self.histograms = {}
+        self.counters = Counter()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, name, wall, cpu, memory=None, cache=None):
+        with self.lock:
+            histogram = self.histograms.get((name, cache))
+            if histogram is None:
+                histogram = self.histograms[(name, cache)] = Histogram()
+            histogram.observe(wall, cpu, memory)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        # Bản sao số liệu dạng dict (JSON được), các phần sắp xếp theo tổng thời gian giảm dần
+        with self.lock:
+            sections = [
+                {"section": name, "cache": cache, **histogram.summary()}
+                for (name, cache), histogram in self.histograms.items()
+            ]
+            counters = dict(self.counters)
+            started = self.started
+        sections.sort(key=lambda item: item["wall_seconds"], reverse=True)
+        return {
+            "uptime_seconds": time.time() - started,
+            "memory_tracing": tracemalloc.is_tracing(),
+            "sections": sections,
+            "counters": counters,
+        }
+
+    def prometheus(self):
+        # Số liệu theo định dạng văn bản của Prometheus (histogram cộng dồn theo le)
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE dash_section_seconds histogram",
+        ]
+        for item in snapshot["sections"]:
+            labels = f'section="{escape(item["section"])}",cache="{escape(item["cache"] or "")}"'
+            cumulative = 0
+            for bound, count in item["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'dash_section_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"dash_section_seconds_sum{{{labels}}} {item['wall_seconds']}")
+            lines.append(f"dash_section_seconds_count{{{labels}}} {item['count']}")
+            lines.append(f"dash_section_cpu_seconds_total{{{labels}}} {item['cpu_seconds']}")
+            if item["peak_memory_bytes"] is not None:
+                lines.append(f"dash_section_peak_memory_bytes{{{labels}}} {item['peak_memory_bytes']}")
+        lines.append("# TYPE dash_events_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'dash_events_total{{name="{escape(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Registry dùng chung của tiến trình
+registry = Registry()
+
+# Các phần đang chạy của từng luồng (để đỉnh bộ nhớ của phần con được tính vào phần cha)
+active = threading.local()
+# Các luồng đang ở trong ít nhất một phần (Sampler chỉ lấy mẫu các luồng này, bỏ qua luồng rảnh của server)
+busy_threads = set()
+
+
+class Section:
+    # with telemetry.section("PHẦN 1"): ...  — có thể gán section.cache = "hit"/"miss" bên trong khối.
+    # Đỉnh bộ nhớ dùng tracemalloc của cả tiến trình nên là gần đúng khi nhiều phiên chạy cùng lúc.
+    def __init__(self, name, cache=None, registry=registry):
+        self.name = name
+        self.cache = cache
+        self.registry = registry
+        self.peak = 0
+
+    def start(self):
+        stack = active.__dict__.setdefault("stack", [])
+        if not stack:
+            busy_threads.add(threading.get_ident())
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak() xoá đỉnh của phần cha: ghi lại trước khi đặt lại
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        stack.append(self)
+        self.start_cpu = time.thread_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def stop(self):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.thread_time() - self.start_cpu
+        stack = active.stack
+        if self in stack:
+            stack.remove(self)
+        if not stack:
+            busy_threads.discard(threading.get_ident())
+        memory = None
+        if tracemalloc.is_tracing() and hasattr(self, "memory_start"):
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+            memory = max(0, peak - self.memory_start)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        self.registry.observe(self.name, wall, cpu, memory, self.cache)
+        return wall
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def section(name, cache=None):
+    return Section(name, cache)
+
+
+def timed(name):
+    # Decorator: mỗi lần gọi hàm được đo như một phần có tên name
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    registry.count(name, amount)
+
+
+def memory_tracing():
+    return tracemalloc.is_tracing()
+
+
+def set_memory_tracing(enabled):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Sampler:
+    # Lấy mẫu ngăn xếp của mọi luồng theo chu kỳ và cộng dồn dạng "folded" (mỗi dòng: hàm gốc;...;hàm lá số mẫu),
+    # đầu vào của flamegraph.pl hoặc speedscope. Chỉ đọc sys._current_frames() nên không cần sửa mã được đo.
+    # all_threads=False: chỉ lấy mẫu các luồng đang ở trong một phần được đo.
+    def __init__(self, interval=SAMPLE_INTERVAL, all_threads=False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread = None
+        self.running = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return self
+            self.running.set()
+            self.thread = threading.Thread(target=self.run, name="telemetry-sampler", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        self.running.clear()
+        if thread is not None:
+            thread.join()
+        return self
+
+    @property
+    def active(self):
+        return self.thread is not None
+
+    def run(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            folded = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own or not (self.all_threads or ident in busy_threads):
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(frame_name(frame))
+                    frame = frame.f_back
+                folded.append(";".join(reversed(names)))
+            with self.lock:
+                self.stacks.update(folded)
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def folded(self):
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+
+
+sampler = Sampler()
+
+if os.environ.get("TELEMETRY_MEMORY") == "1" and not tracemalloc.is_tracing():
+    tracemalloc.start()
+if os.environ.get("TELEMETRY_SAMPLE") == "1":
+    sampler.start()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# Các module của dashboard nằm ở thư mục gốc của repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query
+import store
+
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    # Store dựng từ các tệp nguồn trong repo vào thư mục tạm (không đụng tới data_store/)
+    store_dir = str(tmp_path_factory.mktemp("store"))
+    store.ingest(store_dir=store_dir)
+    return query.open_dataset(store_dir)
@@ -0,0 +1,55 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+import pytest
+
+import api
+import query
+
+
+@pytest.fixture(scope="module")
+def base_url(dataset):
+    server = api.make_server(port=0, store_dir=dataset.store_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    try:
+        with urlopen(url) as response:
+            return response.status, json.load(response)
+    except HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_compare_rejects_bad_k(base_url):
+    status, body = get(f"{base_url}/compare?k=x")
+    assert status == 400
+    assert "phải là số nguyên" in body["error"]
+
+
+def test_bad_choice_is_400(base_url, dataset):
+    product = quote(query.products(dataset)[0])
+    for params in ("name=monthly&measure=Price", "name=unit_prices&basis=Volume", "name=top_companies&role=Buyer",
+                   "name=top_companies&role=Supplier&by=Purchaser_code", "name=counterparts&target=Origin"):
+        status, body = get(f"{base_url}/query?product={product}&{params}")
+        assert status == 400, params
+        assert "phải là một trong" in body["error"]
+    status, _ = get(f"{base_url}/compare?measure=Price")
+    assert status == 400
+
+
+def test_unknown_product_or_query_is_404(base_url, dataset):
+    product = quote(query.products(dataset)[0])
+    assert get(f"{base_url}/query?product={product}&name=nothing")[0] == 404
+    assert get(f"{base_url}/query?product=nothing&name=monthly")[0] == 404
+    assert get(f"{base_url}/compare?products=nothing")[0] == 404
+    status, body = get(f"{base_url}/query?product={product}&name=top_companies&role=Supplier&by=Supplier_code&k=3")
+    assert status == 200
+    assert len(body["result"]) <= 3
@@ -0,0 +1,42 @@
+import pandas as pd
+
+import entity_resolution
+
+
+def resolve_names(names):
+    pairs = pd.DataFrame({"name": names, "code": [None] * len(names), "count": [1] * len(names)})
+    resolved = entity_resolution.resolve(pairs)
+    return resolved.set_index("name")["company_id"]
+
+
+def test_person_names_not_merged():
+    # Tên người ngắn trùng họ/tên là hai người khác nhau
+    negatives = [
+        ("Nguyen Dinh Nguyen", "Nguyen Nguyen"),
+        ("Thanh Van Phan", "Van Phan"),
+        ("Le My Le", "My Le"),
+    ]
+    ids = resolve_names([name for pair in negatives for name in pair])
+    for a, b in negatives:
+        assert ids[a] != ids[b], (a, b)
+
+
+def test_permuted_company_names_not_merged():
+    negatives = [
+        ("Grand Harvest Global Inc", "Harvest Global Grand Inc"),
+        ("Alpha Ruby Union JSC", "Alpha Union Ruby Pte Ltd"),
+    ]
+    ids = resolve_names([name for pair in negatives for name in pair])
+    for a, b in negatives:
+        assert ids[a] != ids[b], (a, b)
+
+
+def test_name_variants_merged():
+    positives = [
+        ("Food Castle", "Food Castle Inc"),
+        ('Llc "Asiya Treyd"', "Llc Asiya Treyd"),
+        ("Anh Nguyen", "Nguyen Anh"),
+    ]
+    ids = resolve_names([name for pair in positives for name in pair])
+    for a, b in positives:
+        assert ids[a] == ids[b], (a, b)
@@ -0,0 +1,98 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import loader
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Máy chủ thử: /file-<i>.csv trả về nội dung kèm ETag (304 khi If-None-Match khớp),
+    # /flaky.csv trả về 503 ở lần đầu rồi 200
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("If-None-Match")))
+            hits = sum(path == self.path for path, _ in server.requests)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            # Giữ yêu cầu đủ lâu để các lần tải song song chồng lên nhau
+            time.sleep(0.05)
+            self.respond(hits)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def respond(self, hits):
+        if self.path == "/flaky.csv" and hits == 1:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = f"path,value\n{self.path},1\n".encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.active = httpd.peak = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_fetch_all_concurrent(server, tmp_path):
+    sources = {f"file-{i}": url(server, f"/file-{i}.csv") for i in range(12)}
+    paths = loader.Loader(str(tmp_path), workers=4).fetch_all(sources)
+    assert set(paths) == set(sources)
+    assert len(set(paths.values())) == len(sources)
+    for name, path in paths.items():
+        assert read(path) == f"path,value\n/{name}.csv,1\n"
+    assert sorted(path for path, _ in server.requests) == sorted(f"/{name}.csv" for name in sources)
+    assert 1 < server.peak <= 4
+
+
+def test_revalidation_served_from_cache(server, tmp_path):
+    source = url(server, "/file-0.csv")
+    first = loader.Loader(str(tmp_path)).fetch(source)
+    content = read(first)
+    # Loader mới (như một lần chạy ingest khác) chỉ dựa vào cache trên đĩa
+    second = loader.Loader(str(tmp_path)).fetch(source)
+    assert second == first
+    assert read(second) == content
+    assert server.requests == [("/file-0.csv", None), ("/file-0.csv", '"/file-0.csv"')]
+
+
+def test_retry_after_server_error(server, tmp_path):
+    path = loader.Loader(str(tmp_path)).fetch(url(server, "/flaky.csv"))
+    assert read(path) == "path,value\n/flaky.csv,1\n"
+    assert [request for request, _ in server.requests] == ["/flaky.csv", "/flaky.csv"]
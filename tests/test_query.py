@@ -0,0 +1,44 @@
+import numpy as np
+
+import query
+
+
+def baseline_totals(dataset, product, direction, column):
+    # Tổng Amount theo cột bằng groupby của pandas trên các dòng giao dịch (sum() bỏ qua NaN)
+    table = dataset.transactions
+    frame = table.frame(table.select({"Product": product, "Import/Export": direction}), [column, "Month/Year", "Amount"])
+    return frame.groupby(column, observed=True)["Amount"].sum()
+
+
+def test_company_panel_matches_groupby(dataset):
+    for product in query.products(dataset):
+        for direction in query.DIRECTIONS:
+            for role in query.ROLES:
+                panel = query.company_panel(dataset, product, direction, role)
+                if panel.empty:
+                    continue
+                # Amount thiếu không được làm cả cột thành NaN
+                assert not panel.isna().any().any()
+                expected = baseline_totals(dataset, product, direction, role)
+                totals = panel.sum().reindex(expected.index)
+                np.testing.assert_allclose(totals.to_numpy(), expected.to_numpy())
+
+
+def test_search_totals_match_groupby(dataset):
+    table = dataset.transactions
+    for product in query.products(dataset):
+        frame = table.frame(table.select({"Product": product}), ["Product Description", "Purchaser", "Supplier", "Amount"])
+        descriptions = query.search_descriptions(dataset, product, "dried")
+        expected = frame.groupby("Product Description", observed=True)["Amount"].sum()
+        assert not descriptions["Amount"].isna().any()
+        np.testing.assert_allclose(descriptions["Amount"].to_numpy(), expected[descriptions["Product Description"]].to_numpy())
+        for role in query.ROLES:
+            # Tìm lại đúng tên của doanh nghiệp có tổng lớn nhất
+            expected = frame.groupby(role, observed=True)["Amount"].sum()
+            if expected.empty:
+                continue
+            name = expected.idxmax()
+            companies = query.search_companies(dataset, product, name, role)
+            found = companies[companies[role] == name]
+            assert len(found) == 1
+            assert np.isclose(found["Amount"].iloc[0], expected[name])
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+import aggregates
+
+# Chuỗi thời gian theo tháng dạng "bảng rộng" (panel): mỗi dòng là một tháng (PeriodIndex, đủ mọi tháng
+# liên tiếp, tháng trống điền 0), mỗi cột là một chuỗi (một chiều giao dịch, một quốc gia, một doanh nghiệp...).
+# Các phép tính MoM/YoY, tổng trượt, cộng dồn chạy một lần trên cả bảng thay vì từng chuỗi một.
+
+
+def month_index(labels):
+    # Nhãn "YYYY-MM" (hoặc Period/Timestamp) thành PeriodIndex theo tháng
+    return pd.PeriodIndex(labels, freq="M")
+
+
+def fill_months(panel, fill_value=0):
+    # Bổ sung các tháng bị thiếu giữa tháng đầu và tháng cuối để phép dịch 1 dòng đúng là 1 tháng
+    if len(panel) == 0:
+        return panel
+    months = pd.period_range(panel.index.min(), panel.index.max(), freq="M")
+    return panel.reindex(months, fill_value=fill_value)
+
+
+def panel(frame, series, measure, time="Month/Year", fill_value=0):
+    # Bảng rộng từ dữ liệu dạng dài (vd. cube) trong một lần groupby: dòng là tháng, cột là giá trị của series
+    grouped = frame.groupby([time, series], observed=True)[measure].sum().unstack(fill_value=0)
+    grouped.index = month_index(grouped.index)
+    grouped.columns = list(grouped.columns)
+    return fill_months(grouped.sort_index(), fill_value)
+
+
+def code_panel(month_codes, series_codes, weights, months, series):
+    # Bảng rộng từ mã số nguyên (vd. TransactionTable): cộng bằng một lần np.bincount trên cặp (tháng, chuỗi).
+    # Chỉ giữ các chuỗi có dữ liệu nên kích thước không phụ thuộc cỡ từ điển; mã âm (thiếu) bị bỏ.
+    # Trọng số NaN (vd. thiếu Amount) được tính là 0 như sum() của pandas, không làm cả ô thành NaN.
+    valid = (month_codes >= 0) & (series_codes >= 0)
+    month_codes = month_codes[valid]
+    used, series_codes = np.unique(series_codes[valid], return_inverse=True)
+    used_months, month_codes = np.unique(month_codes, return_inverse=True)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)[valid]
+        weights = np.where(np.isnan(weights), 0.0, weights)
+    values = np.bincount(
+        month_codes * len(used) + series_codes,
+        weights=weights,
+        minlength=len(used_months) * len(used),
+    ).reshape(len(used_months), len(used))
+    result = pd.DataFrame(values, index=month_index(months[used_months]), columns=list(series[used]))
+    return fill_months(result.sort_index())
+
+
+def change(panel, periods=1):
+    # Tỷ lệ thay đổi (%) so với periods tháng trước cho mọi cột cùng lúc; chia cho 0 thành NaN thay vì inf
+    result = (panel / panel.shift(periods) - 1) * 100
+    return result.replace([np.inf, -np.inf], np.nan)
+
+
+def ring_ratio(panel):
+    # Tỷ lệ thay đổi so với tháng trước (MoM, %), làm tròn 1 chữ số
+    return change(panel, 1).round(1)
+
+
+def year_over_year(panel):
+    # Tỷ lệ thay đổi so với cùng tháng năm trước (%), làm tròn 1 chữ số
+    return change(panel, 12).round(1)
+
+
+def rolling_sum(panel, window=3):
+    # Tổng trượt window tháng; các tháng đầu cộng trên số tháng hiện có
+    return panel.rolling(window, min_periods=1).sum()
+
+
+def cumulative(panel):
+    # Tổng cộng dồn từ tháng đầu
+    return panel.cumsum()
+
+
+def growth(panel, window=3, min_base=0):
+    # Tổng window tháng gần nhất so với window tháng liền trước, cho mọi cột trong một phép tính numpy.
+    # Chuỗi có tổng kỳ trước không vượt quá min_base không có tỷ lệ tăng trưởng (NaN).
+    values = panel.to_numpy(dtype=np.float64)
+    recent = values[-window:].sum(axis=0)
+    previous = values[-2 * window:-window].sum(axis=0) if len(values) > window else np.zeros(values.shape[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(previous > min_base, (recent / previous - 1) * 100, np.nan)
+    return pd.DataFrame({"Previous": previous, "Recent": recent, "Growth (%)": rate}, index=panel.columns)
+
+
+def top_growth(panel, k=10, window=3, min_base=0, name="Series"):
+    # k chuỗi tăng trưởng nhanh nhất (bỏ các chuỗi không tính được tỷ lệ)
+    result = growth(panel, window, min_base)
+    result = result[result["Growth (%)"].notna()]
+    result = result.iloc[aggregates.top_positions(result["Growth (%)"].to_numpy(), k)]
+    result["Growth (%)"] = result["Growth (%)"].round(1)
+    return result.rename_axis(name).reset_index()
@@ -0,0 +1,266 @@
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import search
+import store
+
+# Cột văn bản dài, ít dùng khi phân tích (mô tả hàng, tên gốc chưa chuẩn hoá): chỉ giữ mã trong
+# bảng phụ, không đưa vào khung dữ liệu nóng trừ khi được yêu cầu
+SIDE_COLUMNS = ["Product Description", "Purchaser_raw", "Supplier_raw"]
+
+# Kiểu của các cột số trong bảng nóng (xem store.COLUMN_TYPES)
+VALUE_TYPES = {
+    "Weight": np.float32,
+    "Quantity": np.float32,
+    "Amount": np.float64,
+    "HS Code": np.float64,
+    "HS Code_raw": np.float64,
+}
+
+
+def code_dtype(size):
+    # Kiểu số nguyên nhỏ nhất chứa được mã 0..size-1 và -1 cho giá trị thiếu
+    for dtype in (np.int8, np.int16, np.int32):
+        if size <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def columns_dir(version, store_dir=store.STORE_DIR):
+    # Thư mục ảnh chụp dạng cột (mỗi cột một tệp .npy) cho một phiên bản dữ liệu
+    return os.path.join(store_dir, f"columns-{version}")
+
+
+def iter_batches(path):
+    # Đọc tuần tự các lô của một tệp Arrow IPC stream qua memory-map
+    yield from pa.ipc.open_stream(pa.memory_map(path))
+
+
+def scan_parts(paths):
+    # Lượt 1: kiểu của từng cột và từ điển hợp nhất (đã sắp xếp) của các cột dictionary.
+    # Trong một tệp, từ điển của lô sau chứa từ điển của lô trước (delta) nên chỉ cần lô cuối.
+    # Cột phụ được ghi dạng chuỗi thường (store.TRADE_TEXT_COLUMNS) lấy từ điển từ các giá trị khác nhau của mọi lô.
+    types = {}
+    categories = {}
+    texts = {}
+    for path in paths:
+        last = {}
+        for batch in iter_batches(path):
+            for field, array in zip(batch.schema, batch.columns):
+                types.setdefault(field.name, field.type)
+                if pa.types.is_dictionary(field.type):
+                    last[field.name] = array.dictionary
+                elif field.name in SIDE_COLUMNS:
+                    texts.setdefault(field.name, set()).update(array.unique().drop_null().to_pylist())
+        for name, dictionary in last.items():
+            values = pd.Index(dictionary.to_pandas())
+            categories[name] = values if name not in categories else categories[name].union(values)
+    for name, values in texts.items():
+        values = pd.Index(list(values), dtype=object)
+        categories[name] = values if name not in categories else categories[name].union(values)
+    for name in SIDE_COLUMNS:
+        if name in types and name not in categories:
+            categories[name] = pd.Index([])
+    return types, {name: values.sort_values() for name, values in categories.items()}
+
+
+def build_columns(store_dir=store.STORE_DIR):
+    # Ghi bảng giao dịch thành các mảng .npy (mã categorical, cột số) để mọi tiến trình mở chung
+    # bằng memory-map. Đọc và ghi theo từng lô nên bộ nhớ không phụ thuộc kích thước bảng.
+    # Chỉ xây một lần cho mỗi phiên bản dữ liệu.
+    manifest = store.read_manifest(store_dir)
+    target = columns_dir(manifest["version"], store_dir)
+    if os.path.exists(os.path.join(target, "meta.pkl")):
+        return target
+    paths = [os.path.join(store_dir, part) for part in store.table_parts("trade", manifest)]
+    types, categories = scan_parts(paths)
+    rows = manifest["tables"]["trade"]["rows"]
+
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    arrays = {}
+    for i, (name, arrow_type) in enumerate(types.items()):
+        if name in categories:
+            dtype = code_dtype(len(categories[name]))
+        else:
+            dtype = VALUE_TYPES.get(name) or arrow_type.to_pandas_dtype()
+        arrays[name] = np.lib.format.open_memmap(os.path.join(tmp_path, f"{i:03d}.npy"), mode="w+", dtype=dtype, shape=(rows,))
+
+    # Lượt 2: chép từng lô vào đúng vị trí, đổi mã dictionary của từng tệp sang mã của từ điển hợp nhất
+    position = 0
+    for path in paths:
+        mappings = {}
+        for batch in iter_batches(path):
+            end = position + batch.num_rows
+            for name, array in arrays.items():
+                index = batch.schema.get_field_index(name)
+                if index < 0:
+                    # Cột không có trong tệp này (vd. lô append từ CSV thiếu cột)
+                    array[position:end] = -1 if name in categories else np.nan
+                    continue
+                column = batch.column(index)
+                if name not in categories:
+                    array[position:end] = column.to_numpy(zero_copy_only=False)
+                    continue
+                if not pa.types.is_dictionary(column.type):
+                    # Cột chuỗi thường: tra mã trực tiếp trong từ điển hợp nhất (null thành -1)
+                    array[position:end] = categories[name].get_indexer(column.to_numpy(zero_copy_only=False))
+                    continue
+                mapping = mappings.get(name, np.empty(0, dtype=np.int64))
+                if len(mapping) < len(column.dictionary):
+                    added = column.dictionary.slice(len(mapping)).to_pandas()
+                    mapping = np.concatenate([mapping, categories[name].get_indexer(added)])
+                    mappings[name] = mapping
+                codes = np.append(mapping, -1)[column.indices.fill_null(-1).to_numpy()]
+                array[position:end] = codes
+            position = end
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    with open(os.path.join(tmp_path, "meta.pkl"), "wb") as f:
+        pickle.dump({"rows": rows, "columns": list(types), "categories": categories}, f)
+    # Chỉ mục tìm kiếm trên từ điển hợp nhất, xây một lần cùng ảnh chụp
+    search.SearchIndex.build(categories).save(os.path.join(tmp_path, "search.pkl"))
+
+    try:
+        os.replace(tmp_path, target)
+    except OSError:
+        # Tiến trình khác đã xây xong cùng phiên bản
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    # Bỏ ảnh chụp của các phiên bản cũ; tiến trình đang memory-map tệp cũ vẫn đọc được tới khi đóng
+    for entry in os.listdir(store_dir):
+        path = os.path.join(store_dir, entry)
+        if entry.startswith("columns-") and path != target and not entry.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+    return target
+
+
+class TransactionTable:
+    # Bảng giao dịch dạng gọn: mỗi cột categorical là một mảng mã số nguyên nhỏ nhất đủ dùng cùng
+    # một từ điển dùng chung, cột số được ép kiểu (float32 cho Weight/Quantity).
+    # Bộ lọc trả về mảng chỉ số dòng thay vì sao chép DataFrame; chỉ khi cần hiển thị mới dựng
+    # DataFrame cho đúng các dòng và cột đó.
+    # Mọi mảng đều chỉ đọc để một bảng có thể dùng chung giữa các phiên; khi mở bằng open()
+    # các mảng là memory-map nên mọi tiến trình trên máy đọc chung các trang bộ nhớ.
+    def __init__(self, rows, columns, codes, categories, values, search_index=None):
+        self.rows = rows
+        self.columns = list(columns)
+        self.codes = codes
+        self.categories = categories
+        self.values = values
+        self.search_index = search_index
+        for array in list(codes.values()) + list(values.values()):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_frame(cls, data):
+        codes = {}
+        categories = {}
+        values = {}
+        for column in data.columns:
+            series = data[column]
+            if isinstance(series.dtype, pd.CategoricalDtype) or column in SIDE_COLUMNS:
+                series = series.astype("category")
+                categories[column] = series.cat.categories
+                codes[column] = series.cat.codes.to_numpy().astype(code_dtype(len(categories[column])))
+            else:
+                values[column] = series.to_numpy(dtype=VALUE_TYPES.get(column), copy=True)
+        return cls(len(data), data.columns, codes, categories, values)
+
+    @classmethod
+    def load(cls, path):
+        # Mở ảnh chụp dạng cột bằng memory-map chỉ đọc (không tải dữ liệu vào bộ nhớ riêng của tiến trình)
+        with open(os.path.join(path, "meta.pkl"), "rb") as f:
+            meta = pickle.load(f)
+        codes = {}
+        values = {}
+        for i, name in enumerate(meta["columns"]):
+            array = np.load(os.path.join(path, f"{i:03d}.npy"), mmap_mode="r")
+            if name in meta["categories"]:
+                codes[name] = array
+            else:
+                values[name] = array
+        search_path = os.path.join(path, "search.pkl")
+        search_index = search.SearchIndex.load(search_path) if os.path.exists(search_path) else None
+        return cls(meta["rows"], meta["columns"], codes, meta["categories"], values, search_index)
+
+    @classmethod
+    def open(cls, store_dir=store.STORE_DIR):
+        return cls.load(build_columns(store_dir))
+
+    def code(self, column, value):
+        # Mã của một giá trị trong từ điển của cột, -2 nếu không có (không khớp dòng nào, kể cả dòng thiếu)
+        position = self.categories[column].get_indexer([value])[0]
+        return position if position >= 0 else -2
+
+    def mask(self, filters, rows=None):
+        # filters: {cột: giá trị hoặc danh sách giá trị}; so sánh trên mã số nguyên, không so chuỗi
+        codes_mask = None
+        for column, value in filters.items():
+            if value is None:
+                continue
+            codes = self.codes[column] if rows is None else self.codes[column][rows]
+            if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+                match = np.isin(codes, self.categories[column].get_indexer(list(value)))
+                match &= codes >= 0
+            else:
+                match = codes == self.code(column, value)
+            codes_mask = match if codes_mask is None else codes_mask & match
+        if codes_mask is None:
+            codes_mask = np.ones(self.rows if rows is None else len(rows), dtype=bool)
+        return codes_mask
+
+    def select(self, filters, rows=None):
+        # Chỉ số các dòng thoả bộ lọc; có thể lọc tiếp trong một tập dòng đã chọn (rows)
+        positions = np.flatnonzero(self.mask(filters, rows))
+        return positions if rows is None else np.asarray(rows)[positions]
+
+    @property
+    def search(self):
+        # Chỉ mục tìm kiếm toàn văn; bảng dựng từ DataFrame (hoặc ảnh chụp cũ) xây khi cần lần đầu
+        if self.search_index is None:
+            self.search_index = search.SearchIndex.build(self.categories)
+        return self.search_index
+
+    def match(self, column, text, rows=None):
+        # Chỉ số các dòng có giá trị cột chứa các từ khoá trong text (xem search.TextIndex.match):
+        # tìm mã trên chỉ mục rồi so sánh mã số nguyên, không so chuỗi trên từng dòng
+        codes = self.search[column].match(text)
+        if codes is None:
+            return np.arange(self.rows) if rows is None else np.asarray(rows)
+        # Bảng tra theo mã (phần tử cuối cho mã -1 của giá trị thiếu) thay vì np.isin
+        hit = np.zeros(len(self.categories[column]) + 1, dtype=bool)
+        hit[codes] = True
+        column_codes = self.codes[column] if rows is None else self.codes[column][rows]
+        positions = np.flatnonzero(hit[column_codes])
+        return positions if rows is None else np.asarray(rows)[positions]
+
+    def column(self, column, rows=None):
+        # Giá trị một cột cho các dòng được chọn (None = mọi dòng, trả về mảng gốc không sao chép)
+        if column in self.codes:
+            codes = self.codes[column] if rows is None else self.codes[column][rows]
+            return pd.Categorical.from_codes(codes, categories=self.categories[column])
+        return self.values[column] if rows is None else self.values[column][rows]
+
+    def frame(self, rows=None, columns=None):
+        # DataFrame cho các dòng/cột được chọn; mặc định bỏ các cột văn bản ở bảng phụ
+        if columns is None:
+            columns = [column for column in self.columns if column not in SIDE_COLUMNS]
+        index = pd.RangeIndex(self.rows) if rows is None else pd.Index(rows)
+        return pd.DataFrame({column: self.column(column, rows) for column in columns}, index=index)
+
+    def side(self, column, rows):
+        # Tra văn bản ở bảng phụ (vd. Product Description) cho một số dòng
+        return self.categories[column].take(self.codes[column][rows]).where(self.codes[column][rows] >= 0)
+
+    def memory_usage(self):
+        # Số byte của các mảng mã, từ điển và cột số
+        total = sum(codes.nbytes for codes in self.codes.values())
+        total += sum(values.nbytes for values in self.values.values())
+        total += sum(categories.memory_usage(deep=True) for categories in self.categories.values())
+        return total
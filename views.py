@@ -0,0 +1,72 @@
+import os
+import pickle
+import shutil
+import threading
+
+import store
+
+# Kết quả tính sẵn của các truy vấn dashboard (xem precompute.py), một thư mục cho mỗi phiên bản dữ liệu:
+# views-<phiên bản>/index.pkl (sản phẩm -> tệp) và mỗi sản phẩm một tệp pickle {khoá truy vấn: kết quả}.
+
+
+def views_dir(version, store_dir=store.STORE_DIR):
+    return os.path.join(store_dir, f"views-{version}")
+
+
+def view_key(name, product, params):
+    # Khoá của một truy vấn có tên; params đã gộp tham số mặc định để cách gọi khác nhau cho cùng một khoá
+    return (name, product, tuple(sorted(params.items())))
+
+
+def write_product(path, position, product_views):
+    # Ghi các kết quả của một sản phẩm, trả về tên tệp
+    name = f"{position:04d}.pkl"
+    with open(os.path.join(path, name), "wb") as f:
+        pickle.dump(product_views, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return name
+
+
+def publish(tmp_path, version, files, store_dir=store.STORE_DIR):
+    # Ghi chỉ mục sau cùng rồi đổi tên thư mục nguyên tử; bỏ kết quả của các phiên bản cũ
+    with open(os.path.join(tmp_path, "index.pkl"), "wb") as f:
+        pickle.dump({"version": version, "products": files}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    target = views_dir(version, store_dir)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_path, target)
+    for entry in os.listdir(store_dir):
+        path = os.path.join(store_dir, entry)
+        if entry.startswith("views-") and path != target and not entry.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+    return target
+
+
+class ViewStore:
+    # Đọc kết quả tính sẵn; tệp của một sản phẩm chỉ được tải khi có truy vấn đầu tiên cho sản phẩm đó
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            self.files = pickle.load(f)["products"]
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, version, store_dir=store.STORE_DIR):
+        # None nếu chưa chạy precompute cho phiên bản này
+        path = views_dir(version, store_dir)
+        if not os.path.exists(os.path.join(path, "index.pkl")):
+            return None
+        return cls(path)
+
+    def product(self, product):
+        with self.lock:
+            if product not in self.loaded:
+                name = self.files.get(product)
+                if name is None:
+                    self.loaded[product] = {}
+                else:
+                    with open(os.path.join(self.path, name), "rb") as f:
+                        self.loaded[product] = pickle.load(f)
+            return self.loaded[product]
+
+    def get(self, key, default=None):
+        return self.product(key[1]).get(key, default)